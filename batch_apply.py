@@ -0,0 +1,309 @@
+"""
+差异批量应用引擎
+
+把差异句柄 (见 merge_engine.iter_diffs) 的新内容写回原文件：
+0. 先写出日志 (journal.json，状态 preparing)，列出将要创建的临时文件；
+1. 线程池并行检查原文件自合并以来是否被改动、把新内容写入同目录的临时文件并 fsync、
+   为原文件创建备份 (优先硬链接，不支持时复制)；
+2. 更新日志 (状态 prepared) 并 fsync，记录每个文件的临时文件和备份位置；
+3. 并行用 os.replace 原子替换原文件，最后对涉及的目录统一 fsync 一次。
+
+进程在第 1 步中途退出时，resume / rollback 都只清理日志中列出的临时文件；
+在第 3 步中途退出时，可根据日志继续完成 (resume) 或全部撤销 (rollback)；
+成功完成的批次同样保留备份，可以整体撤销。日志记录了每个文件写回后的指纹，
+撤销前会检查原文件在写回之后是否又被修改，有修改时默认拒绝撤销，避免覆盖这些修改。
+"""
+import os
+import json
+import shutil
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import merge_engine
+import merge_index
+
+JOURNAL_DIR = "apply_journals"
+JOURNAL_FILE = "journal.json"
+JOURNAL_VERSION = 1
+
+# 日志状态
+STATUS_PREPARING = "preparing"  # 正在写临时文件，原文件均未替换
+STATUS_PREPARED = "prepared"  # 临时文件和备份已就绪，替换可能未完成
+STATUS_COMMITTED = "committed"
+STATUS_ROLLED_BACK = "rolled_back"
+# 可以继续或撤销的未完成状态
+UNFINISHED_STATUSES = (STATUS_PREPARING, STATUS_PREPARED)
+
+
+def journal_root_for(config_path=merge_engine.CONFIG_FILE):
+    """日志目录与 config.json 放在同一目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), JOURNAL_DIR)
+
+
+def _fsync_dir(path):
+    # Windows 不支持对目录 fsync
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _save_journal(journal_path, journal):
+    tmp_path = journal_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(journal, f, indent=1, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, journal_path)
+
+
+def load_journal(journal_path):
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_journals(journal_root):
+    """按时间顺序列出所有日志文件"""
+    if not os.path.isdir(journal_root):
+        return []
+    names = sorted(os.listdir(journal_root))
+    paths = [os.path.join(journal_root, name, JOURNAL_FILE) for name in names]
+    return [p for p in paths if os.path.exists(p)]
+
+
+def latest_journal(journal_root, status=None):
+    """
+    返回最近一次 (可按状态过滤，status 可以是一个状态或状态元组) 的日志路径，没有时返回 None
+
+    没有任何条目的日志 (旧版本在全部冲突或失败时留下的) 被跳过。
+    """
+    statuses = (status,) if isinstance(status, str) else status
+    for journal_path in reversed(list_journals(journal_root)):
+        journal = load_journal(journal_path)
+        if not journal.get("entries"):
+            continue
+        if statuses is None or journal.get("status") in statuses:
+            return journal_path
+    return None
+
+
+def _tmp_path_for(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.transmit-tmp")
+
+
+def _prepare(item, seq, backup_dir, expected):
+    """检查冲突、写临时文件、创建备份；返回日志条目，冲突时返回 None"""
+    path = item['path']
+    if expected is not None and merge_index.source_changed(path, expected):
+        return None
+
+    name = os.path.basename(path)
+    tmp_path = _tmp_path_for(path)
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for chunk in merge_engine.iter_new_content(item):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.copymode(path, tmp_path)
+        st = os.stat(tmp_path)
+        # 写回后的指纹，撤销前据此判断原文件是否又被修改 (os.replace 保留临时文件的 mtime)
+        applied = [st.st_size, st.st_mtime_ns, merge_engine._hash_file(tmp_path)]
+
+        backup_path = os.path.join(backup_dir, f"{seq:06d}_{name}")
+        try:
+            # 原文件随后被 os.replace 替换，硬链接会保留旧内容，无需复制
+            os.link(path, backup_path)
+        except OSError:
+            shutil.copy2(path, backup_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {"path": path, "tmp": tmp_path, "backup": backup_path, "applied": applied}
+
+
+def _commit_entry(entry):
+    if os.path.exists(entry["tmp"]):
+        os.replace(entry["tmp"], entry["path"])
+
+
+def apply_batch(items, workers=merge_engine.DEFAULT_MERGE_SETTINGS["apply_workers"], journal_root=None,
+                check_mtime=True):
+    """
+    批量应用差异句柄
+
+    check_mtime 为 True 时，原文件的大小或 mtime 与合并索引记录的不同 (合并之后被改动过)
+    则拒绝覆盖；没有索引的旧合并文件无法检查。
+    返回 {"applied": [path], "conflicts": [path], "failed": [(path, error)], "journal_path"}；
+    没有任何文件需要替换 (全部冲突或失败) 时不保留日志，journal_path 为 None。
+    """
+    if journal_root is None:
+        journal_root = journal_root_for()
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    journal_dir = os.path.join(journal_root, f"apply_{timestamp}")
+    backup_dir = os.path.join(journal_dir, "backup")
+    os.makedirs(backup_dir)
+    journal_path = os.path.join(journal_dir, JOURNAL_FILE)
+
+    indexes = {}
+
+    def expected_for(item):
+        if not check_mtime:
+            return None
+        merged_path = item['merged_path']
+        if merged_path not in indexes:
+            indexes[merged_path] = merge_index.load_index(merged_path)
+            if indexes[merged_path] is None:
+                logging.warning(f"合并文件没有索引，无法检查原文件是否在合并后被修改: {merged_path}")
+        index = indexes[merged_path]
+        return index["files"].get(item['path']) if index else None
+
+    result = {"applied": [], "conflicts": [], "failed": [], "journal_path": journal_path}
+    # 0. 临时文件创建之前先把它们记入日志，进程在准备阶段退出时也能找到并清理
+    journal = {
+        "version": JOURNAL_VERSION,
+        "created": timestamp,
+        "status": STATUS_PREPARING,
+        "entries": [{"path": item['path'], "tmp": _tmp_path_for(item['path'])} for item in items]
+    }
+    _save_journal(journal_path, journal)
+
+    entries = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="apply") as executor:
+        # 1. 并行准备临时文件与备份
+        futures = [
+            (item, executor.submit(_prepare, item, seq, backup_dir, expected_for(item)))
+            for seq, item in enumerate(items)
+        ]
+        for item, future in futures:
+            try:
+                entry = future.result()
+            except Exception as e:
+                logging.error(f"准备写入失败 {item['path']}: {e}")
+                result["failed"].append((item['path'], str(e)))
+                continue
+            if entry is None:
+                logging.warning(f"原文件在合并后已被修改，拒绝覆盖: {item['path']}")
+                result["conflicts"].append(item['path'])
+            else:
+                entries.append(entry)
+
+        if not entries:
+            # 没有可撤销的内容，不留下空日志遮住上一次真正的写回
+            shutil.rmtree(journal_dir, ignore_errors=True)
+            result["journal_path"] = None
+            return result
+
+        # 2. 日志落盘后才开始替换原文件
+        journal["status"] = STATUS_PREPARED
+        journal["entries"] = entries
+        _save_journal(journal_path, journal)
+
+        # 3. 并行原子替换
+        commit_failed = False
+        for entry, future in [(entry, executor.submit(_commit_entry, entry)) for entry in entries]:
+            try:
+                future.result()
+                result["applied"].append(entry["path"])
+            except Exception as e:
+                logging.error(f"替换原文件失败 {entry['path']}: {e}")
+                result["failed"].append((entry["path"], str(e)))
+                commit_failed = True
+
+    for directory in {os.path.dirname(entry["path"]) for entry in entries}:
+        try:
+            _fsync_dir(directory)
+        except OSError as e:
+            logging.warning(f"目录 fsync 失败 {directory}: {e}")
+
+    # 有文件替换失败时保留 prepared 状态，以便之后继续或撤销
+    if not commit_failed:
+        journal["status"] = STATUS_COMMITTED
+        _save_journal(journal_path, journal)
+    return result
+
+
+def resume(journal_path):
+    """
+    继续完成中断的批次：替换所有仍然存在的临时文件，返回 (成功数, 失败数)
+
+    在准备阶段中断的批次没有可用的临时文件，只清理残留的临时文件 (同 rollback)。
+    """
+    journal = load_journal(journal_path)
+    if journal["status"] == STATUS_PREPARING:
+        logging.warning(f"批次在准备阶段中断，原文件均未替换，只清理临时文件: {journal_path}")
+        return rollback(journal_path)
+    success = 0
+    failed = 0
+    for entry in journal["entries"]:
+        try:
+            _commit_entry(entry)
+            success += 1
+        except Exception as e:
+            logging.error(f"继续应用失败 {entry['path']}: {e}")
+            failed += 1
+    if failed == 0:
+        journal["status"] = STATUS_COMMITTED
+        _save_journal(journal_path, journal)
+    return success, failed
+
+
+def _modified_since_apply(entry):
+    """已写回的文件在写回之后是否又被修改或删除；旧日志没有指纹时无法检查"""
+    applied = entry.get("applied")
+    if applied is None:
+        return False
+    try:
+        st = os.stat(entry["path"])
+    except OSError:
+        return True
+    if st.st_size != applied[0]:
+        return True
+    if st.st_mtime_ns == applied[1]:
+        return False
+    return merge_engine._hash_file(entry["path"]) != applied[2]
+
+
+def modified_since_apply(journal_path):
+    """返回批次中写回之后又被修改过的文件路径列表"""
+    return [
+        entry["path"] for entry in load_journal(journal_path)["entries"]
+        if not os.path.exists(entry["tmp"]) and entry.get("backup") and os.path.exists(entry["backup"])
+        and _modified_since_apply(entry)
+    ]
+
+
+def rollback(journal_path, force=False):
+    """
+    撤销一个批次：丢弃未替换的临时文件，从备份恢复已替换的原文件，返回 (成功数, 失败数)
+
+    有文件在写回之后又被修改时抛出 ValueError 且不做任何改动，force=True 时仍然恢复。
+    """
+    if not force:
+        modified = modified_since_apply(journal_path)
+        if modified:
+            raise ValueError(f"{len(modified)} 个文件在写回后又被修改，拒绝撤销: " + ", ".join(modified))
+    journal = load_journal(journal_path)
+    success = 0
+    failed = 0
+    for entry in journal["entries"]:
+        try:
+            if os.path.exists(entry["tmp"]):
+                # 临时文件还在说明原文件从未被替换，无需恢复
+                os.remove(entry["tmp"])
+            elif entry.get("backup") and os.path.exists(entry["backup"]):
+                os.replace(entry["backup"], entry["path"])
+            success += 1
+        except Exception as e:
+            logging.error(f"撤销失败 {entry['path']}: {e}")
+            failed += 1
+    if failed == 0:
+        journal["status"] = STATUS_ROLLED_BACK
+        _save_journal(journal_path, journal)
+    return success, failed
@@ -0,0 +1,104 @@
+"""
+内容搜索
+
+在扫描得到的文件集合中查找包含某个字符串或正则的文件，统计每个文件的匹配次数。
+文件通过 mmap 按字节查找，不解码、不整读进内存；不区分大小写或使用正则时编译成 bytes 正则。
+文件分批交给进程池并行查找，结果按批流式返回；只需判断是否匹配 (max_count=1) 时
+每个文件找到第一处就停止。结果可作为合并前的筛选条件。
+"""
+import os
+import re
+import mmap
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_BATCH_SIZE = 32
+
+
+def compile_pattern(pattern, regex=False, ignore_case=False):
+    """
+    返回匹配器 (字面量 bytes, bytes 正则)，两者只有一个不为 None
+
+    pattern 按 UTF-8 编码后匹配；正则语法错误或 pattern 为空时抛出 ValueError。
+    """
+    if not pattern:
+        raise ValueError("搜索内容不能为空")
+    data = pattern.encode('utf-8')
+    if not regex and not ignore_case:
+        return data, None
+    try:
+        return None, re.compile(data if regex else re.escape(data), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    except re.error as e:
+        raise ValueError(f"正则表达式有误: {e}") from e
+
+
+def count_matches(fpath, matcher, max_count=None):
+    """统计文件中的匹配次数，达到 max_count 后停止；读取失败时抛出 OSError"""
+    literal, regex = matcher
+    with open(fpath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            count = 0
+            if literal is not None:
+                pos = mm.find(literal)
+                while pos != -1:
+                    count += 1
+                    if max_count and count >= max_count:
+                        break
+                    pos = mm.find(literal, pos + len(literal))
+            else:
+                for _ in regex.finditer(mm):
+                    count += 1
+                    if max_count and count >= max_count:
+                        break
+            return count
+
+
+def _grep_batch(matcher, max_count, paths):
+    """在子进程中查找一批文件，只返回有匹配的 [(path, 次数)]"""
+    results = []
+    for fpath in paths:
+        try:
+            count = count_matches(fpath, matcher, max_count)
+        except (OSError, ValueError) as e:
+            logging.error(f"无法搜索文件 {fpath}: {e}")
+            continue
+        if count:
+            results.append((fpath, count))
+    return results
+
+
+def iter_grep(file_paths, pattern, regex=False, ignore_case=False, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+              max_count=None, stop_event=None):
+    """
+    按路径顺序逐个产出包含匹配的文件 (path, 匹配次数)
+
+    workers 为 None 时等于 CPU 核数，只有一批文件或 workers == 1 时在当前进程中查找。
+    stop_event 被设置后不再产出，尚未开始的批次被取消。
+    """
+    matcher = compile_pattern(pattern, regex, ignore_case)
+    paths = sorted(file_paths)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    if workers == 1 or len(batches) < 2:
+        for batch in batches:
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield from _grep_batch(matcher, max_count, batch)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_grep_batch, matcher, max_count, batch) for batch in batches]
+        for future in futures:
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield from future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def filter_files(file_paths, pattern, regex=False, ignore_case=False, workers=None, stop_event=None):
+    """返回包含匹配的文件集合，每个文件找到第一处即停止"""
+    return {fpath for fpath, _ in iter_grep(file_paths, pattern, regex, ignore_case, workers,
+                                            max_count=1, stop_event=stop_event)}
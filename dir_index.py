@@ -0,0 +1,155 @@
+"""
+持久化目录索引
+
+把目录列表 (文件名与类型) 保存在 config.json 旁的 SQLite 数据库中，以目录路径和目录的
+mtime_ns 为键。目录中增删、重命名条目都会改变目录自身的 mtime，因此 mtime 未变时
+可以直接使用保存的列表，只需一次 stat，不再 os.scandir 重新列出。
+
+注意：目录 mtime 不反映子项内容的修改，索引里也只保存名称与类型，不保存文件大小或时间。
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+INDEX_FILE = "dir_index.sqlite3"
+INDEX_VERSION = 1
+
+# 刚修改过的目录可能在同一时间戳内再次变化，暂不写入索引
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+# 累计多少次写入后提交一次事务
+COMMIT_EVERY = 256
+
+# 条目类型标志位
+_IS_DIR = 1
+_IS_FILE = 2
+_IS_SYMLINK = 4
+
+
+def index_path_for(config_path):
+    """目录索引与 config.json 放在同一目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), INDEX_FILE)
+
+
+class CachedEntry:
+    """从索引中恢复的目录条目，提供与 os.DirEntry 相同的常用接口"""
+
+    __slots__ = ("name", "path", "_flags")
+
+    def __init__(self, directory, name, flags):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._flags = flags
+
+    def is_dir(self, follow_symlinks=True):
+        if not follow_symlinks and self._flags & _IS_SYMLINK:
+            return False
+        return bool(self._flags & _IS_DIR)
+
+    def is_file(self, follow_symlinks=True):
+        if not follow_symlinks and self._flags & _IS_SYMLINK:
+            return False
+        return bool(self._flags & _IS_FILE)
+
+    def is_symlink(self):
+        return bool(self._flags & _IS_SYMLINK)
+
+    def __repr__(self):
+        return f"<CachedEntry '{self.name}'>"
+
+
+def _flags_of(entry):
+    flags = 0
+    try:
+        if entry.is_dir():
+            flags |= _IS_DIR
+        elif entry.is_file():
+            flags |= _IS_FILE
+        if entry.is_symlink():
+            flags |= _IS_SYMLINK
+    except OSError:
+        pass
+    return flags
+
+
+class DirIndex:
+    """线程安全的目录索引，多个扫描线程可共用一个实例"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != INDEX_VERSION:
+                self.conn.execute("DROP TABLE IF EXISTS dirs")
+                self.conn.execute(f"PRAGMA user_version={INDEX_VERSION}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, names TEXT, flags BLOB)"
+            )
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+
+    def scandir(self, path):
+        """
+        返回目录条目列表
+
+        目录 mtime 与索引一致时返回 CachedEntry 列表，否则调用 os.scandir 并更新索引。
+        读取目录失败时抛出 OSError，与 os.scandir 一致。
+        """
+        st = os.stat(path)
+        with self.lock:
+            row = self.conn.execute("SELECT mtime_ns, names, flags FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_mtime_ns:
+            self.hits += 1
+            names = row[1].split("\0") if row[1] else []
+            return [CachedEntry(path, name, flags) for name, flags in zip(names, row[2])]
+
+        self.misses += 1
+        with os.scandir(path) as it:
+            entries = list(it)
+        if time.time_ns() - st.st_mtime_ns >= RACY_WINDOW_NS:
+            names = "\0".join(entry.name for entry in entries)
+            flags = bytes(_flags_of(entry) for entry in entries)
+            with self.lock:
+                self.conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+                                  (path, st.st_mtime_ns, names, flags))
+                self.pending += 1
+                if self.pending >= COMMIT_EVERY:
+                    self._commit()
+        return entries
+
+    def _commit(self):
+        try:
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"目录索引写入失败 {self.db_path}: {e}")
+        self.pending = 0
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                self._commit()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+
+def open_index(config_path):
+    """打开 config.json 旁的目录索引，无法打开时返回 None (退回直接 os.scandir)"""
+    db_path = index_path_for(config_path)
+    try:
+        return DirIndex(db_path)
+    except sqlite3.Error as e:
+        logging.warning(f"无法打开目录索引 {db_path}: {e}")
+        return None
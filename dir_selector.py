@@ -1,12 +1,39 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
+import time
+import atexit
+import concurrent.futures
 import logging
 from pathlib import Path
-import datetime
 import threading
-
-import json
+from collections import OrderedDict
+
+import batch_apply
+import content_grep
+import dir_index
+import fs_scan
+import listing_cache
+import merge_engine
+import name_index
+import selection_store
+import watch
+from merge_engine import CONFIG_FILE
+
+# 差异对话框中缓存最近查看过的差异数
+DIFF_CACHE_SIZE = 16
+# 配置变化停止多少毫秒后再写出 config.json
+CONFIG_SAVE_DELAY_MS = 500
+# 级联勾选、填充目录树时每个空闲时间片最多占用的秒数
+CASCADE_SLICE_SECONDS = 0.015
+POPULATE_SLICE_SECONDS = 0.015
+# 后台检查子目录是否有内容 (决定是否显示展开箭头) 的线程数与缓存上限
+PROBE_WORKERS = 8
+PROBE_CACHE_SIZE = 100000
+# 搜索框停止输入多少毫秒后执行搜索
+SEARCH_DELAY_MS = 150
+# 磁盘搜索最多显示的结果数
+FS_SEARCH_LIMIT = 5000
 
 # 配置日志
 logging.basicConfig(
@@ -15,8 +42,6 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
-CONFIG_FILE = "config.json"
-
 class DirectorySelectorApp:
     def __init__(self, root):
         self.root = root
@@ -25,9 +50,36 @@ class DirectorySelectorApp:
         
         # 存储状态: {item_id: {'path': path, 'is_dir': bool, 'selected': bool, 'recursive': bool}}
         self.node_states = {}
+        # 已加载节点的父子索引 {item_id: [child_id]}，级联时无需向 Treeview 查询
+        self.node_children = {}
+        # 级联勾选中尚未刷新到 Treeview 的节点 (按插入顺序)
+        self._cascade_pending = {}
+        self._cascade_job = None
+        # 分批填充目录：正在填充的 {parent: job}，超出页大小等待“显示更多”的 {parent: job}
+        self._populating = {}
+        self._paged = {}
+        self._more_nodes = {}  # {占位节点: parent}
+        self._jobs = {}  # 所有已加载目录的填充任务 {parent: job}
+        self._populate_job = None
+        # 跳转：序号递增，进行中的跳转发现序号变化即放弃
+        self._jump_seq = 0
+        self._jump_node = None
+        # 子目录是否有内容的缓存 {path: (mtime_ns, bool)}
+        self.probe_cache = {}
+
+        # 配置写出：save_config 只标记变化，防抖后由后台线程写出
+        self.config_writer = merge_engine.ConfigWriter(CONFIG_FILE)
+        self._save_job = None
+        atexit.register(self.config_writer.close, 5)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # 加载配置
         self.load_config()
+        # 目录索引：mtime 未变化的目录不再重新列出
+        self.dir_index = dir_index.open_index(CONFIG_FILE) if self.merge_settings["dir_index"] else None
+        # 内存中的目录列表缓存，折叠后重新展开、刷新、重复跳转不再读盘；后台预读可能展开的目录
+        self.listing_cache = listing_cache.ListingCache(index=self.dir_index)
+        self.prefetcher = listing_cache.Prefetcher(self.listing_cache)
 
         # 跳转路径
         self.jump_path_var = tk.StringVar(value=self.jump_path_cache)
@@ -35,6 +87,13 @@ class DirectorySelectorApp:
         self.search_var = tk.StringVar(value=self.search_query_cache)
         self.search_results = []
         self.current_search_idx = -1
+        # 已加载节点的名称索引，节点插入时增量维护
+        self.name_index = name_index.NameIndex()
+        self._search_query = ""
+        self._search_job = None
+        self._search_reset = False
+        # 磁盘搜索 (不限于已加载的节点) 的停止标志
+        self._fs_search_stop = None
         
         # 默认输出路径：用户下载目录
         self.output_dir = tk.StringVar(value=str(Path.home() / "Downloads"))
@@ -43,6 +102,10 @@ class DirectorySelectorApp:
         self.progress_var = tk.DoubleVar(value=0)
 
         self.type_vars = {} # {category: BooleanVar}
+
+        # 监视模式：开启后勾选内容变化时自动增量更新滚动输出文件
+        self.watch_var = tk.BooleanVar(value=False)
+        self.watch_stop = None
         
         self.setup_ui()
         self.load_drives()
@@ -51,6 +114,9 @@ class DirectorySelectorApp:
         self.jump_path_var.trace_add("write", lambda *args: self.save_config())
         self.search_var.trace_add("write", lambda *args: self.save_config())
 
+        # 检查上次是否有中断的批量写回
+        self.root.after(200, self.check_interrupted_apply)
+
         # 如果有缓存的跳转路径，执行跳转
         if self.jump_path_cache:
             self.root.after(500, self.jump_to_path)
@@ -61,53 +127,81 @@ class DirectorySelectorApp:
 
     def load_config(self):
         """从文件加载配置，如果不存在则使用默认值"""
-        default_config = {
-            "file_types": {
-                "代码文件": [".py", ".c", ".cpp", ".h", ".java", ".js", ".ts", ".html", ".css", ".php", ".go", ".rs", ".sql", ".sh", ".bat", ".cs"],
-                "文档文件": [".txt", ".md", ".csv", ".rst", ".log"],
-                "配置文件": [".json", ".xml", ".yaml", ".yml", ".ini", ".conf", ".toml", ".env"],
-                "日志文件": [".log", ".out", ".err"]
-            },
-            "selected_states": {}, # {path: {"selected": bool, "recursive": bool}}
-            "jump_path": "",
-            "search_query": ""
-        }
+        default_config = merge_engine.default_config()
         
         if os.path.exists(CONFIG_FILE):
             try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    self.file_types = config.get("file_types", default_config["file_types"])
-                    self.selected_states = config.get("selected_states", {})
-                    self.jump_path_cache = config.get("jump_path", "")
-                    self.search_query_cache = config.get("search_query", "")
+                config = merge_engine.load_config(CONFIG_FILE)
+                self.file_types = config["file_types"]
+                self.selection = selection_store.SelectionStore.from_dict(config["selection"])
+                self.jump_path_cache = config["jump_path"]
+                self.search_query_cache = config["search_query"]
+                self.merge_settings = config["merge"]
+                self.exclude_settings = config["exclude"]
+                self.tree_page_size = config["tree_page_size"]
+                self.assume_expandable = config["assume_expandable"]
             except Exception as e:
                 logging.error(f"加载配置文件失败: {e}")
                 self.file_types = default_config["file_types"]
-                self.selected_states = {}
+                self.selection = selection_store.SelectionStore()
                 self.jump_path_cache = ""
                 self.search_query_cache = ""
+                self.merge_settings = default_config["merge"]
+                self.exclude_settings = default_config["exclude"]
+                self.tree_page_size = default_config["tree_page_size"]
+                self.assume_expandable = default_config["assume_expandable"]
         else:
             self.file_types = default_config["file_types"]
-            self.selected_states = {}
+            self.selection = selection_store.SelectionStore()
             self.jump_path_cache = ""
             self.search_query_cache = ""
+            self.merge_settings = default_config["merge"]
+            self.exclude_settings = default_config["exclude"]
+            self.tree_page_size = default_config["tree_page_size"]
+            self.assume_expandable = default_config["assume_expandable"]
             self.save_config()
 
     def save_config(self):
-        """保存当前配置到文件"""
+        """标记配置已变化，停止变化 CONFIG_SAVE_DELAY_MS 毫秒后统一写出一次"""
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+        self._save_job = self.root.after(CONFIG_SAVE_DELAY_MS, self._write_config)
+
+    def _write_config(self):
+        """在主线程复制当前配置，交给后台线程序列化并写出"""
+        self._save_job = None
         try:
             config_to_save = {
-                "file_types": self.file_types,
-                "selected_states": self.selected_states,
+                "file_types": {k: list(v) for k, v in self.file_types.items()},
+                "selection": self.selection.to_dict(),
                 "jump_path": self.jump_path_var.get(),
-                "search_query": self.search_var.get()
+                "search_query": self.search_var.get(),
+                "merge": dict(self.merge_settings),
+                "exclude": dict(self.exclude_settings, patterns=list(self.exclude_settings["patterns"])),
+                "tree_page_size": self.tree_page_size,
+                "assume_expandable": self.assume_expandable
             }
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config_to_save, f, indent=4, ensure_ascii=False)
+            self.config_writer.submit(config_to_save)
         except Exception as e:
             logging.error(f"保存配置文件失败: {e}")
 
+    def flush_config(self):
+        """立即写出尚未保存的配置并等待完成"""
+        if self._save_job is not None:
+            self.root.after_cancel(self._save_job)
+            self._write_config()
+        self.config_writer.flush(5)
+
+    def on_close(self):
+        """关闭窗口前停止监视、写出配置"""
+        if self.watch_stop is not None:
+            self.watch_stop.set()
+        self.flush_config()
+        self.prefetcher.close()
+        if self.dir_index is not None:
+            self.dir_index.close()
+        self.root.destroy()
+
     def setup_ui(self):
         # 清除现有 UI（用于动态刷新）
         for widget in self.root.winfo_children():
@@ -156,7 +250,7 @@ class DirectorySelectorApp:
         self.search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
         self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         self.search_entry.bind("<Return>", lambda e: self.perform_search())
-        self.search_var.trace_add("write", lambda *args: self.perform_search(reset=True))
+        self.search_var.trace_add("write", lambda *args: self._schedule_search(reset=True))
 
         self.search_info_var = tk.StringVar(value="0/0")
         ttk.Label(search_frame, textvariable=self.search_info_var, width=10).pack(side=tk.LEFT, padx=5)
@@ -164,6 +258,7 @@ class DirectorySelectorApp:
         ttk.Button(search_frame, text="∧", width=3, command=lambda: self.navigate_search(-1)).pack(side=tk.LEFT, padx=2)
         ttk.Button(search_frame, text="∨", width=3, command=lambda: self.navigate_search(1)).pack(side=tk.LEFT, padx=2)
         ttk.Button(search_frame, text="清除", width=5, command=self.clear_search).pack(side=tk.LEFT, padx=2)
+        ttk.Button(search_frame, text="磁盘搜索...", command=self.show_fs_search_dialog).pack(side=tk.LEFT, padx=2)
 
         columns = ("selected", "recursive")
         self.tree = ttk.Treeview(self.tree_frame, columns=columns, show='tree headings')
@@ -202,6 +297,7 @@ class DirectorySelectorApp:
         bottom_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
         
         ttk.Button(bottom_frame, text="刷新驱动器", command=self.load_drives).pack(side=tk.LEFT, padx=5)
+        ttk.Button(bottom_frame, text="内容搜索...", command=self.show_grep_dialog).pack(side=tk.LEFT, padx=5)
         
         # 状态标签
         ttk.Label(bottom_frame, textvariable=self.status_var, foreground="#666").pack(side=tk.LEFT, padx=20)
@@ -214,6 +310,10 @@ class DirectorySelectorApp:
         )
         self.sync_btn.pack(side=tk.RIGHT, padx=5)
 
+        ttk.Button(bottom_frame, text="撤销上次写回", command=self.rollback_last_apply).pack(side=tk.RIGHT, padx=5)
+        ttk.Checkbutton(bottom_frame, text="实时监视", variable=self.watch_var,
+                        command=self.toggle_watch).pack(side=tk.RIGHT, padx=5)
+
         self.run_btn = tk.Button(
             bottom_frame, 
             text="开始合并导出", 
@@ -246,6 +346,8 @@ class DirectorySelectorApp:
         # 管理按钮
         manage_btn = ttk.Button(self.filter_frame, text="⚙ 管理类型", command=self.show_manage_dialog)
         manage_btn.pack(side=tk.RIGHT, padx=10, pady=5)
+        exclude_btn = ttk.Button(self.filter_frame, text="🚫 排除规则", command=self.show_exclude_dialog)
+        exclude_btn.pack(side=tk.RIGHT, padx=5, pady=5)
 
     def show_manage_dialog(self):
         """显示管理文件类型的对话框"""
@@ -333,6 +435,286 @@ class DirectorySelectorApp:
         ttk.Button(op_frame, text="删除选中项", command=delete_cat).pack(fill=tk.X, pady=5)
         ttk.Button(op_frame, text="关闭", command=dialog.destroy).pack(fill=tk.X, pady=(20, 0))
 
+    def show_exclude_dialog(self):
+        """编辑扫描和目录树使用的排除规则 (gitignore 语法)"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("排除规则")
+        dialog.geometry("450x420")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(frame, text="排除规则 (一行一个，gitignore 语法，! 开头表示重新包含):").pack(anchor=tk.W)
+        rules_text = tk.Text(frame, height=15, font=("Consolas", 10))
+        rules_text.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        rules_text.insert(tk.END, "\n".join(self.exclude_settings["patterns"]))
+
+        gitignore_var = tk.BooleanVar(value=self.exclude_settings["use_gitignore"])
+        ttk.Checkbutton(frame, text="遵循目录中的 .gitignore", variable=gitignore_var).pack(anchor=tk.W)
+
+        def save():
+            lines = rules_text.get("1.0", tk.END).splitlines()
+            self.exclude_settings["patterns"] = [line.strip() for line in lines if line.strip()]
+            self.exclude_settings["use_gitignore"] = gitignore_var.get()
+            self.save_config()
+            dialog.destroy()
+            # 已展开的目录按新规则重新加载
+            self.load_drives()
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(btn_frame, text="保存", command=save).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="取消", command=dialog.destroy).pack(side=tk.RIGHT)
+
+    def show_fs_search_dialog(self):
+        """在磁盘上搜索文件名 (包括未展开的目录)，后台扫描并分页显示结果，点击结果在目录树中定位"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("磁盘搜索")
+        dialog.geometry("700x500")
+        dialog.transient(self.root)
+
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        jump_path = self.jump_path_var.get().strip()
+        root_var = tk.StringVar(value=jump_path if jump_path and os.path.isdir(jump_path) else self.output_dir.get())
+        query_var = tk.StringVar(value=self.search_var.get().strip())
+        info_var = tk.StringVar(value="")
+
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X)
+        ttk.Label(row, text="起始目录:").pack(side=tk.LEFT)
+        ttk.Entry(row, textvariable=root_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(row, text="选择...", command=lambda: root_var.set(
+            os.path.normpath(filedialog.askdirectory(initialdir=root_var.get()) or root_var.get()))).pack(side=tk.LEFT)
+
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X, pady=5)
+        ttk.Label(row, text="文件名包含:").pack(side=tk.LEFT)
+        query_entry = ttk.Entry(row, textvariable=query_var)
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        search_btn = ttk.Button(row, text="搜索")
+        search_btn.pack(side=tk.LEFT)
+
+        results = tk.Listbox(frame, font=("Consolas", 10))
+        scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=results.yview)
+        results.configure(yscrollcommand=scroll.set)
+        ttk.Label(frame, textvariable=info_var).pack(side=tk.BOTTOM, anchor=tk.W, pady=(5, 0))
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        results.pack(fill=tk.BOTH, expand=True)
+
+        def stop():
+            if self._fs_search_stop is not None:
+                self._fs_search_stop.set()
+                self._fs_search_stop = None
+
+        def add_page(stop_event, page):
+            if stop_event.is_set() or not results.winfo_exists():
+                return
+            room = FS_SEARCH_LIMIT - results.size()
+            results.insert(tk.END, *[path + (os.sep if is_dir else "") for path, is_dir in page[:room]])
+            if len(page) > room:
+                stop_event.set()
+                finish(stop_event, f"结果超过 {FS_SEARCH_LIMIT} 项，只显示前 {FS_SEARCH_LIMIT} 项，请缩小范围")
+            else:
+                info_var.set(f"正在搜索... 已找到 {results.size()} 项")
+
+        def finish(stop_event, message=None):
+            if self._fs_search_stop is stop_event:
+                self._fs_search_stop = None
+            if results.winfo_exists():
+                search_btn.configure(text="搜索")
+                info_var.set(message or f"搜索完成，共 {results.size()} 项 (单击结果在目录树中定位)")
+
+        def run(stop_event, root_path, query, allowed_exts):
+            try:
+                for page in fs_scan.search_names(root_path, query, allowed_exts,
+                                                 exclude_patterns=self.exclude_settings["patterns"],
+                                                 use_gitignore=self.exclude_settings["use_gitignore"],
+                                                 follow_symlinks=self.merge_settings["follow_symlinks"],
+                                                 scandir=self.listing_cache.scandir, stop_event=stop_event):
+                    self.root.after(0, lambda page=page: add_page(stop_event, page))
+                    if stop_event.is_set():
+                        return
+            except Exception as e:
+                logging.error(f"磁盘搜索失败 {root_path}: {e}")
+            if not stop_event.is_set():
+                self.root.after(0, lambda: finish(stop_event))
+
+        def start(event=None):
+            # 正在搜索时按钮用于停止；新的搜索取代尚未结束的搜索
+            if self._fs_search_stop is not None and event is None:
+                stop()
+                search_btn.configure(text="搜索")
+                info_var.set(f"已停止，共 {results.size()} 项")
+                return
+            stop()
+            root_path = os.path.normpath(root_var.get().strip())
+            query = query_var.get().strip()
+            if not query or not os.path.isdir(root_path):
+                info_var.set("请输入文件名和有效的起始目录")
+                return
+            results.delete(0, tk.END)
+            stop_event = threading.Event()
+            self._fs_search_stop = stop_event
+            search_btn.configure(text="停止")
+            info_var.set("正在搜索...")
+            threading.Thread(target=run, args=(stop_event, root_path, query, self._enabled_exts()),
+                             daemon=True).start()
+
+        def reveal(event):
+            selected = results.curselection()
+            if selected:
+                self.jump_path_var.set(results.get(selected[0]).rstrip(os.sep) or os.sep)
+                self.jump_to_path()
+
+        def close():
+            stop()
+            dialog.destroy()
+
+        search_btn.configure(command=start)
+        query_entry.bind("<Return>", start)
+        results.bind("<<ListboxSelect>>", reveal)
+        dialog.protocol("WM_DELETE_WINDOW", close)
+        query_entry.focus_set()
+
+    def show_grep_dialog(self):
+        """在勾选范围 (按当前类型筛选和排除规则扫描) 的文件中搜索内容，可只合并匹配的文件"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("内容搜索")
+        dialog.geometry("700x500")
+        dialog.transient(self.root)
+
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        pattern_var = tk.StringVar()
+        regex_var = tk.BooleanVar(value=False)
+        ignore_case_var = tk.BooleanVar(value=False)
+        info_var = tk.StringVar(value="在勾选的文件中搜索 (与合并时的扫描范围相同)")
+        matched = {}  # {path: 匹配次数}
+        state = {"stop": None}
+
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X)
+        ttk.Label(row, text="搜索内容:").pack(side=tk.LEFT)
+        pattern_entry = ttk.Entry(row, textvariable=pattern_var)
+        pattern_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        search_btn = ttk.Button(row, text="搜索")
+        search_btn.pack(side=tk.LEFT)
+
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X, pady=5)
+        ttk.Checkbutton(row, text="正则表达式", variable=regex_var).pack(side=tk.LEFT)
+        ttk.Checkbutton(row, text="不区分大小写", variable=ignore_case_var).pack(side=tk.LEFT, padx=10)
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        merge_btn = ttk.Button(btn_frame, text="只合并匹配的文件", state=tk.DISABLED)
+        merge_btn.pack(side=tk.RIGHT)
+        ttk.Label(btn_frame, textvariable=info_var).pack(side=tk.LEFT)
+
+        results = tk.Listbox(frame, font=("Consolas", 10))
+        scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=results.yview)
+        results.configure(yscrollcommand=scroll.set)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        results.pack(fill=tk.BOTH, expand=True)
+
+        def stop():
+            if state["stop"] is not None:
+                state["stop"].set()
+                state["stop"] = None
+
+        def add_results(stop_event, chunk, total):
+            if stop_event.is_set() or not results.winfo_exists():
+                return
+            for fpath, count in chunk:
+                matched[fpath] = count
+            results.insert(tk.END, *[f"{count:>6}  {fpath}" for fpath, count in chunk])
+            info_var.set(f"正在搜索 {total} 个文件... {len(matched)} 个文件匹配")
+
+        def finish(stop_event, message, show_count=True):
+            if state["stop"] is stop_event:
+                state["stop"] = None
+            if results.winfo_exists():
+                search_btn.configure(text="搜索")
+                merge_btn.configure(state=tk.NORMAL if matched else tk.DISABLED)
+                info_var.set(f"{message}，{len(matched)} 个文件匹配" if show_count else message)
+
+        def run(stop_event, selection, pattern, regex, ignore_case):
+            try:
+                file_paths = self._scan_selection(selection)
+                chunk = []
+                last = time.monotonic()
+                for item in content_grep.iter_grep(file_paths, pattern, regex=regex, ignore_case=ignore_case,
+                                                   workers=self.merge_settings["grep_workers"],
+                                                   stop_event=stop_event):
+                    chunk.append(item)
+                    # 结果按批送回主线程，避免逐条调度
+                    if len(chunk) >= 100 or time.monotonic() - last >= 0.1:
+                        self.root.after(0, lambda chunk=chunk: add_results(stop_event, chunk, len(file_paths)))
+                        chunk = []
+                        last = time.monotonic()
+                if chunk:
+                    self.root.after(0, lambda: add_results(stop_event, chunk, len(file_paths)))
+                message, show_count = f"在 {len(file_paths)} 个文件中搜索完成", True
+            except ValueError as e:
+                # 正则有误等
+                message, show_count = str(e), False
+            except Exception as e:
+                logging.error(f"内容搜索失败: {e}")
+                message, show_count = f"搜索失败: {e}", False
+            if not stop_event.is_set():
+                self.root.after(0, lambda: finish(stop_event, message, show_count))
+
+        def start(event=None):
+            # 正在搜索时按钮用于停止
+            if state["stop"] is not None and event is None:
+                stop()
+                finish(None, "已停止")
+                return
+            stop()
+            if not self.selection.has_selection():
+                info_var.set("请至少勾选一个文件或目录")
+                return
+            if not pattern_var.get():
+                info_var.set("请输入搜索内容")
+                return
+            matched.clear()
+            results.delete(0, tk.END)
+            merge_btn.configure(state=tk.DISABLED)
+            stop_event = threading.Event()
+            state["stop"] = stop_event
+            search_btn.configure(text="停止")
+            info_var.set("正在扫描勾选的文件...")
+            threading.Thread(target=run, args=(stop_event, self.selection.copy(), pattern_var.get(),
+                                               regex_var.get(), ignore_case_var.get()), daemon=True).start()
+
+        def merge_matched():
+            stop()
+            file_paths = set(matched)
+            dialog.destroy()
+            self.run_process(file_paths=file_paths)
+
+        def reveal(event):
+            selected = results.curselection()
+            if selected:
+                self.jump_path_var.set(results.get(selected[0]).split("  ", 1)[1].strip())
+                self.jump_to_path()
+
+        def close():
+            stop()
+            dialog.destroy()
+
+        search_btn.configure(command=start)
+        merge_btn.configure(command=merge_matched)
+        pattern_entry.bind("<Return>", start)
+        results.bind("<<ListboxSelect>>", reveal)
+        dialog.protocol("WM_DELETE_WINDOW", close)
+        pattern_entry.focus_set()
+
     def _select_all_types(self):
         for var in self.type_vars.values():
             var.set(True)
@@ -351,62 +733,68 @@ class DirectorySelectorApp:
 
     def clear_search(self):
         self.search_var.set("")
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+            self._search_job = None
+        self._search_query = ""
         for item in self.search_results:
             self._update_node_tags(item)
         self.search_results = []
         self.current_search_idx = -1
         self.search_info_var.set("0/0")
 
+    def _schedule_search(self, reset=False):
+        """输入停止 SEARCH_DELAY_MS 毫秒后再搜索；reset 一旦请求就保留到执行时"""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+            reset = reset or self._search_reset
+        self._search_reset = reset
+        self._search_job = self.root.after(SEARCH_DELAY_MS, lambda: self.perform_search(reset=reset))
+
     def perform_search(self, reset=False):
-        """在已加载的节点中执行搜索并高亮"""
+        """在已加载的节点中执行搜索并高亮，只更新高亮发生变化的节点"""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+            self._search_job = None
         query = self.search_var.get().strip().lower()
-        
-        # 清除旧高亮
-        for item in self.search_results:
+        self._search_query = query
+
+        old_results = self.search_results
+        old_current = old_results[self.current_search_idx] if 0 <= self.current_search_idx < len(old_results) else None
+        results = self.name_index.search(query)
+        old_set = set(old_results)
+        new_set = set(results)
+
+        # 清除不再匹配的高亮，新匹配的加上高亮
+        for item in old_set - new_set:
             self._update_node_tags(item)
-            
-        if not query:
-            self.search_results = []
-            self.current_search_idx = -1
-            self.search_info_var.set("0/0")
-            return
+        for item in new_set - old_set:
+            self.tree.item(item, tags=("match",))
+        self.search_results = results
 
         if reset:
             self.current_search_idx = -1
+        elif old_current in new_set:
+            # 结果因新加载的节点变化时，保持当前项不变
+            self.current_search_idx = results.index(old_current)
 
-        # 遍历所有已加载节点
-        self.search_results = []
-        self._find_matches("", query)
-        
-        count = len(self.search_results)
+        count = len(results)
         if count > 0:
             if self.current_search_idx == -1:
                 self.current_search_idx = 0
-            
-            # 应用高亮标签
-            for i, item_id in enumerate(self.search_results):
-                tag = "current_match" if i == self.current_search_idx else "match"
-                self.tree.item(item_id, tags=(tag,))
-                
-                # 如果是当前项，确保可见
-                if i == self.current_search_idx:
-                    self.tree.see(item_id)
-            
+            self.current_search_idx = min(self.current_search_idx, count - 1)
+            current = results[self.current_search_idx]
+            if old_current in new_set and old_current != current:
+                self.tree.item(old_current, tags=("match",))
+            if current != old_current or reset:
+                self.tree.item(current, tags=("current_match",))
+                # 确保当前项可见
+                self.tree.see(current)
             self.search_info_var.set(f"{self.current_search_idx + 1}/{count}")
         else:
             self.current_search_idx = -1
             self.search_info_var.set("0/0")
 
-    def _find_matches(self, parent, query):
-        """递归查找匹配项"""
-        for item_id in self.tree.get_children(parent):
-            node_text = self.tree.item(item_id, "text").lower()
-            if query in node_text:
-                self.search_results.append(item_id)
-            
-            # 继续查找已展开的子节点
-            self._find_matches(item_id, query)
-
     def navigate_search(self, direction):
         """上一个/下一个跳转"""
         count = len(self.search_results)
@@ -436,15 +824,12 @@ class DirectorySelectorApp:
             self.jump_to_path()
 
     def jump_to_path(self):
-        """跳转到指定路径并自动展开"""
+        """跳转到指定路径并自动展开：各级目录在后台线程读取，主线程只插入显示目标所需的节点"""
         raw_path = self.jump_path_var.get().strip()
         if not raw_path:
             return
             
         target_path = os.path.normpath(raw_path)
-        if not os.path.exists(target_path):
-            messagebox.showerror("错误", f"路径不存在: {target_path}")
-            return
 
         # 获取路径层级
         parts = []
@@ -462,74 +847,148 @@ class DirectorySelectorApp:
         if not parts:
             return
 
-        # 从根部开始逐级查找并展开
-        current_node = ""
-        
-        def find_and_expand(index, parent_id):
-            nonlocal current_node
-            target_part = parts[index].lower()
-            
-            # 获取当前层级的所有子节点
-            children = self.tree.get_children(parent_id)
-            
-            # 如果是 loading...，说明还没加载，先触发加载
-            if len(children) == 1 and self.tree.item(children[0])['text'] == "loading...":
-                # 这种同步跳转比较复杂，因为加载是异步的
-                # 我们改为直接调用同步读取方法，或者等待异步完成
-                self._sync_expand_for_jump(parent_id)
-                children = self.tree.get_children(parent_id)
-
-            found_id = None
-            for child_id in children:
-                node_data = self.node_states.get(child_id)
-                if not node_data: continue
-                
-                node_path = node_data["path"]
-                _, node_name = os.path.split(node_path.rstrip(os.sep))
-                
-                # 特殊处理磁盘根目录
-                if index == 0 and os.path.dirname(node_path) == node_path:
-                    if node_path.lower().startswith(target_part):
-                        found_id = child_id
-                        break
-                elif node_name.lower() == target_part:
-                    found_id = child_id
-                    break
-            
-            if found_id:
-                self.tree.item(found_id, open=True)
-                self.tree.see(found_id)
-                self.tree.selection_set(found_id)
-                self.tree.focus(found_id)
-                
-                if index < len(parts) - 1:
-                    # 继续下一级
-                    self.root.after(50, lambda: find_and_expand(index + 1, found_id))
-                else:
-                    # 如果是最后一级（目标路径），确保它的子项也被加载出来
-                    if os.path.isdir(target_path):
-                        self.root.after(50, lambda: self._sync_expand_for_jump(found_id))
-                        self.tree.item(found_id, open=True)
-            else:
-                messagebox.showwarning("提醒", f"在当前视图中未找到: {parts[index]}\n请尝试手动展开父目录。")
+        # 新的跳转取代仍在进行中的跳转
+        self._jump_seq += 1
+        self._jump_node = None
+        self.status_var.set(f"正在定位: {target_path}...")
+        threading.Thread(target=self._resolve_jump, args=(self._jump_seq, target_path, parts), daemon=True).start()
 
-        find_and_expand(0, "")
+    def _resolve_jump(self, seq, target_path, parts):
+        """后台线程：从根部开始逐级读取跳转路径上的目录，每读完一级就交给主线程展开"""
+        if not os.path.exists(target_path):
+            self.root.after(0, lambda: self._jump_failed(seq, f"路径不存在: {target_path}", error=True))
+            return
+
+        ancestors = [os.path.join(*parts[:i + 1]) for i in range(len(parts))]
+        # 预读更深的各级目录，与逐级读取并行
+        self.prefetcher.request([path for path in ancestors[1:] if os.path.isdir(path)])
+        for index, path in enumerate(ancestors):
+            if seq != self._jump_seq:
+                return
+            if index == len(ancestors) - 1 and not os.path.isdir(path):
+                break
+            try:
+                listing = self._list_directory(path)
+            except Exception as e:
+                logging.error(f"无法读取内容 {path}: {e}")
+                msg = f"无法读取: {path}\n{e}"
+                self.root.after(0, lambda msg=msg: self._jump_failed(seq, msg))
+                return
+            self.root.after(0, lambda index=index, listing=listing: self._reveal_jump_level(seq, parts, index, listing))
 
-    def _sync_expand_for_jump(self, node_id):
-        """同步加载目录内容，仅用于跳转功能"""
-        parent_path = self.node_states[node_id]["path"]
+    def _jump_failed(self, seq, message, error=False):
+        if seq != self._jump_seq:
+            return
+        self._jump_node = None
+        self.status_var.set("就绪")
+        if error:
+            messagebox.showerror("错误", message)
+        else:
+            messagebox.showwarning("提醒", message)
+
+    def _reveal_jump_level(self, seq, parts, index, listing):
+        """
+        主线程：用第 index 级目录的列表展开对应节点并显示下一级
+
+        尚未加载的目录按常规分批填充，下一级目标节点立即单独插入，其余兄弟节点随后补齐。
+        """
+        if seq != self._jump_seq:
+            return
+        if index == 0:
+            target_part = parts[0].lower()
+            self._jump_node = next((node for node in self.tree.get_children("")
+                                    if self.node_states[node]["path"].lower().startswith(target_part)), None)
+            if self._jump_node is None:
+                self._jump_failed(seq, f"在当前视图中未找到: {parts[0]}\n请尝试手动展开父目录。")
+                return
+        node = self._jump_node
+        if node is None or not self.tree.exists(node):
+            return
+
+        dirs, files, expandable = listing
+        if node not in self._jobs:
+            self._update_tree_with_contents(node, dirs, files, expandable=expandable)
+        self.tree.item(node, open=True)
+
+        if index + 1 < len(parts):
+            found_id = self._load_entry(node, parts[index + 1].lower())
+            if found_id is None:
+                self._jump_failed(seq, f"在当前视图中未找到: {parts[index + 1]}\n请尝试手动展开父目录。")
+                return
+            self._jump_node = found_id
+        else:
+            found_id = node
+
+        self.tree.see(found_id)
+        self.tree.selection_set(found_id)
+        self.tree.focus(found_id)
+        # 目标是目录时还会收到它自身的列表，是文件时到此结束
+        if found_id == node or not self.node_states[found_id]["is_dir"]:
+            self._jump_node = None
+            if not self._populating:
+                self.status_var.set("就绪")
+
+    def _scandir(self, path):
+        return self.listing_cache.scandir(path)
+
+    def _has_children(self, path):
+        """目录是否有内容；目录 mtime 未变时直接使用缓存，条目不多的目录顺便读入目录列表缓存"""
         try:
-            dirs = []
-            files = []
-            for entry in os.scandir(parent_path):
-                if entry.is_dir():
-                    dirs.append(entry)
-                else:
-                    files.append(entry)
-            
-            self._update_tree_with_contents(node_id, dirs, files)
-        except Exception as e:
-            logging.error(f"同步读取失败 {parent_path}: {e}")
+            st = os.stat(path)
+            cached = self.probe_cache.get(path)
+            if cached is not None and cached[0] == st.st_mtime_ns:
+                return cached[1]
+            result = self.listing_cache.probe(path, st)
+        except OSError:
+            return False
+        if len(self.probe_cache) >= PROBE_CACHE_SIZE:
+            self.probe_cache.clear()
+        self.probe_cache[path] = (st.st_mtime_ns, result)
+        return result
+
+    def _probe_children(self, dirs):
+        """在后台线程成批检查子目录是否有内容，返回 {path: bool}；assume_expandable 时不检查"""
+        if self.assume_expandable or not dirs:
+            return {}
+        paths = [entry.path for entry in dirs]
+        if len(paths) == 1:
+            return {paths[0]: self._has_children(paths[0])}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(paths))) as pool:
+            return dict(zip(paths, pool.map(self._has_children, paths)))
+
+    def _list_directory(self, parent_path):
+        """
+        读取目录并按排除规则过滤
+
+        返回排好序的 (dirs, files, {子目录: 是否有内容})，应在后台线程调用。
+        """
+        entries = self._scandir(parent_path)
+
+        # 与导出扫描使用相同的规则 (全局规则以连续勾选的最上层目录为根)，树中隐藏的即导出时排除的；
+        # 显式勾选的条目与导出时一样不受排除规则影响
+        matcher = fs_scan.matcher_for(self.selection, parent_path, {entry.name for entry in entries},
+                                      self.exclude_settings["patterns"], self.exclude_settings["use_gitignore"])
+        _, trie_node = self.selection.lookup(parent_path)
+
+        dirs = []
+        files = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            child = trie_node.child(entry.name) if trie_node is not None else None
+            explicit = child is not None and bool(child.rule and child.rule.get("selected"))
+            if not explicit and matcher.is_ignored(entry.path, is_dir):
+                continue
+            if is_dir:
+                dirs.append(entry)
+            else:
+                files.append(entry)
+        # 在调用方 (通常是后台线程) 排序，主线程只负责插入
+        dirs.sort(key=lambda e: e.name.lower())
+        files.sort(key=lambda e: e.name.lower())
+        return dirs, files, self._probe_children(dirs)
 
     def browse_output_dir(self):
         directory = filedialog.askdirectory(initialdir=self.output_dir.get())
@@ -540,6 +999,26 @@ class DirectorySelectorApp:
         for item in self.tree.get_children():
             self.tree.delete(item)
         self.node_states.clear()
+        self.node_children.clear()
+        self._cascade_pending.clear()
+        self._populating.clear()
+        self._paged.clear()
+        self._more_nodes.clear()
+        self._jobs.clear()
+        self._jump_seq += 1
+        self.name_index.clear()
+        self.search_results = []
+        self.current_search_idx = -1
+
+        if os.name != 'nt':
+            # 非 Windows 系统没有盘符，直接以根目录作为唯一入口
+            is_selected, is_recursive = self.selection.state(os.sep, True)
+            node = self.tree.insert("", tk.END, text=f" 💽 根目录 ({os.sep})",
+                                   values=("☑" if is_selected else "☐", "☑" if is_recursive else "☐"), open=False)
+            self.node_states[node] = {"path": os.sep, "is_dir": True, "selected": is_selected, "recursive": is_recursive}
+            self.name_index.add(node, f"根目录 ({os.sep})", os.sep, True)
+            self.tree.insert(node, tk.END, text="loading...")
+            return
 
         import string
         from ctypes import windll
@@ -549,13 +1028,12 @@ class DirectorySelectorApp:
                 drive = f"{letter}:\\"
                 if os.path.exists(drive):
                     # 检查驱动器是否有保存的状态
-                    saved = self.selected_states.get(drive, {})
-                    is_selected = saved.get("selected", False)
-                    is_recursive = saved.get("recursive", False)
+                    is_selected, is_recursive = self.selection.state(drive, True)
 
                     node = self.tree.insert("", tk.END, text=f" 💽 本地磁盘 ({letter}:)", 
                                            values=("☑" if is_selected else "☐", "☑" if is_recursive else "☐"), open=False)
                     self.node_states[node] = {"path": drive, "is_dir": True, "selected": is_selected, "recursive": is_recursive}
+                    self.name_index.add(node, f"本地磁盘 ({letter}:)", drive, True)
                     self.tree.insert(node, tk.END, text="loading...")
                     
                     # 如果有保存状态且不是根目录（或者我们想自动展开选中的项），可以根据需要处理
@@ -575,24 +1053,32 @@ class DirectorySelectorApp:
 
     def _async_load_contents(self, parent_node):
         """在后台线程读取目录内容，避免 UI 卡顿"""
-        parent_path = self.node_states[parent_node]["path"]
+        state = self.node_states[parent_node]
+        parent_path = state["path"]
         try:
-            dirs = []
-            files = []
-            for entry in os.scandir(parent_path):
-                if entry.is_dir():
-                    dirs.append(entry)
-                else:
-                    files.append(entry)
-            
+            dirs, files, expandable = self._list_directory(parent_path)
+            # 条目不多的子目录已在检查时读入缓存，只预读其余有内容的子目录；
+            # assume_expandable (通常是慢速网络盘) 时不读取子目录
+            if not self.assume_expandable:
+                self.prefetcher.request([entry.path for entry in dirs if expandable.get(entry.path)])
+
             # 回到主线程更新 UI
-            self.root.after(0, lambda: self._update_tree_with_contents(parent_node, dirs, files))
+            self.root.after(0, lambda: self._update_tree_with_contents(parent_node, dirs, files,
+                                                                       expandable=expandable))
         except Exception as e:
             logging.error(f"无法读取内容 {parent_path}: {e}")
             self.root.after(0, lambda: self._update_tree_with_contents(parent_node, [], [], error=str(e)))
 
-    def _update_tree_with_contents(self, parent_node, dirs, files, error=None):
-        """主线程更新 Treeview"""
+    def _update_tree_with_contents(self, parent_node, dirs, files, error=None, expandable=None):
+        """
+        主线程更新 Treeview
+
+        dirs、files 应已排好序，expandable 为 {子目录: 是否有内容}，缺少的子目录一律显示展开箭头。
+        条目分时间片插入，超过 tree_page_size 的部分用“显示更多”占位。
+        """
+        if not self.tree.exists(parent_node) or parent_node in self._jobs:
+            # 节点已被删除，或已由跳转等途径先行加载
+            return
         # 删除 "loading..." 节点
         for child in self.tree.get_children(parent_node):
             if self.tree.item(child)['text'] == "loading...":
@@ -600,38 +1086,164 @@ class DirectorySelectorApp:
         
         if error:
             self.tree.insert(parent_node, tk.END, text=f" ❌ 无法访问: {error}")
+            self.status_var.set("就绪")
+            return
+
+        items = [(entry, True) for entry in dirs] + [(entry, False) for entry in files]
+        # revealed: {条目序号: 节点}，跳转时提前单独插入、尚未轮到的条目
+        job = {"items": items, "pos": 0, "limit": min(len(items), self.tree_page_size),
+               "expandable": expandable or {}, "revealed": {}}
+        self.node_children[parent_node] = []
+        self._jobs[parent_node] = job
+        self._populating[parent_node] = job
+        if self._populate_job is None:
+            self._populate_job = self.root.after_idle(self._populate_slice)
+
+    def _populate_slice(self):
+        """在一个时间片内继续插入各个待填充目录的条目"""
+        self._populate_job = None
+        deadline = time.monotonic() + POPULATE_SLICE_SECONDS
+        for parent_node, job in list(self._populating.items()):
+            if time.monotonic() >= deadline:
+                break
+            self._populate(parent_node, job, deadline)
+        if self._populating:
+            remaining = sum(job["limit"] - job["pos"] for job in self._populating.values())
+            self.status_var.set(f"正在加载目录，剩余 {remaining} 项...")
+            self._populate_job = self.root.after_idle(self._populate_slice)
+
+    def _populate(self, parent_node, job, deadline):
+        """插入 job 中到 limit 为止的条目，到 deadline 时暂停"""
+        if not self.tree.exists(parent_node):
+            self._populating.pop(parent_node, None)
+            return
+        # 每个时间片重新取一次父目录的勾选方式，填充期间勾选变化也能正确继承
+        mode, trie_node = self.selection.lookup(self.node_states[parent_node]["path"])
+        items = job["items"]
+        revealed = job["revealed"]
+        while job["pos"] < job["limit"]:
+            entry, is_dir = items[job["pos"]]
+            node = revealed.pop(job["pos"], None)
+            job["pos"] += 1
+            if node is not None:
+                # 跳转时已插入的节点：只登记顺序，并按当前勾选状态刷新显示
+                self.node_children[parent_node].append(node)
+                self._refresh_entry(node, entry, is_dir, mode, trie_node)
+            else:
+                # 后面还有提前插入的节点时按位置插入，否则直接追加到末尾
+                position = len(self.node_children[parent_node]) if revealed else tk.END
+                self._insert_entry(parent_node, entry, is_dir, mode, trie_node,
+                                   job["expandable"].get(entry.path, True), position)
+            if job["pos"] % 50 == 0 and time.monotonic() >= deadline:
+                return
+
+        del self._populating[parent_node]
+        if job["pos"] < len(items):
+            placeholder = self.tree.insert(parent_node, tk.END, text=f" ⋯ 显示更多 (剩余 {len(items) - job['pos']} 项)",
+                                           values=("", ""), open=False)
+            self._more_nodes[placeholder] = parent_node
+            self._paged[parent_node] = job
+        if not self._populating:
+            if self.dir_index is not None:
+                self.dir_index.flush()
+            self.status_var.set("就绪")
+
+    @staticmethod
+    def _entry_state(entry, is_dir, mode, trie_node):
+        """显式规则优先，否则继承上级目录的勾选方式，返回 (是否勾选, 是否递归)"""
+        child_trie = trie_node.child(entry.name) if trie_node is not None else None
+        child_mode, is_selected = selection_store.child_state(
+            mode, child_trie.rule if child_trie is not None else None, is_dir)
+        return is_selected, child_mode == selection_store.RECURSIVE
+
+    def _refresh_entry(self, node, entry, is_dir, mode, trie_node):
+        is_selected, is_recursive = self._entry_state(entry, is_dir, mode, trie_node)
+        state = self.node_states[node]
+        state["selected"] = is_selected
+        if is_dir:
+            state["recursive"] = is_recursive
+        self.tree.item(node, values=("☑" if is_selected else "☐",
+                                     ("☑" if is_recursive else "☐") if is_dir else "-"))
+
+    def _insert_entry(self, parent_node, entry, is_dir, mode, trie_node, has_children, position=tk.END,
+                      track=True):
+        """插入一个条目；track 为 False 时不登记到 node_children (由分批填充轮到它时登记)"""
+        is_selected, is_recursive = self._entry_state(entry, is_dir, mode, trie_node)
+        if is_dir:
+            node = self.tree.insert(parent_node, position, text=f" 📁 {entry.name}", 
+                                   values=("☑" if is_selected else "☐", "☑" if is_recursive else "☐"), open=False)
+            self.node_states[node] = {"path": entry.path, "is_dir": True, "selected": is_selected, "recursive": is_recursive}
+            if has_children:
+                # 占位子项，用于显示展开箭头
+                self.tree.insert(node, tk.END, text="loading...")
         else:
-            parent_state = self.node_states.get(parent_node, {})
-            parent_selected = parent_state.get("selected", False)
-            parent_recursive = parent_state.get("recursive", False)
-
-            for entry in sorted(dirs, key=lambda e: e.name.lower()):
-                # 优先级：1. 显式记录的状态 2. 父节点的继承状态
-                saved = self.selected_states.get(entry.path, {})
-                is_selected = saved.get("selected", parent_selected and parent_recursive)
-                is_recursive = saved.get("recursive", False)
-
-                node = self.tree.insert(parent_node, tk.END, text=f" 📁 {entry.name}", 
-                                       values=("☑" if is_selected else "☐", "☑" if is_recursive else "☐"), open=False)
-                self.node_states[node] = {"path": entry.path, "is_dir": True, "selected": is_selected, "recursive": is_recursive}
-                try:
-                    # 快速检查是否有子项以显示展开箭头
-                    if any(os.scandir(entry.path)):
-                        self.tree.insert(node, tk.END, text="loading...")
-                except: pass
-                
-            for entry in sorted(files, key=lambda e: e.name.lower()):
-                # 优先级：1. 显式记录的状态 2. 父节点的继承状态
-                saved = self.selected_states.get(entry.path, {})
-                is_selected = saved.get("selected", parent_selected)
-
-                node = self.tree.insert(parent_node, tk.END, text=f" 📄 {entry.name}", 
-                                       values=("☑" if is_selected else "☐", "-"), open=False)
-                self.node_states[node] = {"path": entry.path, "is_dir": False, "selected": is_selected, "recursive": None}
-        
-        self.status_var.set("就绪")
+            node = self.tree.insert(parent_node, position, text=f" 📄 {entry.name}", 
+                                   values=("☑" if is_selected else "☐", "-"), open=False)
+            self.node_states[node] = {"path": entry.path, "is_dir": False, "selected": is_selected, "recursive": None}
+        if track:
+            self.node_children[parent_node].append(node)
+        self.name_index.add(node, entry.name, entry.path, is_dir)
+        if self._search_query and self._search_job is None and self._search_query in entry.name.lower():
+            # 新加载的节点匹配当前搜索，稍后刷新结果
+            self._schedule_search()
+        return node
+
+    def show_more(self, placeholder):
+        """展开“显示更多”占位节点：继续插入下一页"""
+        parent_node = self._more_nodes.pop(placeholder, None)
+        if parent_node is None:
+            return
+        self.tree.delete(placeholder)
+        job = self._paged.pop(parent_node)
+        job["limit"] = min(len(job["items"]), job["pos"] + self.tree_page_size)
+        self._populating[parent_node] = job
+        if self._populate_job is None:
+            self._populate_job = self.root.after_idle(self._populate_slice)
+
+    def _load_entry(self, parent_node, name):
+        """
+        跳转用：返回名为 name (小写) 的子节点，没有时返回 None
+
+        条目尚未插入时只单独插入它这一项 (位于“显示更多”之后也一样)，其余条目仍按顺序分批补齐。
+        """
+        job = self._jobs.get(parent_node)
+        if job is None:
+            return None
+        items = job["items"]
+        index = next((i for i, (entry, _) in enumerate(items) if entry.name.lower() == name), None)
+        if index is None:
+            return None
+        if index < job["pos"]:
+            return self.node_children[parent_node][index]
+        if index in job["revealed"]:
+            return job["revealed"][index]
+
+        if parent_node in self._paged:
+            del self._paged[parent_node]
+            for placeholder in [p for p, parent in self._more_nodes.items() if parent == parent_node]:
+                del self._more_nodes[placeholder]
+                self.tree.delete(placeholder)
+        if index >= job["limit"]:
+            pages = (index - job["limit"]) // self.tree_page_size + 1
+            job["limit"] = min(len(items), job["limit"] + pages * self.tree_page_size)
+
+        # 已插入的条目之后、序号更小的提前插入节点之后，即它最终所在的位置
+        position = len(self.node_children[parent_node]) + sum(1 for i in job["revealed"] if i < index)
+        mode, trie_node = self.selection.lookup(self.node_states[parent_node]["path"])
+        entry, is_dir = items[index]
+        node = self._insert_entry(parent_node, entry, is_dir, mode, trie_node,
+                                  job["expandable"].get(entry.path, True), position, track=False)
+        job["revealed"][index] = node
+        self._populating[parent_node] = job
+        if self._populate_job is None:
+            self._populate_job = self.root.after_idle(self._populate_slice)
+        return node
 
     def on_click(self, event):
+        item_id = self.tree.identify_row(event.y)
+        if item_id in self._more_nodes:
+            self.show_more(item_id)
+            return
         region = self.tree.identify_region(event.x, event.y)
         if region == "cell":
             column = self.tree.identify_column(event.x)
@@ -646,90 +1258,102 @@ class DirectorySelectorApp:
                 state["selected"] = not state["selected"]
                 self.tree.set(item_id, "selected", "☑" if state["selected"] else "☐")
                 
-                # 更新持久化状态
-                if state["selected"]:
-                    self.selected_states[path] = {"selected": True, "recursive": state.get("recursive", False)}
-                else:
-                    if path in self.selected_states:
-                        del self.selected_states[path]
+                # 更新勾选规则：递归勾选或取消勾选目录时，整个子树改为跟随该目录
+                if state["is_dir"] and (state["recursive"] or not state["selected"]):
+                    self.selection.clear_below(path)
+                self.selection.set(path, state["selected"], state["recursive"], is_dir=state["is_dir"])
                 self.save_config()
 
                 # 处理级联选择
                 if state["is_dir"]:
-                    self._cascade_selection(item_id, state["selected"], state["recursive"])
+                    self._cascade_selection(item_id)
                 
             elif column == "#2" and state["is_dir"]:  # 递归列
                 state["recursive"] = not state["recursive"]
                 self.tree.set(item_id, "recursive", "☑" if state["recursive"] else "☐")
                 
-                # 更新持久化状态
+                # 如果当前目录已选中，切换递归状态时需要更新规则和下级状态
                 if state["selected"]:
-                    self.selected_states[path] = {"selected": True, "recursive": state["recursive"]}
+                    if state["recursive"]:
+                        self.selection.clear_below(path)
+                    self.selection.set(path, True, state["recursive"])
                     self.save_config()
-
-                # 如果当前目录已选中，切换递归状态时需要更新下级状态
-                if state["selected"]:
-                    self._cascade_selection(item_id, True, state["recursive"])
-
-    def _cascade_selection(self, parent_node, is_selected, recursive):
-        """向下级联更新选择状态"""
-        for child in self.tree.get_children(parent_node):
-            if child not in self.node_states:
-                continue
-            
-            child_state = self.node_states[child]
-            path = child_state["path"]
-            
-            if not child_state["is_dir"]:
-                # 文件处理
-                child_state["selected"] = is_selected
-                self.tree.set(child, "selected", "☑" if is_selected else "☐")
-                
-                # 同步到持久化状态
-                if is_selected:
-                    self.selected_states[path] = {"selected": True, "recursive": None}
-                else:
-                    if path in self.selected_states:
-                        del self.selected_states[path]
-            else:
-                # 目录处理
-                if recursive:
-                    # 递归模式下，子目录同步状态并继续向下级联
+                    self._cascade_selection(item_id)
+
+    def _cascade_selection(self, parent_node):
+        """
+        按勾选规则刷新已加载的下级节点
+
+        先用父子索引和规则树在内存中迭代算出状态变化的节点，再分时间片刷新 Treeview，
+        全部刷新完后保存一次配置。
+        """
+        mode, trie_node = self.selection.lookup(self.node_states[parent_node]["path"])
+        stack = [(parent_node, mode, trie_node)]
+        while stack:
+            node, mode, trie_node = stack.pop()
+            for child in self.node_children.get(node, ()):
+                child_state = self.node_states.get(child)
+                if child_state is None:
+                    continue
+                child_trie = trie_node.child(os.path.basename(child_state["path"])) if trie_node is not None else None
+                is_dir = child_state["is_dir"]
+                child_mode, is_selected = selection_store.child_state(
+                    mode, child_trie.rule if child_trie is not None else None, is_dir)
+                # 未勾选目录的递归标记只是界面上的预设，保持不变
+                is_recursive = child_mode == selection_store.RECURSIVE if is_selected else child_state["recursive"]
+                if child_state["selected"] != is_selected or (is_dir and child_state["recursive"] != is_recursive):
                     child_state["selected"] = is_selected
-                    self.tree.set(child, "selected", "☑" if is_selected else "☐")
-                    
-                    if is_selected:
-                        self.selected_states[path] = {"selected": True, "recursive": child_state["recursive"]}
-                    else:
-                        if path in self.selected_states:
-                            del self.selected_states[path]
-                    
-                    self._cascade_selection(child, is_selected, True)
-                else:
-                    # 非递归模式下，取消选中父目录时，如果之前是同步选中的，则也取消选中子目录
-                    if not is_selected:
-                        child_state["selected"] = False
-                        self.tree.set(child, "selected", "☐")
-                        if path in self.selected_states:
-                            del self.selected_states[path]
-                        self._cascade_selection(child, False, False)
-        
-        # 批量操作后统一保存一次配置
-        self.save_config()
-
-    def run_process(self):
-        """主入口，启动异步处理线程"""
-        selected_files = []
-        selected_dirs = []
-        
-        for node, state in self.node_states.items():
-            if state["selected"]:
+                    if is_dir:
+                        child_state["recursive"] = is_recursive
+                    self._cascade_pending[child] = None
+                if is_dir:
+                    stack.append((child, child_mode, child_trie))
+
+        if self._cascade_job is None and self._cascade_pending:
+            self._cascade_job = self.root.after_idle(self._apply_cascade_batch)
+
+    def _apply_cascade_batch(self):
+        """在一个时间片内把待刷新节点的状态写入 Treeview，未完成的留到下一个空闲时间片"""
+        deadline = time.monotonic() + CASCADE_SLICE_SECONDS
+        pending = self._cascade_pending
+        while pending and time.monotonic() < deadline:
+            for _ in range(min(200, len(pending))):
+                node = next(iter(pending))
+                del pending[node]
+                state = self.node_states.get(node)
+                if state is None or not self.tree.exists(node):
+                    continue
+                self.tree.set(node, "selected", "☑" if state["selected"] else "☐")
                 if state["is_dir"]:
-                    selected_dirs.append((state["path"], state["recursive"]))
-                else:
-                    selected_files.append(state["path"])
-        
-        if not selected_files and not selected_dirs:
+                    self.tree.set(node, "recursive", "☑" if state["recursive"] else "☐")
+        if pending:
+            self.status_var.set(f"正在更新勾选状态，剩余 {len(pending)} 项...")
+            self._cascade_job = self.root.after_idle(self._apply_cascade_batch)
+        else:
+            self._cascade_job = None
+            self.status_var.set("就绪")
+            # 批量操作后统一保存一次配置
+            self.save_config()
+
+    def _enabled_exts(self):
+        """类型筛选中勾选的分类对应的后缀名"""
+        enabled = [category for category, var in self.type_vars.items() if var.get()]
+        return merge_engine.get_allowed_exts(self.file_types, enabled)
+
+    def _scan_selection(self, selection, scanned_dirs=None):
+        """按当前的类型筛选和排除规则扫描勾选规则的副本 (包括从未展开过的目录)"""
+        return merge_engine.collect_selection(
+            selection, self._enabled_exts(),
+            workers=self.merge_settings["scan_workers"],
+            follow_symlinks=self.merge_settings["follow_symlinks"],
+            exclude=self.exclude_settings,
+            dir_index=self.dir_index,
+            scanned_dirs=scanned_dirs
+        )
+
+    def run_process(self, file_paths=None):
+        """主入口，启动异步处理线程；file_paths 不为 None 时直接合并这些文件 (例如内容搜索的结果)"""
+        if file_paths is None and not self.selection.has_selection():
             messagebox.showwarning("警告", "请至少勾选一个文件或目录")
             return
 
@@ -746,7 +1370,8 @@ class DirectorySelectorApp:
         self.status_var.set("正在扫描并合并文件，请稍候...")
         
         # 启动工作线程
-        worker = threading.Thread(target=self.worker_thread, args=(selected_files, selected_dirs, out_dir))
+        # 后台线程使用规则的副本，扫描期间界面上的勾选变化不影响本次导出
+        worker = threading.Thread(target=self.worker_thread, args=(self.selection.copy(), out_dir, file_paths))
         worker.daemon = True
         worker.start()
 
@@ -781,51 +1406,12 @@ class DirectorySelectorApp:
     def _async_diff_process(self, merged_file_path):
         """异步处理文件解析和对比"""
         try:
-            import re
-            import difflib
-
-            with open(merged_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-
-            # 使用正则解析文件块
-            # 匹配模式：==================================================\nFILE: path\n==================================================\n\nCONTENT
-            pattern = r'={50}\nFILE: (.*?)\n={50}\n\n(.*?)(?=\n={50}\nFILE: |\Z)'
-            matches = re.findall(pattern, content, re.DOTALL)
-
-            diff_results = [] # [(path, original_lines, new_lines, diff_html/text)]
-            
-            for fpath, new_content in matches:
-                fpath = fpath.strip()
-                if not os.path.exists(fpath):
-                    logging.warning(f"原文件不存在，跳过对比: {fpath}")
-                    continue
-
-                try:
-                    with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                        old_content = f.read()
-                    
-                    if old_content.strip() == new_content.strip():
-                        continue # 没有变化
-
-                    old_lines = old_content.splitlines()
-                    new_lines = new_content.splitlines()
-                    
-                    # 生成差异
-                    diff = list(difflib.unified_diff(
-                        old_lines, new_lines, 
-                        fromfile='Original', tofile='Modified',
-                        lineterm=''
-                    ))
-                    
-                    if diff:
-                        diff_results.append({
-                            'path': fpath,
-                            'old_content': old_content,
-                            'new_content': new_content,
-                            'diff': diff
-                        })
-                except Exception as e:
-                    logging.error(f"对比文件出错 {fpath}: {e}")
+            diff_results = merge_engine.compute_diffs(
+                merged_file_path,
+                workers=self.merge_settings["diff_workers"],
+                batch_size=self.merge_settings["diff_batch_size"],
+                cache_path=merge_engine.cache_path_for(CONFIG_FILE)
+            )
 
             self.root.after(0, lambda: self.show_diff_dialog(diff_results))
         except Exception as e:
@@ -860,7 +1446,7 @@ class DirectorySelectorApp:
         list_frame = ttk.Frame(left_frame)
         list_frame.pack(fill=tk.BOTH, expand=True)
         
-        self.diff_list = tk.Listbox(list_frame, font=("Segoe UI", 9))
+        self.diff_list = tk.Listbox(list_frame, font=("Segoe UI", 9), selectmode=tk.EXTENDED)
         self.diff_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         sb = ttk.Scrollbar(list_frame, orient="vertical", command=self.diff_list.yview)
@@ -894,6 +1480,20 @@ class DirectorySelectorApp:
         hsb_diff.pack(fill=tk.X)
         self.diff_view.config(yscrollcommand=vsb_diff.set, xscrollcommand=hsb_diff.set)
 
+        # 差异在选中时才计算，最近查看过的保存在 LRU 缓存中
+        diff_cache = OrderedDict()  # {path: diff_lines}
+
+        def get_diff(item):
+            path = item['path']
+            if path in diff_cache:
+                diff_cache.move_to_end(path)
+                return diff_cache[path]
+            lines = merge_engine.render_diff(item)
+            diff_cache[path] = lines
+            if len(diff_cache) > DIFF_CACHE_SIZE:
+                diff_cache.popitem(last=False)
+            return lines
+
         def on_diff_select(event):
             selection = self.diff_list.curselection()
             if not selection:
@@ -907,7 +1507,13 @@ class DirectorySelectorApp:
             self.diff_view.insert(tk.END, f"文件: {item['path']}\n", "header")
             self.diff_view.insert(tk.END, "-"*60 + "\n", "info")
             
-            for line in item['diff']:
+            try:
+                diff_lines = get_diff(item)
+            except Exception as e:
+                logging.error(f"生成差异失败 {item['path']}: {e}")
+                diff_lines = [f"无法生成差异: {e}"]
+            
+            for line in diff_lines:
                 if line.startswith('+'):
                     self.diff_view.insert(tk.END, line + "\n", "add")
                 elif line.startswith('-'):
@@ -931,39 +1537,45 @@ class DirectorySelectorApp:
                 messagebox.showwarning("提示", "请先在列表中选择要应用的文件")
                 return
             
-            idx = selection[0]
-            item = diff_results[idx]
-            
-            if messagebox.askyesno("确认应用", f"确定要将修改应用到原文件吗？\n\n文件: {item['path']}"):
+            items = [diff_results[idx] for idx in selection]
+            if len(items) == 1:
+                prompt = f"确定要将修改应用到原文件吗？\n\n文件: {items[0]['path']}"
+            else:
+                prompt = f"确定要将选中的 {len(items)} 个文件的修改应用到原文件吗？"
+
+            if messagebox.askyesno("确认应用", prompt):
                 try:
-                    with open(item['path'], 'w', encoding='utf-8') as f:
-                        f.write(item['new_content'])
-                    messagebox.showinfo("成功", "更改已应用到文件。")
-                    # 刷新 UI 或移除已处理项
-                    self.diff_list.delete(idx)
-                    diff_results.pop(idx)
-                    self.diff_view.config(state=tk.NORMAL)
-                    self.diff_view.delete("1.0", tk.END)
-                    self.diff_view.config(state=tk.DISABLED)
+                    # 选中的文件作为一个批次写回，“撤销上次写回”可以整体撤销
+                    result = self._apply_batch(items)
                 except Exception as e:
                     messagebox.showerror("错误", f"应用失败: {e}")
+                    return
+                # 刷新 UI，移除已写回的项
+                applied = set(result["applied"])
+                for idx in sorted(selection, reverse=True):
+                    if diff_results[idx]['path'] in applied:
+                        self.diff_list.delete(idx)
+                        diff_cache.pop(diff_results.pop(idx)['path'], None)
+                self.diff_view.config(state=tk.NORMAL)
+                self.diff_view.delete("1.0", tk.END)
+                self.diff_view.config(state=tk.DISABLED)
+                if result["conflicts"] or result["failed"]:
+                    msg = f"成功: {len(result['applied'])}\n失败: {len(result['failed'])}"
+                    if result["conflicts"]:
+                        msg += f"\n合并后被修改而跳过: {len(result['conflicts'])}"
+                    messagebox.showwarning("部分未应用", msg, parent=dialog)
+                else:
+                    messagebox.showinfo("成功", "更改已应用到文件。")
 
         def apply_all():
             count = len(diff_results)
             if count == 0: return
             
             if messagebox.askyesno("确认全部应用", f"确定要将所有 {count} 个文件的修改应用到原文件吗？"):
-                success = 0
-                for item in diff_results:
-                    try:
-                        with open(item['path'], 'w', encoding='utf-8') as f:
-                            f.write(item['new_content'])
-                        success += 1
-                    except Exception as e:
-                        logging.error(f"批量应用失败 {item['path']}: {e}")
-                
-                messagebox.showinfo("结果", f"批量应用完成！\n成功: {success}\n失败: {count-success}")
                 dialog.destroy()
+                self.set_ui_state(False)
+                self.status_var.set(f"正在写回 {count} 个文件...")
+                threading.Thread(target=self._async_apply_all, args=(list(diff_results),), daemon=True).start()
 
         ttk.Button(btn_frame, text="应用选中的修改", command=apply_selected).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="全部应用", command=apply_all).pack(side=tk.LEFT, padx=5)
@@ -974,43 +1586,79 @@ class DirectorySelectorApp:
             self.diff_list.selection_set(0)
             on_diff_select(None)
 
-    def worker_thread(self, selected_files, selected_dirs, out_dir):
+    def _apply_batch(self, items):
+        return batch_apply.apply_batch(
+            items,
+            workers=self.merge_settings["apply_workers"],
+            journal_root=batch_apply.journal_root_for(CONFIG_FILE)
+        )
+
+    def _async_apply_all(self, items):
+        """在后台线程批量写回，避免大量文件时界面卡死"""
+        try:
+            result = self._apply_batch(items)
+            msg = f"批量应用完成！\n成功: {len(result['applied'])}\n失败: {len(result['failed'])}"
+            if result["conflicts"]:
+                msg += f"\n合并后被修改而跳过: {len(result['conflicts'])}"
+            self.root.after(0, lambda: messagebox.showinfo("结果", msg))
+        except Exception as e:
+            logging.error(f"批量应用失败: {e}")
+            msg = f"批量应用失败: {e}"
+            self.root.after(0, lambda msg=msg: messagebox.showerror("错误", msg))
+        self.root.after(0, lambda: self.finish_ui_update())
+
+    def rollback_last_apply(self):
+        """撤销最近一次写回"""
+        journal_root = batch_apply.journal_root_for(CONFIG_FILE)
+        journal_path = batch_apply.latest_journal(journal_root)
+        if not journal_path or batch_apply.load_journal(journal_path)["status"] == batch_apply.STATUS_ROLLED_BACK:
+            messagebox.showinfo("提示", "没有可以撤销的写回记录。")
+            return
+        count = len(batch_apply.load_journal(journal_path)["entries"])
+        if not messagebox.askyesno("确认撤销", f"确定要撤销最近一次写回吗？\n将从备份恢复 {count} 个文件。"):
+            return
+        if not self._confirm_rollback(journal_path):
+            return
+        success, failed = batch_apply.rollback(journal_path, force=True)
+        messagebox.showinfo("结果", f"撤销完成！\n成功: {success}\n失败: {failed}")
+
+    def _confirm_rollback(self, journal_path):
+        """有文件在写回后又被修改时询问是否仍然撤销"""
+        modified = batch_apply.modified_since_apply(journal_path)
+        if not modified:
+            return True
+        listing = "\n".join(modified[:10]) + ("\n..." if len(modified) > 10 else "")
+        return messagebox.askyesno(
+            "文件已被修改",
+            f"以下 {len(modified)} 个文件在写回后又被修改过，撤销会丢失这些修改：\n\n{listing}\n\n仍然撤销吗？",
+            icon="warning"
+        )
+
+    def check_interrupted_apply(self):
+        """启动时检查是否有中断的批量写回，询问继续还是撤销"""
+        journal_path = batch_apply.latest_journal(batch_apply.journal_root_for(CONFIG_FILE), batch_apply.UNFINISHED_STATUSES)
+        if not journal_path:
+            return
+        count = len(batch_apply.load_journal(journal_path)["entries"])
+        answer = messagebox.askyesnocancel(
+            "未完成的写回",
+            f"上次批量写回 {count} 个文件时中断。\n\n是: 继续完成写回\n否: 撤销已写回的文件\n取消: 暂不处理"
+        )
+        if answer is None:
+            return
+        if answer:
+            success, failed = batch_apply.resume(journal_path)
+        else:
+            if not self._confirm_rollback(journal_path):
+                return
+            success, failed = batch_apply.rollback(journal_path, force=True)
+        messagebox.showinfo("结果", f"处理完成！\n成功: {success}\n失败: {failed}")
+
+    def worker_thread(self, selection, out_dir, file_paths=None):
         """后台工作线程逻辑"""
         try:
-            # 0. 获取允许的文件后缀名
-            allowed_exts = set()
-            for category, var in self.type_vars.items():
-                if var.get():
-                    allowed_exts.update(self.file_types[category])
-            
-            # 如果什么都没选，默认不进行后缀名过滤，或者提示错误
-            # 这里我们选择如果什么都没选，则只合并用户显式勾选的单个文件，不扫描目录
-            
-            # 1. 扫描文件
-            total_file_paths = set()
-            
-            # 处理显式勾选的文件
-            for fpath in selected_files:
-                ext = os.path.splitext(fpath)[1].lower()
-                if not allowed_exts or ext in allowed_exts:
-                    total_file_paths.add(fpath)
-
-            # 处理勾选的目录
-            for d_path, recursive in selected_dirs:
-                if recursive:
-                    for root, _, files in os.walk(d_path):
-                        for f in files:
-                            ext = os.path.splitext(f)[1].lower()
-                            if not allowed_exts or ext in allowed_exts:
-                                total_file_paths.add(os.path.join(root, f))
-                else:
-                    try:
-                        for entry in os.scandir(d_path):
-                            if entry.is_file():
-                                ext = os.path.splitext(entry.name)[1].lower()
-                                if not allowed_exts or ext in allowed_exts:
-                                    total_file_paths.add(entry.path)
-                    except: pass
+            # 1. 按允许的后缀名扫描文件
+            total_file_paths = self._scan_selection(selection) if file_paths is None else file_paths
 
             if not total_file_paths:
                 self.root.after(0, lambda: messagebox.showinfo("提示", "根据当前的筛选条件，未找到任何匹配的文件"))
@@ -1025,43 +1673,77 @@ class DirectorySelectorApp:
             self.root.after(0, lambda: messagebox.showerror("错误", f"处理过程中发生意外错误: {e}"))
             self.root.after(0, lambda: self.finish_ui_update())
 
+    def toggle_watch(self):
+        """开启或关闭监视模式"""
+        if not self.watch_var.get():
+            if self.watch_stop is not None:
+                self.watch_stop.set()
+                self.watch_stop = None
+            self.status_var.set("已停止监视")
+            return
+
+        if not self.selection.has_selection():
+            messagebox.showwarning("警告", "请至少勾选一个文件或目录")
+            self.watch_var.set(False)
+            return
+        out_dir = self.output_dir.get()
+        try:
+            os.makedirs(out_dir, exist_ok=True)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法创建输出目录: {e}")
+            self.watch_var.set(False)
+            return
+
+        self.watch_stop = threading.Event()
+        selection = self.selection.copy()
+        scan = lambda scanned_dirs: self._scan_selection(selection, scanned_dirs)
+        threading.Thread(target=self._watch_thread, args=(scan, out_dir, self.watch_stop), daemon=True).start()
+        self.status_var.set("正在开启监视...")
+
+    def _watch_thread(self, scan, out_dir, stop_event):
+        """后台监视线程，勾选内容变化后增量更新 merged_files_watch.txt"""
+        def on_refresh(result):
+            message = (f"监视中: 已更新 {result['output_filename']} "
+                       f"({result['success_count']} 个文件，复用 {result['reused_count']} 个)")
+            self.root.after(0, lambda: self.status_var.set(message))
+
+        try:
+            watch.watch(
+                scan, out_dir, watch.cache_path_for(CONFIG_FILE), on_refresh=on_refresh,
+                stop_event=stop_event, workers=self.merge_settings["workers"],
+                max_bytes_in_flight=self.merge_settings["max_bytes_in_flight"]
+            )
+        except Exception as e:
+            logging.error(f"监视模式异常: {e}")
+            if not stop_event.is_set():
+                self.root.after(0, lambda: self.watch_var.set(False))
+                msg = f"监视已停止: {e}"
+                self.root.after(0, lambda msg=msg: self.status_var.set(msg))
+
     def perform_merge(self, file_paths, output_directory):
         """实际的合并 IO 操作"""
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"merged_files_{timestamp}.txt"
-        output_path = os.path.join(output_directory, output_filename)
-        
-        success_count = 0
-        fail_count = 0
-        sorted_paths = sorted(list(file_paths))
-        total_count = len(sorted_paths)
-        
+        def on_progress(current, total_count):
+            # 更新状态文字和进度条
+            progress = (current / total_count) * 100
+            self.root.after(0, lambda p=progress, count=current: self._update_progress(p, count, total_count))
+
         try:
-            with open(output_path, 'w', encoding='utf-8') as outfile:
-                for i, fpath in enumerate(sorted_paths):
-                    # 更新状态文字和进度条
-                    progress = ((i + 1) / total_count) * 100
-                    self.root.after(0, lambda p=progress, count=i+1: self._update_progress(p, count, total_count))
-                    
-                    try:
-                        outfile.write(f"\n{'='*50}\n")
-                        outfile.write(f"FILE: {fpath}\n")
-                        outfile.write(f"{'='*50}\n\n")
-                        
-                        with open(fpath, 'r', encoding='utf-8', errors='ignore') as infile:
-                            while True:
-                                chunk = infile.read(1024 * 1024)
-                                if not chunk:
-                                    break
-                                outfile.write(chunk)
-                            outfile.write("\n")
-                        success_count += 1
-                    except Exception as e:
-                        logging.error(f"读取失败 {fpath}: {e}")
-                        fail_count += 1
+            if self.merge_settings["shard_max_bytes"] or self.merge_settings["shard_max_tokens"]:
+                self._perform_sharded_merge(file_paths, output_directory, on_progress)
+                return
+            result = merge_engine.merge_files(
+                file_paths, output_directory, progress_callback=on_progress,
+                workers=self.merge_settings["workers"],
+                max_bytes_in_flight=self.merge_settings["max_bytes_in_flight"],
+                cache_path=merge_engine.cache_path_for(CONFIG_FILE) if self.merge_settings["incremental"] else None,
+                delta=self.merge_settings["emit_delta"]
+            )
             
-            msg = f"合并完成！\n\n生成文件: {output_filename}\n所在目录: {output_directory}\n"
-            msg += f"成功合并: {success_count} 个文件\n失败: {fail_count} 个"
+            msg = f"合并完成！\n\n生成文件: {result['output_filename']}\n所在目录: {output_directory}\n"
+            msg += f"成功合并: {result['success_count']} 个文件 (未变化复用: {result['reused_count']} 个)\n失败: {result['fail_count']} 个"
+            if result["delta_path"]:
+                msg += f"\n\n增量文件: {os.path.basename(result['delta_path'])}\n"
+                msg += f"新增: {result['added']}  修改: {result['changed']}  删除: {result['deleted']}"
             
             self.root.after(0, lambda: self.show_final_result(msg, output_directory))
             
@@ -1070,6 +1752,22 @@ class DirectorySelectorApp:
             self.root.after(0, lambda: messagebox.showerror("错误", f"无法写入输出文件: {e}"))
             self.root.after(0, lambda: self.finish_ui_update())
 
+    def _perform_sharded_merge(self, file_paths, output_directory, on_progress):
+        """按配置中的字节数或 token 数上限分片输出"""
+        import shard_merge
+
+        result = shard_merge.merge_sharded(
+            file_paths, output_directory, progress_callback=on_progress,
+            max_bytes=self.merge_settings["shard_max_bytes"],
+            max_tokens=self.merge_settings["shard_max_tokens"],
+            bytes_per_token=self.merge_settings["bytes_per_token"],
+            workers=self.merge_settings["shard_workers"]
+        )
+        msg = f"合并完成！\n\n共 {len(result['shards'])} 个分片: {result['shards'][0]} ...\n"
+        msg += f"清单: {os.path.basename(result['manifest_path'])}\n所在目录: {output_directory}\n"
+        msg += f"成功合并: {result['success_count']} 个文件\n失败: {result['fail_count']} 个"
+        self.root.after(0, lambda: self.show_final_result(msg, output_directory))
+
     def _update_progress(self, progress, current, total):
         """更新 UI 进度条和状态文字"""
         self.progress_var.set(progress)
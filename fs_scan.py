@@ -0,0 +1,334 @@
+"""
+并发目录扫描
+
+替代 os.walk 逐个目录顺序遍历：多个线程共享一个目录队列并行调用 os.scandir，
+直接使用 DirEntry 自带的类型信息判断文件/目录，不再对每个文件单独 stat。
+勾选状态以规则树 (见 selection_store) 表示，扫描时随目录一起沿规则树向下查找；
+按列表给出勾选项时先合并重叠的部分 (递归目录下的子目录或文件不再单独扫描)，
+跟随符号链接时按 (st_dev, st_ino) 记录已访问的目录，避免链接成环时无限遍历。
+给出排除规则 (见 ignore_rules) 时，被排除的目录在入队前就被剪掉，不会被扫描；
+给出目录索引 (见 dir_index) 时，mtime 未变化的目录直接使用索引中的列表。
+"""
+import os
+import time
+import queue
+import collections
+import logging
+import threading
+from pathlib import PurePath
+
+import ignore_rules
+import selection_store
+
+DEFAULT_SCAN_WORKERS = 8
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _covered(key, recursive_keys, include_self=True):
+    """key 本身或它的任一上级目录在 recursive_keys 中"""
+    current = key if include_self else os.path.dirname(key)
+    while True:
+        if current in recursive_keys:
+            return True
+        parent = os.path.dirname(current)
+        if parent == current:
+            return False
+        current = parent
+
+
+def collapse_roots(selected_files, selected_dirs):
+    """
+    合并重叠的勾选项，返回 (files, dirs)
+
+    被递归目录覆盖的子目录和文件会被丢弃，同一目录同时以递归和非递归方式勾选时只保留递归；
+    直接位于非递归目录下的文件也会被丢弃，由目录扫描统一产出。
+    """
+    recursive_keys = {_key(d) for d, recursive in selected_dirs if recursive}
+    flat_keys = set()
+    dirs = []
+    seen = set()
+    for d_path, recursive in selected_dirs:
+        key = _key(d_path)
+        if key in seen:
+            continue
+        if recursive:
+            if _covered(key, recursive_keys, include_self=False):
+                continue
+        elif _covered(key, recursive_keys):
+            continue
+        else:
+            flat_keys.add(key)
+        seen.add(key)
+        dirs.append((d_path, bool(recursive)))
+
+    files = []
+    for fpath in selected_files:
+        key = _key(fpath)
+        if _covered(key, recursive_keys, include_self=False) or os.path.dirname(key) in flat_keys:
+            continue
+        files.append(fpath)
+    return files, dirs
+
+
+def _ext_allowed(name, allowed_exts):
+    return not allowed_exts or os.path.splitext(name)[1].lower() in allowed_exts
+
+
+def _with_rule_excludes(matcher, path, rule):
+    """叠加勾选规则自带的排除规则 (以所在目录为根)"""
+    patterns = rule.get("exclude") if rule else None
+    if not patterns:
+        return matcher
+    return (matcher or ignore_rules.IgnoreMatcher()).with_rules(patterns, path)
+
+
+def matcher_for(selection, dir_path, names, exclude_patterns=None, use_gitignore=False):
+    """
+    返回列出目录 dir_path 时使用的排除规则，与 scan_selection 扫描到该目录时使用的一致
+
+    沿规则树从根走到 dir_path：全局规则以连续勾选的最上层目录为根，途中各级叠加规则中的
+    "exclude" 与 .gitignore；被排除 (且未显式勾选) 的目录与未勾选的目录一样使连续勾选中断。
+    dir_path 不在勾选范围内时按单独勾选它处理。names 为 dir_path 中的文件名集合。
+    """
+    path = os.path.abspath(dir_path)
+    parts = PurePath(path).parts
+    node = selection.root
+    mode = None
+    rule = None
+    matcher = None
+    current = ""
+    for i, part in enumerate(parts):
+        current = os.path.join(current, part) if current else part
+        node = node.child(part) if node is not None else None
+        rule = node.rule if node is not None else None
+        explicit = bool(rule and rule.get("selected"))
+        mode, _ = selection_store.child_state(mode, rule, True)
+        if mode is None or (matcher is not None and not explicit and matcher.is_ignored(current, True)):
+            mode = None
+            matcher = None
+            continue
+        if matcher is None:
+            matcher = ignore_rules.build_matcher(current, exclude_patterns)
+        matcher = _with_rule_excludes(matcher, current, rule)
+        if i < len(parts) - 1 and use_gitignore and os.path.isfile(os.path.join(current, ignore_rules.GITIGNORE)):
+            matcher = matcher.for_directory(current, {ignore_rules.GITIGNORE})
+    if matcher is None:
+        matcher = _with_rule_excludes(ignore_rules.build_matcher(path, exclude_patterns), path, rule)
+    return matcher.for_directory(path, names, use_gitignore)
+
+
+def scan_files(selected_files, selected_dirs, allowed_exts, workers=DEFAULT_SCAN_WORKERS, follow_symlinks=False,
+               exclude_patterns=None, use_gitignore=False, selection_rules=None, dir_index=None,
+               scanned_dirs=None):
+    """
+    扫描勾选的文件和目录，返回需要合并的文件路径集合
+
+    selected_dirs: [(path, recursive)]，selection_rules 为 {勾选目录: [排除规则]}。
+    先合并重叠的勾选项，再按 scan_selection 扫描，其余参数见 scan_selection。
+    """
+    files, dirs = collapse_roots(selected_files, selected_dirs)
+    rules = {_key(d): r for d, r in (selection_rules or {}).items()}
+    selection = selection_store.SelectionStore.from_roots(
+        files, dirs, {d: rules[_key(d)] for d, _ in dirs if _key(d) in rules})
+    return scan_selection(selection, allowed_exts, workers=workers, follow_symlinks=follow_symlinks,
+                          exclude_patterns=exclude_patterns, use_gitignore=use_gitignore,
+                          dir_index=dir_index, scanned_dirs=scanned_dirs)
+
+
+def scan_selection(selection, allowed_exts, workers=DEFAULT_SCAN_WORKERS, follow_symlinks=False,
+                   exclude_patterns=None, use_gitignore=False, dir_index=None, scanned_dirs=None):
+    """
+    按勾选规则树 (selection_store.SelectionStore) 扫描，返回需要合并的文件路径集合
+
+    只列出处于勾选范围内的目录；未勾选的目录不列出，只沿规则树直接走到其中被单独勾选的下级。
+    follow_symlinks 为 False 时与 os.walk 默认行为一致，不进入指向目录的符号链接 (显式勾选的除外)。
+    exclude_patterns 为全局排除规则，以最上层的勾选目录为根；规则中的 "exclude" 以所在目录为根；
+    use_gitignore 为 True 时同时遵循扫描途中遇到的 .gitignore。显式勾选的文件和目录不受排除规则影响。
+    dir_index 为 dir_index.DirIndex 实例，None 表示每个目录都重新列出。
+    scanned_dirs 为集合时把扫描过的目录 (含勾选文件所在目录) 加入其中。
+    """
+    workers = max(1, workers or 1)
+    if not selection.has_selection():
+        return set()
+
+    work = queue.Queue()
+    lock = threading.Lock()
+    pending = [1]  # 已入队但尚未处理完成的目录数，初始为规则树根节点
+    visited = set()  # 跟随符号链接时已访问目录的 (st_dev, st_ino)
+    found = []
+    use_rules = bool(exclude_patterns or use_gitignore)
+
+    def enqueue_dir(path, mode, matcher, node):
+        if follow_symlinks and mode is not None:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                logging.error(f"无法读取目录 {path}: {e}")
+                return False
+            with lock:
+                if (st.st_dev, st.st_ino) in visited:
+                    logging.warning(f"跳过重复访问的目录 (符号链接成环或重复挂载): {path}")
+                    return False
+                visited.add((st.st_dev, st.st_ino))
+        work.put((path, mode, matcher, node))
+        return True
+
+    def visit_rules(node):
+        """未勾选的目录：不列出目录，只走到规则树中有勾选的下级"""
+        local = []
+        subdirs = []
+        for child in list(node.children.values()):
+            rule = child.rule
+            if rule and rule.get("selected"):
+                if os.path.isdir(child.path):
+                    mode = selection_store.RECURSIVE if rule.get("recursive") else selection_store.FLAT
+                    matcher = ignore_rules.build_matcher(child.path, exclude_patterns) if use_rules else None
+                    subdirs.append((child.path, mode, _with_rule_excludes(matcher, child.path, rule), child))
+                elif _ext_allowed(child.path, allowed_exts):
+                    local.append(child.path)
+                    if scanned_dirs is not None:
+                        scanned_dirs.add(os.path.dirname(os.path.abspath(child.path)))
+            elif child.selected_below:
+                subdirs.append((child.path, None, None, child))
+        return local, subdirs
+
+    def scan_dir(path, mode, matcher, node):
+        if mode is None:
+            return visit_rules(node)
+        if scanned_dirs is not None:
+            scanned_dirs.add(path)
+        local = []
+        subdirs = []
+        try:
+            if dir_index is not None:
+                entries = dir_index.scandir(path)
+            else:
+                with os.scandir(path) as it:
+                    entries = list(it)
+        except OSError as e:
+            logging.error(f"无法读取目录 {path}: {e}")
+            return local, subdirs
+        if matcher is not None:
+            matcher = matcher.for_directory(path, {entry.name for entry in entries}, use_gitignore)
+        for entry in entries:
+            child = node.child(entry.name) if node is not None and node.children else None
+            rule = child.rule if child is not None else None
+            explicit = bool(rule and rule.get("selected"))
+            try:
+                is_dir = entry.is_dir()
+                if is_dir and not explicit and not follow_symlinks and entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            child_mode, selected = selection_store.child_state(mode, rule, is_dir)
+            ignored = not explicit and matcher is not None and matcher.is_ignored(entry.path, is_dir)
+            if is_dir:
+                if child_mode is not None and not ignored:
+                    subdirs.append((entry.path, child_mode, _with_rule_excludes(matcher, entry.path, rule), child))
+                elif child is not None and child.selected_below:
+                    # 未勾选或被排除的目录中仍有单独勾选的下级
+                    subdirs.append((entry.path, None, None, child))
+            elif selected and not ignored and _ext_allowed(entry.name, allowed_exts):
+                local.append(entry.path)
+        return local, subdirs
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            try:
+                local, subdirs = scan_dir(*item)
+            except Exception as e:
+                logging.error(f"扫描失败 {item[0]}: {e}")
+                local, subdirs = [], []
+            found.extend(local)
+            with lock:
+                pending[0] += len(subdirs)
+            queued = sum(1 for sub in subdirs if enqueue_dir(*sub))
+            with lock:
+                # 未能入队的子目录和当前目录都算作完成
+                pending[0] -= len(subdirs) - queued + 1
+                done = pending[0] == 0
+            if done:
+                for _ in range(workers):
+                    work.put(None)
+
+    work.put((None, None, None, selection.root))
+    threads = [threading.Thread(target=worker, name=f"scan-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if dir_index is not None:
+        dir_index.flush()
+    return set(found)
+
+
+def search_names(root, query, allowed_exts=None, exclude_patterns=None, use_gitignore=False, follow_symlinks=False,
+                 scandir=None, stop_event=None, page_size=200, flush_interval=0.2):
+    """
+    从 root 开始按层查找名称包含 query 的文件和目录，按页产出 [(path, is_dir)]
+
+    每找到 page_size 项、或距上一页超过 flush_interval 秒时产出一页，结果少时也能尽快显示。
+
+    不区分大小写；allowed_exts 只限制文件，目录名匹配时同样产出。被排除规则命中的目录不再进入。
+    scandir 为读取目录的函数 (例如 listing_cache.ListingCache.scandir)，默认直接 os.scandir；
+    stop_event 被设置后在处理下一个目录前结束。
+    """
+    if scandir is None:
+        def scandir(path):
+            with os.scandir(path) as it:
+                return list(it)
+    query = query.lower()
+    matcher = ignore_rules.build_matcher(root, exclude_patterns) if (exclude_patterns or use_gitignore) else None
+    pending = collections.deque([(root, matcher)])
+    visited = set()
+    page = []
+    last_flush = time.monotonic()
+    while pending:
+        if stop_event is not None and stop_event.is_set():
+            return
+        path, matcher = pending.popleft()
+        if follow_symlinks:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+        try:
+            entries = scandir(path)
+        except OSError as e:
+            logging.debug(f"无法读取目录 {path}: {e}")
+            continue
+        if matcher is not None:
+            matcher = matcher.for_directory(path, {entry.name for entry in entries}, use_gitignore)
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+                if is_dir and not follow_symlinks and entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            if matcher is not None and matcher.is_ignored(entry.path, is_dir):
+                continue
+            if is_dir:
+                pending.append((entry.path, matcher))
+            if query in entry.name.lower() and (is_dir or _ext_allowed(entry.name, allowed_exts)):
+                page.append((entry.path, is_dir))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+                    last_flush = time.monotonic()
+        if page and time.monotonic() - last_flush >= flush_interval:
+            yield page
+            page = []
+            last_flush = time.monotonic()
+    if page:
+        yield page
@@ -0,0 +1,162 @@
+"""
+gitignore 风格的排除规则
+
+规则语法与 .gitignore 相同的常用子集：
+    # 注释、空行忽略
+    name        任意层级下名为 name 的文件或目录
+    dir/        只匹配目录
+    /build      只匹配规则所在目录下的 build
+    a/**/b      ** 匹配任意层级目录
+    *.min.js    * 与 ? 不跨越 /
+    !keep.js    重新包含之前被排除的路径
+
+每组规则在创建时编译成正则，没有 ! 规则时整组合并成一个正则，一次匹配即可得出结果。
+IgnoreMatcher 按目录层级叠加多组规则 (全局规则、勾选项规则、沿途读到的 .gitignore)，
+扫描时被排除的目录直接跳过，不再进入。
+"""
+import os
+import re
+import logging
+
+GITIGNORE = ".gitignore"
+
+# 默认只排除版本库、依赖与缓存目录；build/、dist/、target/ 等名称也可能是真实的源码目录，不默认排除
+DEFAULT_EXCLUDE_PATTERNS = [
+    ".git/", ".svn/", ".hg/",
+    "node_modules/", "__pycache__/", ".mypy_cache/", ".pytest_cache/", ".tox/",
+    ".venv/", "venv/"
+]
+
+
+def _translate(pattern):
+    """把单条 glob 规则翻译为正则 (匹配相对路径，使用 / 分隔)"""
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    i = 0
+    n = len(pattern)
+    parts = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                if pattern.startswith('**/', i):
+                    parts.append('(?:.*/)?')
+                    i += 3
+                else:
+                    parts.append('.*')
+                    i += 2
+                continue
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append(f'[{body}]')
+                i = end
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    prefix = '' if anchored else '(?:.*/)?'
+    return prefix + ''.join(parts)
+
+
+class RuleSet:
+    """一组以 base 目录为根的规则"""
+
+    def __init__(self, patterns, base):
+        self.base = os.path.normpath(base)
+        self.rules = []  # [(regex, negate, dir_only)]
+        for line in patterns:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                line = line[1:]  # \# 与 \! 转义
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            self.rules.append((re.compile(_translate(line)), negate, dir_only))
+
+        # 没有 ! 规则时合并成两个正则，顺序无关
+        self.simple = not any(negate for _, negate, _ in self.rules)
+        if self.simple:
+            any_rules = [r.pattern for r, _, dir_only in self.rules if not dir_only]
+            dir_rules = [r.pattern for r, _, dir_only in self.rules if dir_only]
+            self.any_re = re.compile('|'.join(f'(?:{p})' for p in any_rules)) if any_rules else None
+            self.dir_re = re.compile('|'.join(f'(?:{p})' for p in dir_rules)) if dir_rules else None
+
+    def _relative(self, path):
+        path = os.path.normpath(path)
+        if self.base in ('.', ''):
+            rel = path
+        elif path == self.base or path.startswith(self.base.rstrip(os.sep) + os.sep):
+            rel = path[len(self.base):].lstrip(os.sep)
+        else:
+            return None
+        return rel.replace(os.sep, '/') if os.sep != '/' else rel
+
+    def match(self, path, is_dir):
+        """返回 True (排除)、False (重新包含) 或 None (没有规则匹配)"""
+        if not self.rules:
+            return None
+        rel = self._relative(path)
+        if not rel or rel == '.':
+            return None
+        if self.simple:
+            if self.any_re and self.any_re.fullmatch(rel):
+                return True
+            if is_dir and self.dir_re and self.dir_re.fullmatch(rel):
+                return True
+            return None
+        # 有 ! 规则时后出现的规则优先
+        for regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(rel):
+                return not negate
+        return None
+
+
+class IgnoreMatcher:
+    """按目录层级叠加的多组规则，后加入 (更深层) 的规则优先"""
+
+    def __init__(self, rule_sets=()):
+        self.rule_sets = tuple(rs for rs in rule_sets if rs.rules)
+
+    def with_rules(self, patterns, base):
+        if not patterns:
+            return self
+        return IgnoreMatcher(self.rule_sets + (RuleSet(patterns, base),))
+
+    def for_directory(self, dir_path, names, use_gitignore=True):
+        """进入目录时叠加该目录下 .gitignore 的规则；names 为目录中的文件名集合"""
+        if not use_gitignore or GITIGNORE not in names:
+            return self
+        try:
+            with open(os.path.join(dir_path, GITIGNORE), 'r', encoding='utf-8', errors='ignore') as f:
+                return self.with_rules(f.readlines(), dir_path)
+        except OSError as e:
+            logging.warning(f"无法读取 {GITIGNORE} {dir_path}: {e}")
+            return self
+
+    def is_ignored(self, path, is_dir):
+        for rule_set in reversed(self.rule_sets):
+            result = rule_set.match(path, is_dir)
+            if result is not None:
+                return result
+        return False
+
+
+def build_matcher(base, patterns=None, extra_patterns=None):
+    """为一个扫描根目录创建规则：全局规则和勾选项自己的规则都以该目录为根"""
+    return IgnoreMatcher().with_rules(patterns, base).with_rules(extra_patterns, base)
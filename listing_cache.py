@@ -0,0 +1,150 @@
+"""
+内存中的目录列表缓存
+
+界面展开、跳转、刷新时反复读取同一批目录，这里按目录路径缓存 scandir 的结果，
+每次使用前比较目录的 mtime_ns (一次 stat)，目录有增删改名时重新读取。
+缓存按条目总数做 LRU 淘汰，避免打开过大量目录后占用过多内存。
+
+probe 判断子目录是否有内容 (决定是否显示展开箭头) 时，条目不多的目录顺便整个读入缓存，
+接下来展开它时不必再读一次；条目很多的目录只读开头一批。
+
+Prefetcher 在一个低优先级的后台线程中预先读取接下来可能展开的目录 (刚展开节点中条目较多、
+probe 没有读全的子目录，跳转路径的各级上级)，新的请求会取代尚未处理的旧请求。
+"""
+import os
+import time
+import logging
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+import dir_index
+
+# 缓存中最多保留的目录条目总数
+MAX_CACHED_ENTRIES = 200000
+# 每次预读的请求最多包含的目录数
+MAX_PREFETCH = 256
+# probe 最多读取的条目数，不超过时整个列表放入缓存
+PROBE_LISTING_LIMIT = 1024
+
+
+class ListingCache:
+    """线程安全的 LRU 目录列表缓存，index 为 dir_index.DirIndex (可为 None)，未命中时经由它读取"""
+
+    def __init__(self, max_entries=MAX_CACHED_ENTRIES, index=None):
+        self.max_entries = max_entries
+        self.index = index
+        self.lock = threading.Lock()
+        self.listings = OrderedDict()  # {path: (mtime_ns, entries)}
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, mtime_ns):
+        """返回 mtime 一致的缓存列表，没有时返回 None"""
+        with self.lock:
+            cached = self.listings.get(path)
+            if cached is None or cached[0] != mtime_ns:
+                return None
+            self.listings.move_to_end(path)
+            return cached[1]
+
+    def scandir(self, path):
+        """返回目录条目列表，读取失败时抛出 OSError，与 os.scandir 一致"""
+        st = os.stat(path)
+        entries = self.get(path, st.st_mtime_ns)
+        if entries is not None:
+            self.hits += 1
+            return entries
+
+        self.misses += 1
+        if self.index is not None:
+            entries = self.index.scandir(path)
+        else:
+            with os.scandir(path) as it:
+                entries = list(it)
+        # 刚修改过的目录可能在同一时间戳内再次变化，与目录索引一样暂不缓存
+        if time.time_ns() - st.st_mtime_ns >= dir_index.RACY_WINDOW_NS:
+            self._put(path, st.st_mtime_ns, entries)
+        return entries
+
+    def probe(self, path, st=None, limit=PROBE_LISTING_LIMIT):
+        """
+        目录是否有内容，st 为目录的 os.stat 结果 (可省略)；读取失败时抛出 OSError
+
+        已缓存时直接回答；否则最多读取 limit + 1 个条目，读全了就放入缓存。
+        """
+        if st is None:
+            st = os.stat(path)
+        entries = self.get(path, st.st_mtime_ns)
+        if entries is not None:
+            self.hits += 1
+            return bool(entries)
+        with os.scandir(path) as it:
+            entries = list(itertools.islice(it, limit + 1))
+        if len(entries) <= limit and time.time_ns() - st.st_mtime_ns >= dir_index.RACY_WINDOW_NS:
+            self._put(path, st.st_mtime_ns, entries)
+        return bool(entries)
+
+    def is_cached(self, path):
+        with self.lock:
+            return path in self.listings
+
+    def _put(self, path, mtime_ns, entries):
+        if len(entries) > self.max_entries:
+            return
+        with self.lock:
+            old = self.listings.pop(path, None)
+            if old is not None:
+                self.total -= len(old[1])
+            self.listings[path] = (mtime_ns, entries)
+            self.total += len(entries)
+            while self.total > self.max_entries:
+                _, (_, evicted) = self.listings.popitem(last=False)
+                self.total -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.listings.clear()
+            self.total = 0
+
+
+class Prefetcher:
+    """在后台线程中按请求预读目录，读取之间让出 CPU，不与前台加载争抢"""
+
+    def __init__(self, cache, pause=0.005):
+        self.cache = cache
+        self.pause = pause
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self.thread.start()
+
+    def request(self, paths):
+        """用新的目录列表取代尚未处理的预读请求，已缓存的目录直接跳过"""
+        paths = [path for path in paths if not self.cache.is_cached(path)][:MAX_PREFETCH]
+        with self.cond:
+            self.pending.clear()
+            self.pending.extend(paths)
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                path = self.pending.popleft()
+            try:
+                self.cache.scandir(path)
+            except OSError as e:
+                logging.debug(f"预读目录失败 {path}: {e}")
+            time.sleep(self.pause)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.pending.clear()
+            self.cond.notify()
@@ -0,0 +1,1167 @@
+"""
+文件合并引擎 (无界面版)
+
+从 DirectorySelectorApp 中剥离出的扫描、合并、差异对比与应用逻辑，
+不依赖 tkinter，可在 Linux 构建机、cron 或 CI 中直接调用。
+
+命令行用法:
+    python -m merge_engine merge --output ./out
+    python -m merge_engine merge --output ./out --grep SymbolName
+    python -m merge_engine grep "def .*_cache" ./src -r -E
+    python -m merge_engine diff merged_files_20240101_120000.txt
+    python -m merge_engine apply merged_files_20240101_120000.txt --yes
+"""
+import os
+import sys
+import json
+import logging
+import datetime
+import argparse
+import codecs
+import difflib
+import functools
+import hashlib
+import io
+import itertools
+import mmap
+import re
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import content_grep
+import dir_index
+import fs_scan
+import ignore_rules
+import merge_index
+import selection_store
+
+CONFIG_FILE = "config.json"
+# 增量合并使用的文件指纹缓存，与 config.json 放在同一目录
+CACHE_FILE = "merge_cache.json"
+CACHE_VERSION = 1
+
+# 合并文件中每个文件块的分隔线
+SEPARATOR = "=" * 50
+
+# 分块读写的块大小
+CHUNK_SIZE = 1024 * 1024
+# 内核态拷贝每次调用的字节数
+KERNEL_COPY_SIZE = 64 * 1024 * 1024
+
+# 合并文件中的块标题：分隔线 / FILE: 路径 / 分隔线 / 空行，兼容被编辑器改成 CRLF 的文件。
+# 增量文件中的 DELETED 块只有标题没有内容。标题前的换行连同 \r 一起匹配，块尾才是完整的 \r\n。
+_HEADER_RE = re.compile(rb'(?:^|\r?\n)={50}\r?\n(FILE|DELETED): ([^\r\n]*)\r?\n={50}\r?\n\r?\n')
+
+# 预读结果中表示“直接复用上一次输出中的文件块”的标记
+_REUSE = object()
+# 已知未变化、不再 stat 的文件沿用指纹缓存中记录的大小和修改时间
+_CachedStat = namedtuple("_CachedStat", ["st_size", "st_mtime_ns"])
+
+DEFAULT_FILE_TYPES = {
+    "代码文件": [".py", ".c", ".cpp", ".h", ".java", ".js", ".ts", ".html", ".css", ".php", ".go", ".rs", ".sql", ".sh", ".bat", ".cs"],
+    "文档文件": [".txt", ".md", ".csv", ".rst", ".log"],
+    "配置文件": [".json", ".xml", ".yaml", ".yml", ".ini", ".conf", ".toml", ".env"],
+    "日志文件": [".log", ".out", ".err"]
+}
+
+# 合并相关的可调参数，保存在 config.json 的 "merge" 小节
+DEFAULT_MERGE_SETTINGS = {
+    "workers": 8,  # 预读线程数，1 表示逐个顺序读取
+    "max_bytes_in_flight": 64 * 1024 * 1024,  # 已预读但尚未写出的字节上限
+    "incremental": True,  # 复用上一次输出中未变化的文件块
+    "emit_delta": False,  # 额外生成只含变化文件的增量文件 (需开启 incremental)
+    "diff_workers": None,  # 差异对比的进程数，null 表示等于 CPU 核数
+    "diff_batch_size": 64,  # 每个进程任务包含的文件块数
+    "grep_workers": None,  # 内容搜索的进程数，null 表示等于 CPU 核数
+    "shard_max_bytes": None,  # 分片输出：每个分片的字节数上限，null 表示不分片
+    "shard_max_tokens": None,  # 分片输出：每个分片估算的 token 数上限，null 表示不限
+    "bytes_per_token": 4,  # 估算 token 数时每个 token 对应的字节数
+    "shard_workers": 4,  # 并发写出分片的线程数
+    "apply_workers": 8,  # 批量写回原文件的线程数
+    "scan_workers": fs_scan.DEFAULT_SCAN_WORKERS,  # 并发扫描目录的线程数
+    "follow_symlinks": False,  # 扫描时是否进入指向目录的符号链接
+    "dir_index": True  # 使用 config.json 旁的目录索引，跳过未变化目录的重新列出
+}
+
+# 扫描时的排除规则 (gitignore 语法，见 ignore_rules)，保存在 config.json 的 "exclude" 小节；
+# 单个勾选目录还可以在 selection 规则中用 "exclude" 列表追加自己的规则
+DEFAULT_EXCLUDE_SETTINGS = {
+    "patterns": list(ignore_rules.DEFAULT_EXCLUDE_PATTERNS),
+    "use_gitignore": True  # 遵循扫描途中遇到的 .gitignore
+}
+
+
+def default_config():
+    """返回默认配置"""
+    return {
+        "file_types": {k: list(v) for k, v in DEFAULT_FILE_TYPES.items()},
+        # 勾选规则 (见 selection_store): {path: {"selected": bool, "recursive": bool, "exclude": [规则] (可选)}}
+        "selection": {},
+        "jump_path": "",
+        "search_query": "",
+        "merge": dict(DEFAULT_MERGE_SETTINGS),
+        "tree_page_size": 1000,  # 界面中一个目录一次最多显示的条目数，其余通过“显示更多”加载
+        "assume_expandable": False,  # 界面中不预先检查子目录是否为空，一律显示展开箭头
+        "exclude": {k: (list(v) if isinstance(v, list) else v) for k, v in DEFAULT_EXCLUDE_SETTINGS.items()}
+    }
+
+
+def load_config(config_path=CONFIG_FILE):
+    """读取配置文件，缺失的字段使用默认值补齐；文件不存在时返回 None"""
+    if not os.path.exists(config_path):
+        return None
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    merged = default_config()
+    # 设置小节按键合并，旧配置文件缺少的新参数使用默认值
+    merged["merge"].update(config.pop("merge", {}))
+    merged["exclude"].update(config.pop("exclude", {}))
+    # 旧版逐条保存的 selected_states 迁移为规则
+    states = config.pop("selected_states", None)
+    if states is not None and "selection" not in config:
+        config["selection"] = selection_store.SelectionStore.from_states(states).to_dict()
+    merged.update(config)
+    return merged
+
+
+def save_config(config, config_path=CONFIG_FILE):
+    """保存配置到文件：先写临时文件再替换，中途退出不会留下写了一半的 config.json"""
+    tmp_path = config_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config_path)
+
+
+class ConfigWriter:
+    """
+    在后台线程写出配置文件
+
+    submit 只记录最新提交的一份配置，后台线程序列化后原子写出；写出期间再次提交的配置
+    合并为下一次写出，不会排队写多次。提交的配置在写出前不能再被修改，调用方需传入副本。
+    """
+
+    def __init__(self, config_path=CONFIG_FILE):
+        self.config_path = config_path
+        self._cond = threading.Condition()
+        self._pending = None
+        self._writing = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, config):
+        with self._cond:
+            self._pending = config
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                config, self._pending = self._pending, None
+                self._writing = True
+            try:
+                save_config(config, self.config_path)
+            except Exception as e:
+                logging.error(f"保存配置文件失败: {e}")
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """等待已提交的配置全部写出，超时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending is None and not self._writing, timeout)
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+def get_allowed_exts(file_types, categories=None):
+    """根据启用的分类汇总允许的后缀名，categories 为 None 表示全部分类"""
+    allowed_exts = set()
+    for category, exts in file_types.items():
+        if categories is None or category in categories:
+            allowed_exts.update(exts)
+    return allowed_exts
+
+
+def collect_selection(selection, allowed_exts,
+                      workers=DEFAULT_MERGE_SETTINGS["scan_workers"], follow_symlinks=False,
+                      exclude=None, dir_index=None, scanned_dirs=None):
+    """
+    按勾选规则树 (selection_store.SelectionStore) 扫描，返回需要合并的文件路径集合
+
+    从未在界面中展开过的目录同样按规则扫描；其余参数与 collect_files 相同。
+    """
+    exclude = exclude or {}
+    return fs_scan.scan_selection(selection, allowed_exts,
+                                  workers=workers, follow_symlinks=follow_symlinks,
+                                  exclude_patterns=exclude.get("patterns"),
+                                  use_gitignore=exclude.get("use_gitignore", False),
+                                  dir_index=dir_index, scanned_dirs=scanned_dirs)
+
+
+def collect_files(selected_files, selected_dirs, allowed_exts,
+                  workers=DEFAULT_MERGE_SETTINGS["scan_workers"], follow_symlinks=False,
+                  exclude=None, selection_rules=None, dir_index=None, scanned_dirs=None):
+    """
+    扫描勾选的文件和目录，返回需要合并的文件路径集合 (并发扫描，见 fs_scan)
+
+    exclude 为 config.json 的 "exclude" 小节，None 表示不排除任何路径；
+    dir_index 为 dir_index.DirIndex 实例，None 表示不使用目录索引；
+    scanned_dirs 为集合时记录扫描过的所有目录 (监视模式据此添加监视)。
+    """
+    exclude = exclude or {}
+    return fs_scan.scan_files(selected_files, selected_dirs, allowed_exts,
+                              workers=workers, follow_symlinks=follow_symlinks,
+                              exclude_patterns=exclude.get("patterns"),
+                              use_gitignore=exclude.get("use_gitignore", False),
+                              selection_rules=selection_rules, dir_index=dir_index, scanned_dirs=scanned_dirs)
+
+
+class _ByteBudget:
+    """限制已预读到内存但尚未被写入线程取走的字节数"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.next_index = 0  # 写入线程正在等待的文件序号
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def acquire(self, index, size):
+        with self.cond:
+            # 写入线程正在等待的文件总是放行，否则所有预读线程可能互相等待
+            while (not self.closed and index != self.next_index
+                   and self.used > 0 and self.used + size > self.limit):
+                self.cond.wait()
+            self.used += size
+
+    def release(self, size):
+        with self.cond:
+            self.used -= size
+            self.next_index += 1
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+def _ensure_utf8(data):
+    """合法 UTF-8 原样返回，否则按旧逻辑有损解码 (忽略非法字节) 后重新编码"""
+    if data.isascii():
+        return data
+    try:
+        data.decode('utf-8')
+        return data
+    except UnicodeDecodeError:
+        return data.decode('utf-8', errors='ignore').encode('utf-8')
+
+
+def _content_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _content_hash_of(data):
+    hasher = _content_hash()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _fingerprint_matches(st, cached):
+    """文件大小与修改时间均未变化时认为内容未变"""
+    return cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns
+
+
+def _prefetch_file(fpath, index, budget, cached):
+    """在预读线程中读取并校验文件，返回 (content, digest, stat, 占用字节数, error)"""
+    charged = 0
+    try:
+        with open(fpath, 'rb') as infile:
+            st = os.fstat(infile.fileno())
+            if _fingerprint_matches(st, cached):
+                return _REUSE, cached[2], st, 0, None
+            charged = st.st_size
+            budget.acquire(index, charged)
+            content = _ensure_utf8(infile.read())
+            return content, _content_hash_of(content), st, charged, None
+    except Exception as e:
+        return None, None, None, charged, e
+
+
+def _trusted_reuse(fpath, cached_files):
+    cached = cached_files[fpath]
+    return _REUSE, cached[2], _CachedStat(cached[0], cached[1])
+
+
+def _iter_prefetched(sorted_paths, workers, max_bytes_in_flight, cached_files, trusted=frozenset()):
+    """
+    用线程池并行预读文件内容，按原顺序逐个产出 (path, content, digest, stat, error)
+
+    trusted 中的文件已知未变化，不再打开，直接复用上一次输出中的文件块。
+    """
+    budget = _ByteBudget(max_bytes_in_flight)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="merge-read")
+    try:
+        pending = deque(
+            (fpath, None if fpath in trusted else
+             executor.submit(_prefetch_file, fpath, i, budget, cached_files.get(fpath)))
+            for i, fpath in enumerate(sorted_paths)
+        )
+        while pending:
+            # 取出后即丢弃 future 的引用，已写出的内容可以及时释放
+            fpath, future = pending.popleft()
+            if future is None:
+                content, digest, st = _trusted_reuse(fpath, cached_files)
+                charged, error = 0, None
+            else:
+                content, digest, st, charged, error = future.result()
+            try:
+                yield fpath, content, digest, st, error
+            finally:
+                budget.release(charged)
+    finally:
+        budget.close()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_sequential(sorted_paths, cached_files, trusted=frozenset()):
+    """顺序模式：只做 stat，内容在写入时再分块读取；trusted 中的文件连 stat 也省去"""
+    for fpath in sorted_paths:
+        if fpath in trusted:
+            yield (fpath, *_trusted_reuse(fpath, cached_files), None)
+            continue
+        try:
+            st = os.stat(fpath)
+        except Exception as e:
+            yield fpath, None, None, None, e
+            continue
+        if _fingerprint_matches(st, cached_files.get(fpath)):
+            yield fpath, _REUSE, cached_files[fpath][2], st, None
+        else:
+            yield fpath, None, None, st, None
+
+
+def _write_header(outfile, fpath, kind="FILE"):
+    outfile.write(f"\n{SEPARATOR}\n{kind}: {fpath}\n{SEPARATOR}\n\n".encode('utf-8'))
+
+
+def _is_utf8(infile, hasher):
+    """逐块校验文件是否为合法 UTF-8 并计算哈希，纯 ASCII 的块无需解码"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            block = infile.read(CHUNK_SIZE)
+            if not block:
+                decoder.decode(b"", final=True)
+                return True
+            hasher.update(block)
+            # 上一块末尾残留半个多字节字符时，必须交给解码器拼接校验
+            if decoder.getstate()[0] or not block.isascii():
+                decoder.decode(block)
+    except UnicodeDecodeError:
+        return False
+
+
+def _copy_range(in_fd, outfile, offset, length):
+    """把 in_fd 中 [offset, offset + length) 的字节原样追加到输出，优先使用内核态拷贝"""
+    outfile.flush()
+    out_fd = outfile.fileno()
+    end = offset + length
+    kernel_copies = []
+    if hasattr(os, 'copy_file_range'):
+        kernel_copies.append(lambda pos, count: os.copy_file_range(in_fd, out_fd, count, pos))
+    if hasattr(os, 'sendfile'):
+        kernel_copies.append(lambda pos, count: os.sendfile(out_fd, in_fd, pos, count))
+    try:
+        for kernel_copy in kernel_copies:
+            try:
+                while offset < end:
+                    n = kernel_copy(offset, min(end - offset, KERNEL_COPY_SIZE))
+                    if not n:
+                        # 部分文件系统 (FUSE、网络、overlay) 不报错但返回 0，换下一种方式；
+                        # 源文件是否真的被截断由最后的 os.read 判断
+                        break
+                    offset += n
+                if offset >= end:
+                    return
+            except OSError:
+                # 文件系统不支持时换下一种方式，从已拷贝的位置继续
+                continue
+    finally:
+        # 绕过了缓冲区直接写入 fd，需要同步输出文件的位置
+        outfile.seek(0, os.SEEK_END)
+
+    os.lseek(in_fd, offset, os.SEEK_SET)
+    while offset < end:
+        block = os.read(in_fd, min(CHUNK_SIZE, end - offset))
+        if not block:
+            break
+        outfile.write(block)
+        offset += len(block)
+
+
+def _copy_lossy(infile, outfile, hasher):
+    """非法 UTF-8 文件：忽略非法字节解码后重新编码写出"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    while True:
+        block = infile.read(CHUNK_SIZE)
+        data = decoder.decode(block, final=not block).encode('utf-8')
+        hasher.update(data)
+        outfile.write(data)
+        if not block:
+            break
+
+
+def _copy_file(fpath, outfile):
+    """合法 UTF-8 文件直接按字节拷贝，否则走有损解码；返回写出内容的哈希"""
+    # 不带缓冲打开，seek 与内核态拷贝直接作用于文件描述符的偏移
+    with open(fpath, 'rb', buffering=0) as infile:
+        hasher = _content_hash()
+        if _is_utf8(infile, hasher):
+            _copy_range(infile.fileno(), outfile, 0, os.fstat(infile.fileno()).st_size)
+        else:
+            infile.seek(0)
+            hasher = _content_hash()
+            _copy_lossy(infile, outfile, hasher)
+        return hasher.hexdigest()
+
+
+def cache_path_for(config_path=CONFIG_FILE):
+    """指纹缓存文件与 config.json 放在同一目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), CACHE_FILE)
+
+
+def load_merge_cache(cache_path):
+    """
+    读取上一次合并留下的指纹缓存
+
+    返回 {"output", "output_size", "output_mtime_ns", "files": {path: [size, mtime_ns, hash, offset, length]}}，
+    文件不存在或损坏时返回空缓存。offset/length 指向上一次输出文件中该文件内容的字节范围。
+    """
+    empty = {"output": None, "output_size": None, "output_mtime_ns": None, "files": {}}
+    if not cache_path or not os.path.exists(cache_path):
+        return empty
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get("version") != CACHE_VERSION:
+            return empty
+        return cache
+    except Exception as e:
+        logging.warning(f"指纹缓存无法读取，将完整合并: {e}")
+        return empty
+
+
+def _save_merge_cache(cache_path, output_path, files):
+    st = os.stat(output_path)
+    cache = {
+        "version": CACHE_VERSION,
+        "output": os.path.abspath(output_path),
+        "output_size": st.st_size,
+        "output_mtime_ns": st.st_mtime_ns,
+        "files": files
+    }
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+
+def _open_previous_output(cache):
+    """上一次的输出文件仍然存在且未被改动时才能复用其中的文件块"""
+    output = cache.get("output")
+    if not output:
+        return None
+    try:
+        previous = open(output, 'rb', buffering=0)
+    except OSError:
+        return None
+    st = os.fstat(previous.fileno())
+    if st.st_size != cache["output_size"] or st.st_mtime_ns != cache["output_mtime_ns"]:
+        previous.close()
+        return None
+    return previous
+
+
+def _write_delta(delta_path, output_path, sorted_paths, files, cached_files):
+    """把新增和修改过的文件块从新输出中拷贝到增量文件，并列出已删除的文件"""
+    counts = {"added": 0, "changed": 0, "deleted": 0}
+    with open(output_path, 'rb', buffering=0) as merged, open(delta_path, 'wb') as outfile:
+        for fpath in sorted_paths:
+            entry = files.get(fpath)
+            if entry is None:
+                continue
+            cached = cached_files.get(fpath)
+            if cached is None:
+                counts["added"] += 1
+            elif cached[2] != entry[2]:
+                counts["changed"] += 1
+            else:
+                continue
+            _write_header(outfile, fpath)
+            _copy_range(merged.fileno(), outfile, entry[3], entry[4])
+            outfile.write(b"\n")
+        for fpath in sorted(set(cached_files) - set(files)):
+            _write_header(outfile, fpath, kind="DELETED")
+            counts["deleted"] += 1
+    return counts
+
+
+def merge_files(file_paths, output_directory, progress_callback=None,
+                workers=1, max_bytes_in_flight=DEFAULT_MERGE_SETTINGS["max_bytes_in_flight"],
+                cache_path=None, delta=False, output_name=None, changed_paths=None):
+    """
+    把文件按路径排序后合并为一个 merged_files_<时间戳>.txt
+
+    合法 UTF-8 的文件按字节原样写入 (换行符不做转换)，其余文件忽略非法字节后写入。
+    workers > 1 时由线程池预读并校验文件内容，当前线程作为唯一的写入者按排序顺序写出，
+    预读的内容总量受 max_bytes_in_flight 限制 (单个超限的文件仍会被读取)。
+    指定 cache_path 时启用增量合并：大小与 mtime_ns 未变的文件直接从上一次的输出中
+    拷贝文件块，不再读取原文件；delta=True 时额外生成只包含新增、修改和删除文件的
+    merged_delta_<时间戳>.txt。
+    progress_callback(current, total) 在每个文件处理后调用。
+    指定 output_name 时输出到固定文件名 (监视模式的滚动输出)。输出总是先写临时文件，完成后替换。
+    changed_paths 为已知发生过变化的文件集合 (监视模式由文件事件得到)：指定时其余在指纹缓存中的
+    文件不再 stat 和打开，直接复用文件块，耗时只与变化的文件数和输出大小有关。
+    同时在输出文件旁写出偏移索引 (见 merge_index)。
+    返回 {"output_path", "output_filename", "index_path", "success_count", "fail_count",
+    "reused_count", "delta_path", "added", "changed", "deleted"}，输出文件无法写入时抛出异常。
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = output_name or f"merged_files_{timestamp}.txt"
+    output_path = os.path.join(output_directory, output_filename)
+    # 上一次的输出可能与本次同名 (固定文件名，或同一秒内再次合并) 且正被复用，
+    # 总是先写到临时文件，完成后再替换
+    write_path = output_path + ".tmp"
+
+    success_count = 0
+    fail_count = 0
+    reused_count = 0
+    sorted_paths = sorted(list(file_paths))
+    total_count = len(sorted_paths)
+
+    cache = load_merge_cache(cache_path)
+    cached_files = cache["files"]
+    previous = _open_previous_output(cache)
+    # 上一次的输出不可用时只能比较指纹，不能复用文件块
+    reusable = cached_files if previous else {}
+    files = {}  # 本次输出的指纹: {path: [size, mtime_ns, hash, offset, length]}
+
+    trusted = frozenset()
+    if changed_paths is not None and reusable:
+        changed = {os.path.abspath(p) for p in changed_paths}
+        trusted = frozenset(p for p in sorted_paths if p in reusable and os.path.abspath(p) not in changed)
+
+    if workers and workers > 1:
+        contents = _iter_prefetched(sorted_paths, workers, max_bytes_in_flight, reusable, trusted)
+    else:
+        contents = _iter_sequential(sorted_paths, reusable, trusted)
+
+    try:
+        with open(write_path, 'wb') as outfile:
+            for i, (fpath, content, digest, st, error) in enumerate(contents):
+                try:
+                    _write_header(outfile, fpath)
+                    start = outfile.tell()
+                    if error is not None:
+                        raise error
+                    if content is _REUSE:
+                        cached = reusable[fpath]
+                        _copy_range(previous.fileno(), outfile, cached[3], cached[4])
+                        reused_count += 1
+                    elif content is None:
+                        digest = _copy_file(fpath, outfile)
+                    else:
+                        outfile.write(content)
+                    files[fpath] = [st.st_size, st.st_mtime_ns, digest, start, outfile.tell() - start]
+                    outfile.write(b"\n")
+                    success_count += 1
+                except Exception as e:
+                    logging.error(f"读取失败 {fpath}: {e}")
+                    fail_count += 1
+
+                if progress_callback:
+                    progress_callback(i + 1, total_count)
+    except BaseException:
+        if os.path.exists(write_path):
+            os.remove(write_path)
+        raise
+    finally:
+        # 出错提前退出时停止预读线程
+        contents.close()
+        if previous:
+            previous.close()
+    os.replace(write_path, output_path)
+
+    result = {
+        "output_path": output_path,
+        "output_filename": output_filename,
+        "index_path": None,
+        "success_count": success_count,
+        "fail_count": fail_count,
+        "reused_count": reused_count,
+        "delta_path": None,
+        "added": 0,
+        "changed": 0,
+        "deleted": 0
+    }
+
+    try:
+        result["index_path"] = merge_index.write_index(output_path, files)
+    except Exception as e:
+        logging.error(f"写入合并索引失败: {e}")
+
+    if cache_path:
+        if delta:
+            result["delta_path"] = os.path.join(output_directory, f"merged_delta_{timestamp}.txt")
+            result.update(_write_delta(result["delta_path"], output_path, sorted_paths, files, cached_files))
+        try:
+            _save_merge_cache(cache_path, output_path, files)
+        except Exception as e:
+            logging.error(f"保存指纹缓存失败: {e}")
+
+    return result
+
+
+def iter_block_spans(merged_file_path):
+    """
+    流式扫描合并文件，逐个产出 (kind, path, start, end)
+
+    kind 为 "FILE" 或 "DELETED"，[start, end) 是文件块内容在合并文件中的字节范围，
+    已去掉合并时在内容末尾追加的那个换行。文件通过 mmap 映射，只用正则定位块标题，
+    耗时与文件大小成线性关系，不会把整个文件读入内存。
+    """
+    with open(merged_file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            headers = _HEADER_RE.finditer(mm)
+            match = None
+            try:
+                previous = None
+                for match in headers:
+                    if previous:
+                        yield previous[0], previous[1], previous[2], _strip_block_end(mm, previous[2], match.start())
+                    kind = match.group(1).decode('ascii')
+                    path = match.group(2).decode('utf-8', errors='ignore').strip()
+                    previous = (kind, path, match.end())
+                if previous:
+                    yield previous[0], previous[1], previous[2], _strip_block_end(mm, previous[2], len(mm))
+            finally:
+                # 正则迭代器和匹配对象持有 mmap 的缓冲区，关闭 mmap 前需先释放
+                headers = match = None
+
+
+def _strip_block_end(mm, start, end):
+    """去掉合并时追加在内容后的换行 (文件被编辑器改成 CRLF 时为 \\r\\n)"""
+    if end - start >= 2 and mm[end - 2:end] == b"\r\n":
+        return end - 2
+    if end > start and mm[end - 1:end] == b"\n":
+        return end - 1
+    return end
+
+
+def iter_merged_file(merged_file_path):
+    """流式解析合并文件，逐个产出 (path, content)，内存占用以最大的单个文件块为界"""
+    with open(merged_file_path, 'rb') as f:
+        for kind, fpath, start, end in iter_block_spans(merged_file_path):
+            if kind != "FILE":
+                continue
+            f.seek(start)
+            yield fpath, _decode_block(f.read(end - start))
+
+
+def _decode_block(data):
+    """按文本模式读取的规则解码文件块：忽略非法字节并统一换行符"""
+    return data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _iter_diff_tasks(merged_file_path, cache_path=None):
+    """
+    产出需要对比的文件块 (path, start, end, fingerprints)
+
+    fingerprints 是原文件已知的 [(size, mtime_ns, hash)]，来自合并索引和指纹缓存，
+    供子进程在不读取原文件的情况下判断文件块是否变化。
+    合并文件未被改动时只产出原文件发生过变化的块。
+    """
+    index = merge_index.load_index(merged_file_path)
+    indexed = index["files"] if index else {}
+    cached_files = load_merge_cache(cache_path)["files"]
+
+    def fingerprints(fpath):
+        known = []
+        entry = indexed.get(fpath)
+        if entry:
+            known.append((entry["size"], entry["mtime_ns"], entry["hash"]))
+        cached = cached_files.get(fpath)
+        if cached:
+            known.append((cached[0], cached[1], cached[2]))
+        return known
+
+    if index and index["fresh"]:
+        for fpath, entry in indexed.items():
+            if merge_index.source_changed(fpath, entry):
+                yield fpath, entry["offset"], entry["offset"] + entry["length"], fingerprints(fpath)
+    else:
+        for kind, fpath, start, end in iter_block_spans(merged_file_path):
+            if kind == "FILE":
+                yield fpath, start, end, fingerprints(fpath)
+
+
+def _hash_file(fpath):
+    hasher = _content_hash()
+    with open(fpath, 'rb') as f:
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                return hasher.hexdigest()
+            hasher.update(block)
+
+
+def _block_unchanged(fpath, data, fingerprints):
+    """
+    先比较哈希：文件块与原文件内容的哈希相同则无需解码和 difflib
+
+    原文件的大小与 mtime_ns 与某个已知指纹一致时直接使用该指纹的哈希，
+    否则在大小相同时流式计算一次原文件的哈希。返回 False 只表示需要完整对比。
+    """
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return False
+    for size, mtime_ns, digest in fingerprints:
+        if size == st.st_size and mtime_ns == st.st_mtime_ns:
+            return digest == _content_hash_of(data)
+    if st.st_size != len(data):
+        return False
+    return _hash_file(fpath) == _content_hash_of(data)
+
+
+def _has_diff(fpath, new_content):
+    """判断原文件与新内容是否存在差异 (首尾空白不计)"""
+    if not os.path.exists(fpath):
+        logging.warning(f"原文件不存在，跳过对比: {fpath}")
+        return False
+
+    with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
+        old_content = f.read()
+
+    if old_content.strip() == new_content.strip():
+        return False  # 没有变化
+    # 与 unified_diff 是否为空的判断一致
+    return old_content.splitlines() != new_content.splitlines()
+
+
+def _diff_batch(merged_file_path, tasks):
+    """
+    对比一批文件块，在子进程中运行；文件块内容由子进程自己从合并文件读取
+
+    只返回轻量的句柄 {'path', 'merged_path', 'offset', 'length'}，
+    差异内容由 render_diff 在需要时再计算。
+    """
+    results = []
+    with open(merged_file_path, 'rb') as f:
+        for fpath, start, end, fingerprints in tasks:
+            try:
+                f.seek(start)
+                data = f.read(end - start)
+                if _block_unchanged(fpath, data, fingerprints):
+                    continue
+                if _has_diff(fpath, _decode_block(data)):
+                    results.append({'path': fpath, 'merged_path': merged_file_path, 'offset': start, 'length': end - start})
+            except Exception as e:
+                logging.error(f"对比文件出错 {fpath}: {e}")
+    return results
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_diffs(merged_file_path, workers=None, batch_size=DEFAULT_MERGE_SETTINGS["diff_batch_size"],
+               cache_path=None):
+    """
+    对比合并文件与原文件，按文件在合并文件中的顺序逐个产出存在差异的文件
+
+    文件块按 batch_size 分批交给进程池 (workers 为 None 时等于 CPU 核数) 并行对比，
+    结果按顺序流式返回。只有一批任务或 workers == 1 时在当前进程中执行。
+    哈希与原文件一致的文件块直接跳过；cache_path 指向指纹缓存时也用其中的哈希。
+    """
+    batches = _batched(_iter_diff_tasks(merged_file_path, cache_path), batch_size)
+    head = list(itertools.islice(batches, 2))
+    batches = itertools.chain(head, batches)
+    if workers == 1 or len(head) < 2:
+        # 任务很少时启动进程池的开销比对比本身还大
+        for batch in batches:
+            yield from _diff_batch(merged_file_path, batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(functools.partial(_diff_batch, merged_file_path), batches):
+            yield from results
+
+
+def compute_diffs(merged_file_path, workers=None, batch_size=DEFAULT_MERGE_SETTINGS["diff_batch_size"],
+                  cache_path=None):
+    """对比合并文件与原文件，返回存在差异的文件句柄列表 [{'path', 'merged_path', 'offset', 'length'}]"""
+    return list(iter_diffs(merged_file_path, workers, batch_size, cache_path))
+
+
+def iter_new_content(item):
+    """从合并文件中分块读取差异项的新内容，按文本模式的规则解码并统一换行符"""
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(errors='ignore'), translate=True)
+    remaining = item['length']
+    with open(item['merged_path'], 'rb') as f:
+        f.seek(item['offset'])
+        while remaining > 0:
+            block = f.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def read_new_content(item):
+    return "".join(iter_new_content(item))
+
+
+def render_diff(item):
+    """按需计算单个差异项的 unified diff 行"""
+    with open(item['path'], 'r', encoding='utf-8', errors='ignore') as f:
+        old_content = f.read()
+    return list(difflib.unified_diff(
+        old_content.splitlines(), read_new_content(item).splitlines(),
+        fromfile='Original', tofile='Modified',
+        lineterm=''
+    ))
+
+
+def _scan_options(args, config):
+    """根据命令行参数和配置确定扫描范围，返回 collect_selection 的参数；没有勾选任何路径时返回 None"""
+    allowed_exts = get_allowed_exts(config["file_types"], args.types)
+
+    if args.paths:
+        selected_files = [p for p in args.paths if not os.path.isdir(p)]
+        selected_dirs = [(p, args.recursive) for p in args.paths if os.path.isdir(p)]
+        selection = selection_store.SelectionStore.from_roots(*fs_scan.collapse_roots(selected_files, selected_dirs))
+    else:
+        selection = selection_store.SelectionStore.from_dict(config["selection"])
+
+    exclude = config["exclude"]
+    if args.no_exclude:
+        exclude = None
+    elif args.exclude:
+        exclude = dict(exclude, patterns=exclude["patterns"] + args.exclude)
+
+    if not selection.has_selection():
+        return None
+    settings = config["merge"]
+    return {
+        "selection": selection,
+        "allowed_exts": allowed_exts,
+        "workers": settings["scan_workers"],
+        "follow_symlinks": settings["follow_symlinks"],
+        "exclude": exclude
+    }
+
+
+def _collect_paths(args, config, scan_options):
+    index = dir_index.open_index(args.config) if config["merge"]["dir_index"] else None
+    try:
+        return collect_selection(dir_index=index, **scan_options)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def _cmd_merge(args):
+    config = load_config(args.config) or default_config()
+    scan_options = _scan_options(args, config)
+    if scan_options is None:
+        logging.error("没有勾选任何文件或目录")
+        return 1
+
+    settings = config["merge"]
+    file_paths = _collect_paths(args, config, scan_options)
+    if file_paths and args.grep:
+        # 只合并内容匹配的文件
+        try:
+            file_paths = content_grep.filter_files(file_paths, args.grep, regex=args.regex,
+                                                   ignore_case=args.ignore_case, workers=settings["grep_workers"])
+        except ValueError as e:
+            logging.error(str(e))
+            return 1
+    if not file_paths:
+        logging.error("根据当前的筛选条件，未找到任何匹配的文件")
+        return 1
+
+    shard_max_bytes = args.shard_mb * 1024 * 1024 if args.shard_mb else settings["shard_max_bytes"]
+    shard_max_tokens = args.shard_tokens or settings["shard_max_tokens"]
+    if shard_max_bytes or shard_max_tokens:
+        import shard_merge
+
+        # 分片输出不使用指纹缓存与增量文件
+        os.makedirs(args.output, exist_ok=True)
+        result = shard_merge.merge_sharded(
+            file_paths, args.output, max_bytes=shard_max_bytes, max_tokens=shard_max_tokens,
+            bytes_per_token=settings["bytes_per_token"], workers=settings["shard_workers"]
+        )
+        for name in result["shards"]:
+            print(os.path.join(args.output, name))
+        print(result["manifest_path"])
+        logging.info(f"成功合并: {result['success_count']} 个文件，分为 {len(result['shards'])} 个分片, "
+                     f"失败: {result['fail_count']} 个")
+        return 0 if result["fail_count"] == 0 else 2
+
+    workers = args.workers if args.workers is not None else settings["workers"]
+    if args.max_inflight_mb is not None:
+        max_bytes_in_flight = args.max_inflight_mb * 1024 * 1024
+    else:
+        max_bytes_in_flight = settings["max_bytes_in_flight"]
+
+    # 增量文件依赖指纹缓存，关闭缓存时不生成
+    cache_path = cache_path_for(args.config) if settings["incremental"] and not args.no_cache else None
+
+    os.makedirs(args.output, exist_ok=True)
+    result = merge_files(
+        file_paths, args.output, workers=workers, max_bytes_in_flight=max_bytes_in_flight,
+        cache_path=cache_path, delta=args.delta or settings["emit_delta"]
+    )
+    print(result["output_path"])
+    if result["delta_path"]:
+        print(result["delta_path"])
+        logging.info(f"增量文件: 新增 {result['added']}, 修改 {result['changed']}, 删除 {result['deleted']}")
+    logging.info(f"成功合并: {result['success_count']} 个文件 (复用 {result['reused_count']} 个), 失败: {result['fail_count']} 个")
+    return 0 if result["fail_count"] == 0 else 2
+
+
+def _cmd_watch(args):
+    import watch
+
+    config = load_config(args.config) or default_config()
+    scan_options = _scan_options(args, config)
+    if scan_options is None:
+        logging.error("没有勾选任何文件或目录")
+        return 1
+
+    settings = config["merge"]
+    index = dir_index.open_index(args.config) if settings["dir_index"] else None
+
+    def scan(scanned_dirs):
+        return collect_selection(dir_index=index, scanned_dirs=scanned_dirs, **scan_options)
+
+    def on_refresh(result):
+        logging.info(f"已更新 {result['output_path']}: {result['success_count']} 个文件 "
+                     f"(复用 {result['reused_count']} 个), 失败 {result['fail_count']} 个")
+
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        watch.watch(
+            scan, args.output, watch.cache_path_for(args.config), on_refresh=on_refresh,
+            debounce=args.debounce, poll_interval=args.poll_interval, use_inotify=not args.poll,
+            workers=settings["workers"], max_bytes_in_flight=settings["max_bytes_in_flight"]
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if index is not None:
+            index.close()
+    return 0
+
+
+def _cmd_grep(args):
+    config = load_config(args.config) or default_config()
+    scan_options = _scan_options(args, config)
+    if scan_options is None:
+        logging.error("没有勾选任何文件或目录")
+        return 1
+
+    file_paths = _collect_paths(args, config, scan_options)
+    workers = args.workers if args.workers is not None else config["merge"]["grep_workers"]
+    file_count = 0
+    match_count = 0
+    try:
+        for fpath, count in content_grep.iter_grep(file_paths, args.pattern, regex=args.regex,
+                                                   ignore_case=args.ignore_case, workers=workers,
+                                                   max_count=1 if args.files_with_matches else None):
+            file_count += 1
+            match_count += count
+            print(fpath if args.files_with_matches else f"{count}\t{fpath}", flush=True)
+    except ValueError as e:
+        logging.error(str(e))
+        return 1
+    logging.info(f"在 {len(file_paths)} 个文件中搜索，{file_count} 个文件匹配"
+                 + ("" if args.files_with_matches else f"，共 {match_count} 处"))
+    return 0 if file_count else 1
+
+
+def _diff_options(args):
+    settings = (load_config(args.config) or default_config())["merge"]
+    workers = args.workers if args.workers is not None else settings["diff_workers"]
+    return {"workers": workers, "batch_size": settings["diff_batch_size"], "cache_path": cache_path_for(args.config)}
+
+
+def _cmd_diff(args):
+    count = 0
+    for item in iter_diffs(args.merged_file, **_diff_options(args)):
+        count += 1
+        if args.stat:
+            print(item['path'])
+        else:
+            print(f"文件: {item['path']}")
+            for line in render_diff(item):
+                print(line)
+    logging.info(f"检测到 {count} 个文件存在差异")
+    return 0
+
+
+def _cmd_apply(args):
+    import batch_apply
+
+    diff_results = compute_diffs(args.merged_file, **_diff_options(args))
+    if not diff_results:
+        logging.info("未检测到任何文件差异。")
+        return 0
+    for item in diff_results:
+        print(item['path'])
+    if not args.yes:
+        logging.error(f"共 {len(diff_results)} 个文件待应用，加上 --yes 确认写回")
+        return 1
+    settings = (load_config(args.config) or default_config())["merge"]
+    result = batch_apply.apply_batch(
+        diff_results,
+        workers=settings["apply_workers"],
+        journal_root=batch_apply.journal_root_for(args.config),
+        check_mtime=not args.force
+    )
+    logging.info(f"批量应用完成！成功: {len(result['applied'])} 冲突: {len(result['conflicts'])} "
+                 f"失败: {len(result['failed'])}")
+    if result["journal_path"]:
+        logging.info(f"日志: {result['journal_path']}")
+    return 0 if not result["conflicts"] and not result["failed"] else 2
+
+
+def _cmd_journal(args):
+    import batch_apply
+
+    journal_path = args.journal
+    if not journal_path:
+        status = batch_apply.UNFINISHED_STATUSES if args.command == "resume" else None
+        journal_path = batch_apply.latest_journal(batch_apply.journal_root_for(args.config), status)
+    if not journal_path:
+        logging.error("没有找到应用日志")
+        return 1
+    if args.command == "resume":
+        success, failed = batch_apply.resume(journal_path)
+    else:
+        try:
+            success, failed = batch_apply.rollback(journal_path, force=args.force)
+        except ValueError as e:
+            logging.error(f"{e}\n加上 --force 仍然从备份恢复 (会丢失这些修改)")
+            return 1
+    logging.info(f"{journal_path}: 成功 {success} 失败 {failed}")
+    return 0 if failed == 0 else 2
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m merge_engine", description="文件合并工具 (命令行版)")
+    parser.add_argument("--config", default=CONFIG_FILE, help="配置文件路径 (默认: config.json)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出调试日志")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_scan_arguments(p):
+        p.add_argument("paths", nargs="*", help="要合并的文件或目录；省略时使用配置中的勾选规则 (selection)")
+        p.add_argument("-o", "--output", default=str(os.path.join(os.path.expanduser("~"), "Downloads")), help="输出目录")
+        p.add_argument("-t", "--types", nargs="+", metavar="CATEGORY", help="启用的文件类型分类 (默认全部)")
+        p.add_argument("-r", "--recursive", action="store_true", help="命令行指定的目录递归扫描子目录")
+        p.add_argument("-x", "--exclude", action="append", metavar="PATTERN",
+                       help="追加排除规则 (gitignore 语法，可重复)，以 ! 开头表示重新包含")
+        p.add_argument("--no-exclude", action="store_true", help="不使用任何排除规则和 .gitignore")
+
+    def add_grep_arguments(p):
+        p.add_argument("-E", "--regex", action="store_true", help="搜索内容按正则表达式解释")
+        p.add_argument("-i", "--ignore-case", action="store_true", help="不区分大小写")
+
+    p_merge = sub.add_parser("merge", help="合并选中的文件")
+    add_scan_arguments(p_merge)
+    p_merge.add_argument("-j", "--workers", type=int, help="预读线程数，1 为顺序读取 (默认取配置 merge.workers)")
+    p_merge.add_argument("--max-inflight-mb", type=int, help="预读内容占用内存上限，单位 MB (默认取配置 merge.max_bytes_in_flight)")
+    p_merge.add_argument("--no-cache", action="store_true", help="忽略指纹缓存，完整读取所有文件")
+    p_merge.add_argument("--delta", action="store_true", help="额外生成只包含新增、修改和删除文件的增量文件")
+    p_merge.add_argument("--grep", metavar="PATTERN", help="只合并内容包含 PATTERN 的文件")
+    p_merge.add_argument("--shard-mb", type=float, help="按大小分片输出，每个分片最多多少 MB (默认取配置 merge.shard_max_bytes)")
+    p_merge.add_argument("--shard-tokens", type=int, help="按估算的 token 数分片输出 (默认取配置 merge.shard_max_tokens)")
+    add_grep_arguments(p_merge)
+    p_merge.set_defaults(func=_cmd_merge)
+
+    p_grep = sub.add_parser("grep", help="在选中的文件中搜索内容，列出每个文件的匹配次数")
+    p_grep.add_argument("pattern", help="搜索的字符串 (加 -E 时为正则)")
+    add_scan_arguments(p_grep)
+    add_grep_arguments(p_grep)
+    p_grep.add_argument("-l", "--files-with-matches", action="store_true", help="只列出匹配的文件，每个文件找到一处即停止")
+    p_grep.add_argument("-j", "--workers", type=int, help="搜索进程数 (默认取配置 merge.grep_workers)")
+    p_grep.set_defaults(func=_cmd_grep)
+
+    p_watch = sub.add_parser("watch", help="监视选中的文件，变化后自动增量更新滚动输出文件")
+    add_scan_arguments(p_watch)
+    p_watch.add_argument("--debounce", type=float, default=0.5, help="变化停止多少秒后再更新 (默认 0.5)")
+    p_watch.add_argument("--poll", action="store_true", help="不使用 inotify，定时轮询文件状态")
+    p_watch.add_argument("--poll-interval", type=float, default=2.0, help="轮询间隔秒数 (默认 2)")
+    p_watch.set_defaults(func=_cmd_watch)
+
+    p_diff = sub.add_parser("diff", help="对比合并文件与原文件")
+    p_diff.add_argument("merged_file")
+    p_diff.add_argument("--stat", action="store_true", help="只列出有差异的文件")
+    p_diff.add_argument("-j", "--workers", type=int, help="对比进程数 (默认取配置 merge.diff_workers)")
+    p_diff.set_defaults(func=_cmd_diff)
+
+    p_apply = sub.add_parser("apply", help="把合并文件中的修改写回原文件")
+    p_apply.add_argument("merged_file")
+    p_apply.add_argument("-y", "--yes", action="store_true", help="确认写回，不加时只列出待应用文件")
+    p_apply.add_argument("-j", "--workers", type=int, help="对比进程数 (默认取配置 merge.diff_workers)")
+    p_apply.add_argument("--force", action="store_true", help="原文件在合并后被修改过也照样覆盖")
+    p_apply.set_defaults(func=_cmd_apply)
+
+    p_rollback = sub.add_parser("rollback", help="撤销一次批量应用 (默认最近一次)")
+    p_rollback.add_argument("journal", nargs="?", help="journal.json 路径")
+    p_rollback.add_argument("--force", action="store_true", help="原文件在写回后被修改过也照样恢复")
+    p_rollback.set_defaults(func=_cmd_journal)
+
+    p_resume = sub.add_parser("resume", help="继续完成中断的批量应用 (默认最近一次未完成的)")
+    p_resume.add_argument("journal", nargs="?", help="journal.json 路径")
+    p_resume.set_defaults(func=_cmd_journal)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
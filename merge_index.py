@@ -0,0 +1,93 @@
+"""
+合并文件的旁路偏移索引
+
+每次合并时在 merged_files_<时间戳>.txt 旁写出 merged_files_<时间戳>.txt.idx，
+记录每个文件块内容在合并文件中的字节偏移和长度，以及合并时原文件的大小、
+mtime_ns 和内容哈希。使用方无需解析整个合并文件即可直接定位某个文件块，
+或判断原文件在合并之后是否发生过变化。
+"""
+import os
+import json
+import logging
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+# 索引中每一行的字段顺序
+INDEX_FIELDS = ["path", "offset", "length", "size", "mtime_ns", "hash"]
+
+
+def index_path_for(merged_path):
+    return merged_path + INDEX_SUFFIX
+
+
+def write_index(merged_path, files):
+    """
+    写出合并文件的索引
+
+    files: {path: [size, mtime_ns, hash, offset, length]}，与合并指纹缓存的格式一致。
+    """
+    st = os.stat(merged_path)
+    rows = [
+        [fpath, offset, length, size, mtime_ns, digest]
+        for fpath, (size, mtime_ns, digest, offset, length) in sorted(files.items(), key=lambda item: item[1][3])
+    ]
+    index = {
+        "version": INDEX_VERSION,
+        "merged": os.path.basename(merged_path),
+        "merged_size": st.st_size,
+        "merged_mtime_ns": st.st_mtime_ns,
+        "fields": INDEX_FIELDS,
+        "files": rows
+    }
+    index_path = index_path_for(merged_path)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def load_index(merged_path):
+    """
+    读取合并文件的索引，不存在或无法识别时返回 None
+
+    返回 {"fresh": bool, "files": {path: {"offset", "length", "size", "mtime_ns", "hash"}}}。
+    fresh 为 False 表示合并文件在写出索引后被改动过 (例如被编辑后传回)，
+    此时偏移不再可信，但原文件的大小、mtime_ns 和哈希仍可用于判断变化。
+    """
+    index_path = index_path_for(merged_path)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            return None
+        st = os.stat(merged_path)
+        files = {}
+        for fpath, offset, length, size, mtime_ns, digest in index["files"]:
+            files[fpath] = {"offset": offset, "length": length, "size": size, "mtime_ns": mtime_ns, "hash": digest}
+        return {
+            "fresh": st.st_size == index["merged_size"] and st.st_mtime_ns == index["merged_mtime_ns"],
+            "files": files
+        }
+    except Exception as e:
+        logging.warning(f"无法读取合并索引 {index_path}: {e}")
+        return None
+
+
+def read_block(merged_path, entry):
+    """按索引偏移直接读取一个文件块的内容 (bytes)"""
+    with open(merged_path, 'rb') as f:
+        f.seek(entry["offset"])
+        return f.read(entry["length"])
+
+
+def source_changed(fpath, entry):
+    """原文件的大小或修改时间与合并时不同则认为已变化，文件不存在也视为变化"""
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return True
+    return st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]
@@ -0,0 +1,69 @@
+"""
+目录树节点的名称索引
+
+搜索框每次输入都要在所有已加载的节点中查找名称包含关键词的节点。这里在 Python 侧保存
+小写名称和三字母组 (trigram) 倒排表，节点插入目录树时增量加入；查询时先按关键词的
+三字母组求交集得到候选，再逐个确认子串，不再逐个节点调用 Treeview。
+
+结果按节点在目录树中的显示顺序 (先序，目录在前、文件在后，同类按小写名称) 排列。
+"""
+import os
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    """非线程安全，只在主线程中使用"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.names = {}  # {node: 小写名称}
+        self.nodes = {}  # {node: (path, is_dir)}
+        self.postings = {}  # {trigram: {node}}
+        self.sort_keys = {}  # {node: 排序键}，查询命中时才计算
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, node, name, path, is_dir):
+        lname = name.lower()
+        self.names[node] = lname
+        self.nodes[node] = (path, is_dir)
+        for gram in _trigrams(lname):
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = {node}
+            else:
+                posting.add(node)
+
+    def search(self, query):
+        """返回名称包含 query (应已转为小写) 的节点列表，按目录树中的顺序排列"""
+        if not query:
+            return []
+        if len(query) < 3:
+            hits = [node for node, lname in self.names.items() if query in lname]
+        else:
+            postings = sorted((self.postings.get(gram, ()) for gram in _trigrams(query)), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+            names = self.names
+            hits = [node for node in candidates if query in names[node]]
+        return sorted(hits, key=self._sort_key)
+
+    def _sort_key(self, node):
+        key = self.sort_keys.get(node)
+        if key is None:
+            # 上级各层都是目录 (\x01)，最后一层文件用 \x02 排在同级目录之后；\x00 分隔使上级排在下级之前
+            path, is_dir = self.nodes[node]
+            parent, sep, name = path.lower().rstrip(os.sep).rpartition(os.sep)
+            ancestors = parent.split(os.sep) if sep else []
+            key = "".join("\x01" + part + "\x00" for part in ancestors) + ("\x01" if is_dir else "\x02") + name
+            self.sort_keys[node] = key
+        return key
@@ -0,0 +1,259 @@
+"""
+基于规则的勾选状态存储
+
+按路径分段组织成前缀树，只在用户显式操作过的路径上保存规则：
+    {"selected": bool, "recursive": bool (文件为 None), "exclude": [排除规则] (可选)}
+没有规则的路径从上级继承：递归勾选的目录下所有文件和子目录都被勾选 (子目录同样递归)，
+非递归勾选的目录只勾选直接包含的文件。下级的显式规则覆盖继承的状态，因此取消勾选递归目录下
+的某个子目录、或在未勾选的目录中单独勾选一个文件都只需一条规则。
+
+查询某个路径是否被勾选只需沿前缀树从根走到该路径；从未展开过的目录同样可以按规则扫描，
+不需要为每个子项保存一条记录。
+"""
+import os
+from pathlib import PurePath
+
+# 目录的勾选方式
+RECURSIVE = "recursive"  # 递归勾选：所有下级都被勾选
+FLAT = "flat"  # 非递归勾选：只勾选直接包含的文件
+
+
+def _split(path):
+    # 转为绝对路径后再分段："." 的 parts 为空，"a/.." 与 "." 也应落在同一个节点上
+    return PurePath(os.path.abspath(path)).parts
+
+
+def _key(part):
+    return os.path.normcase(part)
+
+
+def child_state(parent_mode, rule, is_dir):
+    """
+    根据父目录的勾选方式和自身规则 (可为 None) 计算一个子项的状态
+
+    返回 (勾选方式, 是否勾选)；勾选方式只对目录有意义，未勾选或文件为 None。
+    """
+    if rule is not None:
+        selected = bool(rule.get("selected"))
+        if not is_dir or not selected:
+            return None, selected
+        return (RECURSIVE if rule.get("recursive") else FLAT), True
+    if parent_mode == RECURSIVE:
+        return (RECURSIVE if is_dir else None), True
+    if parent_mode == FLAT and not is_dir:
+        return None, True
+    return None, False
+
+
+class _Node:
+    __slots__ = ("path", "children", "rule", "selected_below")
+
+    def __init__(self, path):
+        self.path = path
+        self.children = {}  # {normcase(name): _Node}
+        self.rule = None
+        self.selected_below = 0  # 子树中 (不含自身) 勾选规则的数量
+
+    def child(self, name):
+        return self.children.get(_key(name))
+
+
+class SelectionStore:
+    """勾选规则前缀树；非线程安全，后台扫描应使用 copy() 得到的副本"""
+
+    def __init__(self):
+        self.root = _Node(None)
+
+    # ---------- 构造与序列化 ----------
+
+    @classmethod
+    def from_dict(cls, rules):
+        """从 config.json 的 "selection" 小节恢复"""
+        store = cls()
+        for path, rule in rules.items():
+            store._put(path, dict(rule))
+        return store
+
+    @classmethod
+    def from_roots(cls, selected_files, selected_dirs, selection_rules=None):
+        """
+        由勾选的文件和 (目录, 是否递归) 列表构造，selection_rules 为 {目录: [排除规则]}
+
+        列表中的路径应已去除重叠 (见 fs_scan.collapse_roots)。
+        """
+        selection_rules = selection_rules or {}
+        store = cls()
+        for d_path, recursive in selected_dirs:
+            rule = {"selected": True, "recursive": bool(recursive)}
+            if selection_rules.get(d_path):
+                rule["exclude"] = list(selection_rules[d_path])
+            store._put(d_path, rule)
+        for fpath in selected_files:
+            store._put(fpath, {"selected": True, "recursive": None})
+        return store
+
+    @classmethod
+    def from_states(cls, selected_states):
+        """
+        迁移旧版按路径逐条保存的 selected_states
+
+        旧版级联勾选会给每个下级都写一条记录，这里按路径深度依次加入，
+        已经能由上级规则继承得到的记录直接丢弃。
+        """
+        store = cls()
+        for path in sorted(selected_states, key=lambda p: len(_split(p))):
+            state = selected_states[path]
+            if not state.get("selected"):
+                continue
+            is_dir = state.get("recursive") is not None
+            mode, selected = store._inherited(path, is_dir)
+            if selected and (not is_dir or mode == RECURSIVE) and not state.get("exclude"):
+                continue
+            rule = {"selected": True, "recursive": bool(state.get("recursive")) if is_dir else None}
+            if state.get("exclude"):
+                rule["exclude"] = list(state["exclude"])
+            store._put(path, rule)
+        return store
+
+    def to_dict(self):
+        """导出所有规则 {path: rule}，用于保存到 config.json"""
+        rules = {}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.rule is not None:
+                rules[node.path] = dict(node.rule)
+            stack.extend(node.children.values())
+        return rules
+
+    def copy(self):
+        return SelectionStore.from_dict(self.to_dict())
+
+    # ---------- 查询 ----------
+
+    def has_selection(self):
+        return self.root.selected_below > 0
+
+    def get_rule(self, path):
+        node = self._find(path)
+        return dict(node.rule) if node is not None and node.rule is not None else None
+
+    def state(self, path, is_dir):
+        """返回 (是否勾选, 是否递归)：沿前缀树从根走到 path，下级规则覆盖上级"""
+        mode, selected = self._walk(path, is_dir, include_self=True)
+        return selected, mode == RECURSIVE
+
+    def lookup(self, path):
+        """返回目录 path 的 (勾选方式, 规则树节点)，节点可能为 None；用于沿已知的子项逐级计算状态"""
+        mode, _ = self._walk(path, True, include_self=True)
+        return mode, self._find(path)
+
+    def _inherited(self, path, is_dir):
+        """忽略 path 自身的规则，只按上级规则计算的 (勾选方式, 是否勾选)"""
+        return self._walk(path, is_dir, include_self=False)
+
+    def _walk(self, path, is_dir, include_self):
+        parts = _split(path)
+        node = self.root
+        mode = None
+        selected = False
+        for i, part in enumerate(parts):
+            node = node.child(part) if node is not None else None
+            last = i == len(parts) - 1
+            rule = node.rule if node is not None and (include_self or not last) else None
+            mode, selected = child_state(mode, rule, True if not last else is_dir)
+        return mode, selected
+
+    # ---------- 修改 ----------
+
+    def set(self, path, selected, recursive=False, is_dir=True):
+        """
+        设置 path 的勾选状态
+
+        保留该路径原有的排除规则；与上级继承的状态相同的规则不会保存，
+        因此反复勾选、取消不会让规则越积越多。
+        """
+        node = self._find(path)
+        old = node.rule if node is not None else None
+        rule = {"selected": bool(selected), "recursive": bool(recursive) if is_dir else None}
+        if old and old.get("exclude"):
+            rule["exclude"] = old["exclude"]
+        mode, inherited = self._inherited(path, is_dir)
+        if (not rule.get("exclude") and rule["selected"] == inherited
+                and (not is_dir or not selected or (mode == RECURSIVE) == rule["recursive"])):
+            rule = None
+        self._put(path, rule)
+
+    def clear_below(self, path):
+        """删除 path 下级的所有规则，使整个子树重新跟随 path 自身的状态"""
+        node = self._find(path)
+        if node is None or not node.children:
+            return
+        removed = node.selected_below
+        node.children = {}
+        node.selected_below = 0
+        if removed:
+            for ancestor in self._ancestors(path):
+                ancestor.selected_below -= removed
+        self._prune(path)
+
+    def _find(self, path):
+        node = self.root
+        for part in _split(path):
+            node = node.child(part)
+            if node is None:
+                return None
+        return node
+
+    def _ancestors(self, path):
+        """path 的所有上级节点 (含根节点，不含自身)"""
+        nodes = [self.root]
+        node = self.root
+        for part in _split(path)[:-1]:
+            node = node.child(part)
+            if node is None:
+                break
+            nodes.append(node)
+        return nodes
+
+    def _put(self, path, rule):
+        """直接写入或删除 (rule 为 None) 一条规则，并维护上级的计数"""
+        parts = _split(path)
+        if not parts:
+            return
+        if rule is None and self._find(path) is None:
+            return
+        node = self.root
+        current = None
+        ancestors = []
+        for part in parts:
+            ancestors.append(node)
+            child = node.child(part)
+            if child is None:
+                current = os.path.join(current, part) if current is not None else part
+                child = _Node(current)
+                node.children[_key(part)] = child
+            current = child.path
+            node = child
+        delta = int(bool(rule and rule.get("selected"))) - int(bool(node.rule and node.rule.get("selected")))
+        node.rule = rule
+        if delta:
+            for ancestor in ancestors:
+                ancestor.selected_below += delta
+        if rule is None:
+            self._prune(path)
+
+    def _prune(self, path):
+        """自下而上删除没有规则也没有子节点的空节点"""
+        parts = _split(path)
+        chain = [self.root]
+        for part in parts:
+            node = chain[-1].child(part)
+            if node is None:
+                return
+            chain.append(node)
+        for i in range(len(chain) - 1, 0, -1):
+            node = chain[i]
+            if node.rule is not None or node.children:
+                return
+            del chain[i - 1].children[_key(parts[i - 1])]
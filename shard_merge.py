@@ -0,0 +1,132 @@
+"""
+分片输出
+
+把合并结果按字节数或估算的 token 数上限拆成多个分片文件：
+    merged_files_<时间戳>_part001.txt, _part002.txt, ...
+    merged_files_<时间戳>_manifest.json
+
+文件按路径排序后依次装入分片，一个 FILE: 块不会跨越两个分片；单个文件本身就超过上限时
+独占一个分片 (不拆开文件块，每个分片仍可单独用 diff / apply 处理)。
+分片之间互不依赖，由线程池并发写出，每个分片同样带有偏移索引 (见 merge_index)。
+清单中记录每个分片包含的文件，下游可以据此并行处理各个分片。
+"""
+import os
+import json
+import math
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import merge_engine
+
+MANIFEST_VERSION = 1
+# 估算 token 数时每个 token 对应的平均字节数
+DEFAULT_BYTES_PER_TOKEN = 4
+DEFAULT_SHARD_WORKERS = 4
+
+
+def _block_overhead(fpath):
+    """块标题与末尾换行占用的字节数"""
+    return len(f"\n{merge_engine.SEPARATOR}\nFILE: {fpath}\n{merge_engine.SEPARATOR}\n\n".encode('utf-8')) + 1
+
+
+def plan_shards(file_paths, max_bytes=None, max_tokens=None, bytes_per_token=DEFAULT_BYTES_PER_TOKEN):
+    """
+    按路径顺序把文件分配到各个分片，返回 [[path, ...], ...]
+
+    max_bytes 与 max_tokens 可同时指定，任一超出即换下一个分片；token 数按字节数 / bytes_per_token 估算。
+    无法 stat 的文件按 0 字节计入 (写出时再记为失败)。
+    """
+    if not max_bytes and not max_tokens:
+        raise ValueError("需要指定分片的字节数或 token 数上限")
+    shards = []
+    current = []
+    used_bytes = 0
+    used_tokens = 0
+    for fpath in sorted(file_paths):
+        try:
+            size = os.stat(fpath).st_size
+        except OSError:
+            size = 0
+        block_bytes = size + _block_overhead(fpath)
+        block_tokens = math.ceil(block_bytes / bytes_per_token)
+        over = ((max_bytes and used_bytes + block_bytes > max_bytes)
+                or (max_tokens and used_tokens + block_tokens > max_tokens))
+        if current and over:
+            shards.append(current)
+            current = []
+            used_bytes = 0
+            used_tokens = 0
+        current.append(fpath)
+        used_bytes += block_bytes
+        used_tokens += block_tokens
+    if current:
+        shards.append(current)
+    return shards
+
+
+def merge_sharded(file_paths, output_directory, max_bytes=None, max_tokens=None,
+                  bytes_per_token=DEFAULT_BYTES_PER_TOKEN, workers=DEFAULT_SHARD_WORKERS, progress_callback=None):
+    """
+    把文件合并为多个分片并写出清单
+
+    各分片由 merge_engine.merge_files 在线程池中并发写出 (分片内部顺序读取，不使用指纹缓存)。
+    progress_callback(current, total) 在每个文件处理后调用，可能来自不同的线程。
+    返回 {"manifest_path", "shards": [分片文件名], "success_count", "fail_count"}。
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    base = f"merged_files_{timestamp}"
+    shards = plan_shards(file_paths, max_bytes, max_tokens, bytes_per_token)
+    names = [f"{base}_part{i + 1:03d}.txt" for i in range(len(shards))]
+    total_count = sum(len(shard) for shard in shards)
+
+    lock = threading.Lock()
+    done = [0]
+
+    def on_progress(current, total):
+        with lock:
+            done[0] += 1
+            current = done[0]
+        if progress_callback:
+            progress_callback(current, total_count)
+
+    def write_shard(i):
+        return merge_engine.merge_files(shards[i], output_directory, progress_callback=on_progress,
+                                        output_name=names[i])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers or 1), thread_name_prefix="merge-shard") as executor:
+        results = list(executor.map(write_shard, range(len(shards))))
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created": timestamp,
+        "max_bytes": max_bytes,
+        "max_tokens": max_tokens,
+        "bytes_per_token": bytes_per_token,
+        "shards": []
+    }
+    for name, shard, result in zip(names, shards, results):
+        size = os.path.getsize(result["output_path"])
+        manifest["shards"].append({
+            "file": name,
+            "index": os.path.basename(result["index_path"]) if result["index_path"] else None,
+            "bytes": size,
+            "estimated_tokens": math.ceil(size / bytes_per_token),
+            "oversized": bool((max_bytes and size > max_bytes)
+                              or (max_tokens and math.ceil(size / bytes_per_token) > max_tokens)),
+            "files": shard
+        })
+    manifest_path = os.path.join(output_directory, f"{base}_manifest.json")
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    logging.debug(f"已写出 {len(names)} 个分片，清单 {manifest_path}")
+
+    return {
+        "manifest_path": manifest_path,
+        "shards": names,
+        "success_count": sum(result["success_count"] for result in results),
+        "fail_count": sum(result["fail_count"] for result in results)
+    }
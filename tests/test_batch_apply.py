@@ -0,0 +1,166 @@
+import os
+from unittest import mock
+
+import pytest
+
+import batch_apply
+import merge_engine
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    files = {}
+    for name in ("a.txt", "b.txt"):
+        path = src / name
+        path.write_text(f"old {name}\n", encoding="utf-8")
+        files[name] = str(path)
+    out = tmp_path / "out"
+    out.mkdir()
+    merged = merge_engine.merge_files(list(files.values()), str(out))["output_path"]
+    with open(merged, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(merged, "w", encoding="utf-8") as f:
+        f.write(text.replace("old a.txt", "new a.txt!").replace("old b.txt", "new b.txt!"))
+    diffs = merge_engine.compute_diffs(merged, workers=1)
+    assert len(diffs) == 2
+    return {"files": files, "diffs": diffs, "journal_root": str(tmp_path / "journals")}
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def leftover_tmp(files):
+    directory = os.path.dirname(next(iter(files.values())))
+    return [name for name in os.listdir(directory) if name.endswith(".transmit-tmp")]
+
+
+def test_apply_and_rollback(workspace):
+    files = workspace["files"]
+    result = batch_apply.apply_batch(workspace["diffs"], workers=2, journal_root=workspace["journal_root"])
+    assert sorted(result["applied"]) == sorted(files.values())
+    assert read(files["a.txt"]) == "new a.txt!\n"
+    assert batch_apply.load_journal(result["journal_path"])["status"] == batch_apply.STATUS_COMMITTED
+    assert leftover_tmp(files) == []
+
+    assert batch_apply.rollback(result["journal_path"]) == (2, 0)
+    assert read(files["a.txt"]) == "old a.txt\n"
+    assert read(files["b.txt"]) == "old b.txt\n"
+    assert batch_apply.load_journal(result["journal_path"])["status"] == batch_apply.STATUS_ROLLED_BACK
+
+
+def test_apply_refuses_files_changed_since_merge(workspace):
+    files = workspace["files"]
+    with open(files["b.txt"], "a", encoding="utf-8") as f:
+        f.write("edited after merge\n")
+    result = batch_apply.apply_batch(workspace["diffs"], workers=2, journal_root=workspace["journal_root"])
+    assert result["applied"] == [files["a.txt"]]
+    assert result["conflicts"] == [files["b.txt"]]
+    assert read(files["b.txt"]) == "old b.txt\nedited after merge\n"
+
+
+def test_rollback_refuses_files_edited_after_apply(workspace):
+    files = workspace["files"]
+    journal_path = batch_apply.apply_batch(workspace["diffs"], workers=2,
+                                           journal_root=workspace["journal_root"])["journal_path"]
+    with open(files["a.txt"], "a", encoding="utf-8") as f:
+        f.write("user edit\n")
+
+    assert batch_apply.modified_since_apply(journal_path) == [files["a.txt"]]
+    with pytest.raises(ValueError):
+        batch_apply.rollback(journal_path)
+    # 拒绝时不做任何改动
+    assert read(files["a.txt"]) == "new a.txt!\nuser edit\n"
+    assert read(files["b.txt"]) == "new b.txt!\n"
+
+    assert batch_apply.rollback(journal_path, force=True) == (2, 0)
+    assert read(files["a.txt"]) == "old a.txt\n"
+
+
+def test_resume_after_interrupted_commit(workspace):
+    files = workspace["files"]
+    real_replace = os.replace
+    replaced = []
+
+    def replace_once(src, dst):
+        # 只替换第一个原文件，模拟进程在替换阶段中途退出
+        if src.endswith(".transmit-tmp"):
+            if replaced:
+                raise OSError("interrupted")
+            replaced.append(dst)
+        return real_replace(src, dst)
+
+    with mock.patch("batch_apply.os.replace", side_effect=replace_once):
+        result = batch_apply.apply_batch(workspace["diffs"], workers=1, journal_root=workspace["journal_root"])
+    journal_path = result["journal_path"]
+    assert len(result["failed"]) == 1
+    assert batch_apply.latest_journal(workspace["journal_root"], batch_apply.UNFINISHED_STATUSES) == journal_path
+    assert len(leftover_tmp(files)) == 1
+
+    assert batch_apply.resume(journal_path) == (2, 0)
+    assert read(files["a.txt"]) == "new a.txt!\n"
+    assert read(files["b.txt"]) == "new b.txt!\n"
+    assert leftover_tmp(files) == []
+    assert batch_apply.load_journal(journal_path)["status"] == batch_apply.STATUS_COMMITTED
+
+
+def test_rollback_after_interrupted_commit_restores_only_replaced(workspace):
+    files = workspace["files"]
+    real_replace = os.replace
+
+    def replace_first(src, dst):
+        if src.endswith(".transmit-tmp") and not dst.endswith("a.txt"):
+            raise OSError("interrupted")
+        return real_replace(src, dst)
+
+    with mock.patch("batch_apply.os.replace", side_effect=replace_first):
+        journal_path = batch_apply.apply_batch(workspace["diffs"], workers=1,
+                                               journal_root=workspace["journal_root"])["journal_path"]
+    assert read(files["a.txt"]) == "new a.txt!\n"
+    assert read(files["b.txt"]) == "old b.txt\n"
+
+    assert batch_apply.rollback(journal_path) == (2, 0)
+    assert read(files["a.txt"]) == "old a.txt\n"
+    assert read(files["b.txt"]) == "old b.txt\n"
+    assert leftover_tmp(files) == []
+
+
+def test_interrupted_prepare_leaves_cleanable_journal(workspace):
+    files = workspace["files"]
+
+    def crash(*args):
+        raise KeyboardInterrupt  # 模拟进程在创建备份时退出
+
+    with mock.patch("batch_apply.os.link", side_effect=crash), mock.patch("batch_apply.shutil.copy2", side_effect=crash):
+        with pytest.raises(KeyboardInterrupt):
+            batch_apply.apply_batch(workspace["diffs"][:1], workers=1, journal_root=workspace["journal_root"])
+    journal_path = batch_apply.latest_journal(workspace["journal_root"], batch_apply.UNFINISHED_STATUSES)
+    journal = batch_apply.load_journal(journal_path)
+    assert journal["status"] == batch_apply.STATUS_PREPARING
+    assert [os.path.basename(entry["tmp"]) for entry in journal["entries"]] == leftover_tmp(files)
+
+    assert batch_apply.resume(journal_path) == (1, 0)
+    assert leftover_tmp(files) == []
+    assert read(files["a.txt"]) == "old a.txt\n"
+    assert batch_apply.load_journal(journal_path)["status"] == batch_apply.STATUS_ROLLED_BACK
+
+
+def test_batch_without_entries_keeps_previous_journal(workspace):
+    files = workspace["files"]
+    first = batch_apply.apply_batch(workspace["diffs"][:1], workers=1, journal_root=workspace["journal_root"])
+    assert first["applied"]
+
+    # 剩下的文件在合并后被修改，整批都是冲突
+    with open(files["b.txt"], "a", encoding="utf-8") as f:
+        f.write("edited after merge\n")
+    second = batch_apply.apply_batch(workspace["diffs"][1:], workers=1, journal_root=workspace["journal_root"])
+    assert second["conflicts"] == [files["b.txt"]]
+    assert second["journal_path"] is None
+    assert batch_apply.list_journals(workspace["journal_root"]) == [first["journal_path"]]
+
+    assert batch_apply.latest_journal(workspace["journal_root"]) == first["journal_path"]
+    assert batch_apply.rollback(first["journal_path"]) == (1, 0)
+    assert read(files["a.txt"]) == "old a.txt\n"
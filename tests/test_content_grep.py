@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+import content_grep
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_compile_pattern():
+    assert content_grep.compile_pattern("abc") == (b"abc", None)
+    literal, regex = content_grep.compile_pattern("a.c", ignore_case=True)
+    assert literal is None
+    assert regex.search(b"xA.Cx") and not regex.search(b"abc")  # 非正则时 . 按字面量匹配
+    _, regex = content_grep.compile_pattern(r"^def \w+", regex=True)
+    assert len(regex.findall(b"def a():\n    pass\ndef b():\n")) == 2  # 逐行匹配 ^
+    _, regex = content_grep.compile_pattern("中文", ignore_case=True)
+    assert regex.search("包含中文".encode("utf-8"))
+    with pytest.raises(ValueError):
+        content_grep.compile_pattern("")
+    with pytest.raises(ValueError):
+        content_grep.compile_pattern("(", regex=True)
+
+
+def test_count_matches(tmp_path):
+    path = write(tmp_path / "a.txt", b"foo foo\nFOO\nfoofoo\n")
+    assert content_grep.count_matches(path, content_grep.compile_pattern("foo")) == 4
+    assert content_grep.count_matches(path, content_grep.compile_pattern("foo", ignore_case=True)) == 5
+    assert content_grep.count_matches(path, content_grep.compile_pattern("foo"), max_count=2) == 2
+    assert content_grep.count_matches(path, content_grep.compile_pattern("o+", regex=True), max_count=1) == 1
+    assert content_grep.count_matches(path, content_grep.compile_pattern("aa")) == 0
+    # 重叠的字面量不重复计数，空文件无法 mmap 也应返回 0
+    assert content_grep.count_matches(write(tmp_path / "b.txt", b"aaaa"), content_grep.compile_pattern("aa")) == 2
+    assert content_grep.count_matches(write(tmp_path / "empty.txt", b""), content_grep.compile_pattern("a")) == 0
+    with pytest.raises(OSError):
+        content_grep.count_matches(str(tmp_path / "missing.txt"), content_grep.compile_pattern("a"))
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = {}
+    for i in range(10):
+        data = b"needle " * (i % 3) + b"hay\n"
+        paths[write(tmp_path / f"f{i}.txt", data)] = i % 3
+    paths[str(tmp_path / "missing.txt")] = 0
+    return paths
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_grep_in_process_and_pool(files, workers):
+    # batch_size=3 时共有多批，workers=2 走进程池
+    results = list(content_grep.iter_grep(files, "needle", workers=workers, batch_size=3))
+    expected = sorted((path, count) for path, count in files.items() if count)
+    assert results == expected
+    assert content_grep.filter_files(files, "NEEDLE", ignore_case=True, workers=workers) == \
+        {path for path, count in files.items() if count}
+
+
+def test_iter_grep_stops_when_requested(files):
+    stop = threading.Event()
+    stop.set()
+    assert list(content_grep.iter_grep(files, "needle", workers=1, batch_size=3, stop_event=stop)) == []
+    assert list(content_grep.iter_grep(files, "needle", workers=2, batch_size=3, stop_event=stop)) == []
+
+
+def test_iter_grep_rejects_bad_pattern(files):
+    with pytest.raises(ValueError):
+        list(content_grep.iter_grep(files, "[", regex=True))
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import dir_index
+
+
+def age(path, seconds=60):
+    """把目录 mtime 调到 racy window 之外"""
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+
+def listing(entries):
+    return sorted((e.name, e.is_dir(), e.is_file(), e.is_symlink()) for e in entries)
+
+
+def make_dir(tmp_path):
+    d = tmp_path / "d"
+    (d / "sub").mkdir(parents=True)
+    (d / "a.txt").write_text("a")
+    os.symlink("a.txt", d / "link")
+    return str(d)
+
+
+def test_hit_after_first_listing(tmp_path):
+    d = make_dir(tmp_path)
+    age(d)
+    index = dir_index.DirIndex(str(tmp_path / "idx.sqlite3"))
+    first = index.scandir(d)
+    second = index.scandir(d)
+    assert (index.hits, index.misses) == (1, 1)
+    assert all(isinstance(e, dir_index.CachedEntry) for e in second)
+    assert listing(second) == listing(first)
+    link = next(e for e in second if e.name == "link")
+    assert link.path == os.path.join(d, "link")
+    assert link.is_file() and not link.is_file(follow_symlinks=False)
+    index.close()
+
+    # 提交后重新打开仍然命中
+    index = dir_index.DirIndex(str(tmp_path / "idx.sqlite3"))
+    assert listing(index.scandir(d)) == listing(first)
+    assert index.hits == 1
+    index.close()
+
+
+def test_mtime_change_invalidates(tmp_path):
+    d = make_dir(tmp_path)
+    age(d, 120)
+    index = dir_index.DirIndex(str(tmp_path / "idx.sqlite3"))
+    index.scandir(d)
+    os.remove(os.path.join(d, "a.txt"))
+    (tmp_path / "d" / "b.txt").write_text("b")
+    age(d, 60)
+    names = {e.name for e in index.scandir(d)}
+    assert names == {"sub", "b.txt", "link"}
+    assert (index.hits, index.misses) == (0, 2)
+    assert {e.name for e in index.scandir(d)} == names
+    assert index.hits == 1
+    index.close()
+
+
+def test_racy_directory_is_not_cached(tmp_path):
+    d = make_dir(tmp_path)
+    index = dir_index.DirIndex(str(tmp_path / "idx.sqlite3"))
+    # 刚修改过的目录：同一时间戳内可能再次变化，不写入索引
+    index.scandir(d)
+    index.scandir(d)
+    assert (index.hits, index.misses) == (0, 2)
+    age(d)
+    index.scandir(d)
+    index.scandir(d)
+    assert (index.hits, index.misses) == (1, 3)
+    index.close()
+
+
+def test_empty_directory_and_errors(tmp_path):
+    d = tmp_path / "empty"
+    d.mkdir()
+    age(str(d))
+    index = dir_index.DirIndex(str(tmp_path / "idx.sqlite3"))
+    assert index.scandir(str(d)) == []
+    assert index.scandir(str(d)) == []
+    assert index.hits == 1
+    with pytest.raises(OSError):
+        index.scandir(str(tmp_path / "missing"))
+    index.close()
+
+
+def test_version_mismatch_drops_old_table(tmp_path):
+    db = str(tmp_path / "idx.sqlite3")
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE dirs (path TEXT PRIMARY KEY, stale INTEGER)")
+    conn.execute("PRAGMA user_version=0")
+    conn.commit()
+    conn.close()
+    d = make_dir(tmp_path)
+    age(d)
+    index = dir_index.DirIndex(db)
+    index.scandir(d)
+    assert index.scandir(d) and index.hits == 1
+    index.close()
+
+
+def test_open_index_falls_back_to_none(tmp_path):
+    config = tmp_path / "config.json"
+    assert dir_index.index_path_for(str(config)) == str(tmp_path / dir_index.INDEX_FILE)
+    # 索引路径是一个目录，无法打开
+    os.mkdir(tmp_path / dir_index.INDEX_FILE)
+    assert dir_index.open_index(str(config)) is None
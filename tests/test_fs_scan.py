@@ -0,0 +1,151 @@
+import os
+import threading
+
+import fs_scan
+from selection_store import SelectionStore
+
+
+def make_tree(base, rel_paths):
+    for rel in rel_paths:
+        path = os.path.join(base, *rel.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(rel)
+
+
+def visible_files(selection, root, patterns, use_gitignore):
+    """按 matcher_for 逐级列出 root (与目录树的做法相同)，返回看得到的文件"""
+    result = set()
+    pending = [root]
+    while pending:
+        path = pending.pop()
+        entries = list(os.scandir(path))
+        matcher = fs_scan.matcher_for(selection, path, {entry.name for entry in entries}, patterns, use_gitignore)
+        for entry in entries:
+            if matcher.is_ignored(entry.path, entry.is_dir()):
+                continue
+            if entry.is_dir():
+                pending.append(entry.path)
+            else:
+                result.add(entry.path)
+    return result
+
+
+def test_matcher_for_anchors_like_scan_selection(tmp_path):
+    proj = str(tmp_path / "proj")
+    make_tree(proj, ["a.py", "build/x.py", "src/build/y.py", "src/gen/z.py", "src/keep.py", "lib/.gitignore",
+                     "lib/tmp.py", "lib/ok.py"])
+    with open(os.path.join(proj, "lib", ".gitignore"), "w") as f:
+        f.write("tmp.py\n")
+    patterns = ["/build"]
+    selection = SelectionStore.from_roots([], [(proj, True)], {proj: ["gen/"]})
+
+    exported = fs_scan.scan_selection(selection, set(), workers=2, exclude_patterns=patterns, use_gitignore=True)
+    assert exported == visible_files(selection, proj, patterns, True)
+    # /build 以勾选目录 proj 为根：只排除 proj/build，不排除 proj/src/build
+    assert os.path.join(proj, "src", "build", "y.py") in exported
+    assert os.path.join(proj, "build", "x.py") not in exported
+    assert os.path.join(proj, "src", "gen", "z.py") not in exported
+    assert os.path.join(proj, "lib", "tmp.py") not in exported
+
+    # 从下级目录开始列出时仍以 proj 为根
+    src = os.path.join(proj, "src")
+    names = set(os.listdir(src))
+    assert not fs_scan.matcher_for(selection, src, names, patterns).is_ignored(os.path.join(src, "build"), True)
+
+
+def test_matcher_for_unselected_dir_is_anchored_at_itself(tmp_path):
+    make_tree(str(tmp_path), ["build/x.py", "sub/build/y.py"])
+    matcher = fs_scan.matcher_for(SelectionStore(), str(tmp_path), set(os.listdir(tmp_path)), ["/build"])
+    assert matcher.is_ignored(str(tmp_path / "build"), True)
+    assert not matcher.is_ignored(str(tmp_path / "sub" / "build"), True)
+
+
+def test_collapse_roots_drops_covered_entries(tmp_path):
+    base = str(tmp_path)
+    proj = os.path.join(base, "proj")
+    sub = os.path.join(proj, "sub")
+    other = os.path.join(base, "other")
+    files, dirs = fs_scan.collapse_roots(
+        [os.path.join(sub, "a.py"), os.path.join(other, "b.py"), os.path.join(other, "deep", "c.py"),
+         os.path.join(base, "top.py")],
+        [(sub, False), (proj, True), (proj + os.sep, False), (other, False), (other, False)])
+    # 递归目录覆盖其下的目录和文件，同一目录同时递归与非递归勾选时只保留递归
+    assert dirs == [(proj, True), (other, False)]
+    # 非递归目录只覆盖直接包含的文件
+    assert files == [os.path.join(other, "deep", "c.py"), os.path.join(base, "top.py")]
+
+
+def test_collapse_roots_keeps_nested_recursive_root_once(tmp_path):
+    outer = str(tmp_path / "a")
+    inner = str(tmp_path / "a" / "b")
+    _, dirs = fs_scan.collapse_roots([], [(inner, True), (outer, True)])
+    assert dirs == [(outer, True)]
+    _, dirs = fs_scan.collapse_roots([], [(inner, True), (outer, False)])
+    assert dirs == [(inner, True), (outer, False)]
+
+
+def test_scan_files_with_overlapping_roots_finds_each_file_once(tmp_path):
+    base = str(tmp_path)
+    make_tree(base, ["a.py", "sub/b.py", "sub/deep/c.py"])
+    result = fs_scan.scan_files([os.path.join(base, "sub", "b.py")],
+                                [(base, True), (os.path.join(base, "sub"), False)], set(), workers=3)
+    assert result == {os.path.join(base, "a.py"), os.path.join(base, "sub", "b.py"),
+                      os.path.join(base, "sub", "deep", "c.py")}
+
+
+def test_symlink_loop_is_visited_once(tmp_path):
+    base = str(tmp_path)
+    make_tree(base, ["a.py", "sub/b.py"])
+    os.symlink(base, os.path.join(base, "sub", "loop"))
+    os.symlink(os.path.join(base, "sub"), os.path.join(base, "sub2"))
+    result = fs_scan.scan_files([], [(base, True)], set(), workers=4, follow_symlinks=True)
+    # 每个目录只进入一次，经链接到达的重复目录被跳过
+    names = sorted(os.path.relpath(path, base) for path in result)
+    assert len(names) == 2
+    assert names[0] == "a.py"
+    assert os.path.basename(names[1]) == "b.py"
+    # 不跟随时不进入指向目录的链接
+    result = fs_scan.scan_files([], [(base, True)], set(), workers=4)
+    assert result == {os.path.join(base, "a.py"), os.path.join(base, "sub", "b.py")}
+
+
+def scan_with_timeout(*args, **kwargs):
+    """在线程中扫描，未完成计数没有归零时扫描不会结束"""
+    result = []
+    t = threading.Thread(target=lambda: result.append(fs_scan.scan_files(*args, **kwargs)), daemon=True)
+    t.start()
+    t.join(10)
+    assert not t.is_alive(), "扫描没有结束"
+    return result[0]
+
+
+class FailingIndex:
+    """读取指定目录时失败的目录索引"""
+
+    def __init__(self, failing):
+        self.failing = failing
+
+    def scandir(self, path):
+        if path in self.failing:
+            raise PermissionError(13, "Permission denied", path)
+        with os.scandir(path) as it:
+            return list(it)
+
+    def flush(self):
+        pass
+
+
+def test_scan_terminates_on_empty_missing_and_unreadable_dirs(tmp_path):
+    base = str(tmp_path)
+    make_tree(base, ["locked/x.py", "ok/y.py"])
+    for rel in ["empty", "ok/empty", "ok/empty2/empty3"]:
+        os.makedirs(os.path.join(base, *rel.split("/")))
+    locked = os.path.join(base, "locked")
+
+    result = scan_with_timeout([], [(base, True), (os.path.join(base, "missing"), True)], set(), workers=4,
+                               dir_index=FailingIndex({locked}))
+    assert result == {os.path.join(base, "ok", "y.py")}
+    assert scan_with_timeout([], [(os.path.join(base, "empty"), True)], set(), workers=4) == set()
+    # 勾选的根目录本身无法读取
+    assert scan_with_timeout([], [(locked, True)], set(), workers=2, dir_index=FailingIndex({locked})) == set()
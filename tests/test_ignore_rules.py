@@ -0,0 +1,57 @@
+import os
+
+import ignore_rules
+
+
+def test_gitignore_syntax(tmp_path):
+    base = str(tmp_path)
+    matcher = ignore_rules.build_matcher(base, ["# comment", "", "*.min.js", "logs/", "/build", "docs/**/draft.md"])
+
+    def ignored(rel, is_dir=False):
+        return matcher.is_ignored(os.path.join(base, *rel.split("/")), is_dir)
+
+    assert ignored("app.min.js")
+    assert ignored("static/js/app.min.js")
+    assert not ignored("app.js")
+    assert ignored("logs", is_dir=True)
+    assert ignored("src/logs", is_dir=True)
+    assert not ignored("logs")  # dir/ 只匹配目录
+    assert ignored("build", is_dir=True)
+    assert not ignored("src/build", is_dir=True)  # /build 只匹配根下
+    assert ignored("docs/draft.md")
+    assert ignored("docs/a/b/draft.md")
+    assert not ignored("other/draft.md")
+
+
+def test_negation_and_precedence(tmp_path):
+    base = str(tmp_path)
+    matcher = ignore_rules.build_matcher(base, ["*.log", "!keep.log"], extra_patterns=["keep.log"])
+    assert matcher.is_ignored(os.path.join(base, "a.log"), False)
+    # 勾选项自己的规则后加入，优先于全局规则
+    assert matcher.is_ignored(os.path.join(base, "keep.log"), False)
+
+    matcher = ignore_rules.build_matcher(base, ["*.log", "!keep.log"])
+    assert not matcher.is_ignored(os.path.join(base, "keep.log"), False)
+
+
+def test_nested_gitignore_applies_below_its_directory(tmp_path):
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    (sub / ".gitignore").write_text("*.tmp\n", encoding="utf-8")
+    matcher = ignore_rules.build_matcher(str(tmp_path), ["node_modules/"])
+    nested = matcher.for_directory(str(sub), set(os.listdir(sub)))
+
+    assert nested.is_ignored(str(sub / "x.tmp"), False)
+    assert not matcher.is_ignored(str(tmp_path / "x.tmp"), False)
+    assert not nested.is_ignored(str(tmp_path / "x.tmp"), False)
+    assert nested.is_ignored(str(sub / "node_modules"), True)
+    assert matcher.for_directory(str(sub), set(os.listdir(sub)), use_gitignore=False) is matcher
+
+
+def test_default_patterns_keep_build_output_dirs(tmp_path):
+    base = str(tmp_path)
+    matcher = ignore_rules.build_matcher(base, ignore_rules.DEFAULT_EXCLUDE_PATTERNS)
+    for name in (".git", "node_modules", "__pycache__", "venv"):
+        assert matcher.is_ignored(os.path.join(base, name), True)
+    for name in ("build", "dist", "target", "env"):
+        assert not matcher.is_ignored(os.path.join(base, name), True)
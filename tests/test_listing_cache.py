@@ -0,0 +1,44 @@
+import os
+
+import dir_index
+import listing_cache
+
+
+def make_dir(path, count):
+    path.mkdir()
+    for i in range(count):
+        (path / f"f{i}").write_text("", encoding="utf-8")
+    # 避开“刚修改过的目录不缓存”的窗口
+    old = (os.stat(path).st_mtime_ns - 2 * dir_index.RACY_WINDOW_NS) / 1e9
+    os.utime(path, (old, old))
+    return str(path)
+
+
+def test_probe_caches_small_listings(tmp_path):
+    cache = listing_cache.ListingCache()
+    small = make_dir(tmp_path / "small", 3)
+    empty = make_dir(tmp_path / "empty", 0)
+
+    assert cache.probe(small)
+    assert not cache.probe(empty)
+    assert cache.is_cached(small) and cache.is_cached(empty)
+    # 接下来展开时直接命中
+    assert sorted(entry.name for entry in cache.scandir(small)) == ["f0", "f1", "f2"]
+    assert cache.hits == 1 and cache.misses == 0
+
+
+def test_probe_reads_only_a_prefix_of_large_dirs(tmp_path):
+    cache = listing_cache.ListingCache()
+    large = make_dir(tmp_path / "large", 5)
+    assert cache.probe(large, limit=2)
+    assert not cache.is_cached(large)
+    assert len(cache.scandir(large)) == 5
+    assert cache.is_cached(large)
+
+
+def test_scandir_refreshes_after_directory_changes(tmp_path):
+    cache = listing_cache.ListingCache()
+    path = make_dir(tmp_path / "d", 1)
+    assert len(cache.scandir(path)) == 1
+    (tmp_path / "d" / "new").write_text("", encoding="utf-8")
+    assert len(cache.scandir(path)) == 2
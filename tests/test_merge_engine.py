@@ -0,0 +1,208 @@
+import os
+import datetime
+
+import pytest
+
+import merge_engine
+
+
+@pytest.fixture
+def sources(tmp_path):
+    src = tmp_path / "src"
+    (src / "pkg").mkdir(parents=True)
+    contents = {
+        src / "a.py": "print('a')\n",
+        src / "b.txt": "line 1\nline 2\n",
+        src / "pkg" / "c.py": "def c():\n    return 1\n",
+        src / "pkg" / "empty.txt": "",
+    }
+    for path, text in contents.items():
+        path.write_text(text, encoding="utf-8")
+    return {str(path): text for path, text in contents.items()}
+
+
+@pytest.fixture
+def out_dir(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    return str(out)
+
+
+def _edit_block(merged_path, old, new):
+    with open(merged_path, "r", encoding="utf-8", newline="") as f:
+        text = f.read()
+    assert text.count(old) == 1
+    with open(merged_path, "w", encoding="utf-8", newline="") as f:
+        f.write(text.replace(old, new))
+
+
+def test_merge_round_trip(sources, out_dir):
+    result = merge_engine.merge_files(sources, out_dir)
+    assert result["success_count"] == len(sources)
+    assert result["fail_count"] == 0
+    assert dict(merge_engine.iter_merged_file(result["output_path"])) == sources
+    assert merge_engine.compute_diffs(result["output_path"], workers=1) == []
+
+
+def test_compute_diffs_finds_edited_blocks(sources, out_dir):
+    merged = merge_engine.merge_files(sources, out_dir)["output_path"]
+    _edit_block(merged, "line 2\n", "line 2 changed\nline 3\n")
+    _edit_block(merged, "return 1", "return 2")
+
+    diffs = merge_engine.compute_diffs(merged, workers=1)
+    changed = {item["path"]: merge_engine.read_new_content(item) for item in diffs}
+    by_name = {path.replace("\\", "/").rsplit("/", 1)[-1]: text for path, text in changed.items()}
+    assert by_name == {
+        "b.txt": "line 1\nline 2 changed\nline 3\n",
+        "c.py": "def c():\n    return 2\n",
+    }
+    item = next(item for item in diffs if item["path"].endswith("c.py"))
+    assert "+    return 2" in merge_engine.render_diff(item)
+
+
+def test_block_spans_strip_trailing_newline(sources, out_dir):
+    merged = merge_engine.merge_files(sources, out_dir)["output_path"]
+    with open(merged, "rb") as f:
+        data = f.read()
+    spans = list(merge_engine.iter_block_spans(merged))
+    assert [path for _, path, _, _ in spans] == sorted(sources)
+    for kind, path, start, end in spans:
+        assert kind == "FILE"
+        assert data[start:end].decode("utf-8") == sources[path]
+
+
+class _FrozenDatetime(datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 1, 2, 3, 4, 5)
+
+
+def test_remerge_in_same_second_keeps_reused_blocks(sources, out_dir, tmp_path, monkeypatch):
+    # 两次合并得到同一个输出文件名，第二次从正要被替换的上一次输出中复用文件块
+    monkeypatch.setattr(merge_engine.datetime, "datetime", _FrozenDatetime)
+    cache_path = str(tmp_path / "merge_cache.json")
+
+    first = merge_engine.merge_files(sources, out_dir, cache_path=cache_path)
+    second = merge_engine.merge_files(sources, out_dir, cache_path=cache_path)
+
+    assert second["output_path"] == first["output_path"]
+    assert second["reused_count"] == len(sources)
+    assert dict(merge_engine.iter_merged_file(second["output_path"])) == sources
+    assert merge_engine.compute_diffs(second["output_path"], workers=1, cache_path=cache_path) == []
+    assert not any(name.endswith(".tmp") for name in os.listdir(out_dir))
+
+
+def test_incremental_merge_rereads_changed_files(sources, out_dir, tmp_path):
+    cache_path = str(tmp_path / "merge_cache.json")
+    merge_engine.merge_files(sources, out_dir, cache_path=cache_path)
+    changed = next(path for path in sources if path.endswith("a.py"))
+    with open(changed, "w", encoding="utf-8") as f:
+        f.write("print('changed a')\n")
+    sources[changed] = "print('changed a')\n"
+
+    result = merge_engine.merge_files(sources, out_dir, cache_path=cache_path, output_name="again.txt")
+    assert result["reused_count"] == len(sources) - 1
+    assert dict(merge_engine.iter_merged_file(result["output_path"])) == sources
+
+
+def test_kernel_copy_returning_zero_falls_back_to_read(sources, out_dir, monkeypatch):
+    # 部分文件系统上 copy_file_range / sendfile 不报错但返回 0
+    monkeypatch.setattr(merge_engine.os, "copy_file_range", lambda *args: 0, raising=False)
+    monkeypatch.setattr(merge_engine.os, "sendfile", lambda *args: 0, raising=False)
+    result = merge_engine.merge_files(sources, out_dir)
+    assert dict(merge_engine.iter_merged_file(result["output_path"])) == sources
+    assert merge_engine.compute_diffs(result["output_path"], workers=1) == []
+
+
+def test_cli_merge_current_directory(sources, out_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path / "src")
+    config = str(tmp_path / "config.json")
+    assert merge_engine.main(["--config", config, "merge", ".", "-r", "-o", out_dir]) == 0
+    outputs = [name for name in os.listdir(out_dir) if name.endswith(".txt")]
+    assert len(outputs) == 1
+    assert dict(merge_engine.iter_merged_file(os.path.join(out_dir, outputs[0]))) == sources
+
+
+def test_changed_paths_limits_rereads(sources, out_dir, tmp_path):
+    cache_path = str(tmp_path / "merge_cache.json")
+    merge_engine.merge_files(sources, out_dir, cache_path=cache_path, output_name="watch.txt")
+    a_path = next(path for path in sources if path.endswith("a.py"))
+    b_path = next(path for path in sources if path.endswith("b.txt"))
+    for path in (a_path, b_path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("# more\n")
+
+    # 只有列出的文件被重新读取，其余文件不再 stat，直接复用文件块
+    result = merge_engine.merge_files(sources, out_dir, cache_path=cache_path, output_name="watch.txt",
+                                      changed_paths={a_path}, workers=2)
+    assert result["reused_count"] == len(sources) - 1
+    merged = dict(merge_engine.iter_merged_file(result["output_path"]))
+    assert merged[a_path] == sources[a_path] + "# more\n"
+    assert merged[b_path] == sources[b_path]
+
+    result = merge_engine.merge_files(sources, out_dir, cache_path=cache_path, output_name="watch.txt")
+    assert dict(merge_engine.iter_merged_file(result["output_path"]))[b_path] == sources[b_path] + "# more\n"
+
+
+@pytest.fixture
+def encoded_sources(tmp_path, monkeypatch):
+    # 块很小时多字节字符会跨块，校验需要拼接上一块的残留字节
+    monkeypatch.setattr(merge_engine, "CHUNK_SIZE", 5)
+    src = tmp_path / "enc"
+    src.mkdir()
+    contents = {
+        src / "crlf.txt": "第一行\r\nsecond 行\r\n".encode("utf-8"),
+        src / "mixed.txt": "ascii\né€\U0001f600 end\rold mac\n".encode("utf-8"),
+        src / "latin1.txt": "café naïve\n".encode("latin-1"),
+        src / "truncated.txt": "ok ".encode("utf-8") + "中".encode("utf-8")[:2],
+    }
+    for path, data in contents.items():
+        path.write_bytes(data)
+    return {str(path): data for path, data in contents.items()}
+
+
+def _blocks(merged):
+    with open(merged, "rb") as f:
+        data = f.read()
+    return {path: data[start:end] for _, path, start, end in merge_engine.iter_block_spans(merged)}
+
+
+def test_valid_utf8_is_copied_byte_for_byte(encoded_sources, out_dir):
+    result = merge_engine.merge_files(encoded_sources, out_dir)
+    assert result["fail_count"] == 0
+    blocks = _blocks(result["output_path"])
+    for name in ("crlf.txt", "mixed.txt"):
+        path = next(p for p in encoded_sources if p.endswith(name))
+        # 合法 UTF-8 原样拷贝，CRLF 与单独的 \r 都保留
+        assert blocks[path] == encoded_sources[path]
+        assert merge_engine._hash_file(path) == merge_engine._content_hash_of(blocks[path])
+    # 对比时按文本模式统一换行符，原样拷贝的块不算差异
+    assert merge_engine.compute_diffs(result["output_path"], workers=1) == []
+
+
+def test_invalid_utf8_is_decoded_lossily(encoded_sources, out_dir):
+    result = merge_engine.merge_files(encoded_sources, out_dir)
+    blocks = _blocks(result["output_path"])
+    latin1 = next(p for p in encoded_sources if p.endswith("latin1.txt"))
+    truncated = next(p for p in encoded_sources if p.endswith("truncated.txt"))
+    assert blocks[latin1] == "caf nave\n".encode("utf-8")
+    assert blocks[truncated] == b"ok "
+    assert dict(merge_engine.iter_merged_file(result["output_path"]))[latin1] == "caf nave\n"
+    # 有损解码的块与按相同规则读取的原文件一致，不算差异
+    assert merge_engine.compute_diffs(result["output_path"], workers=1) == []
+
+
+def test_merged_file_converted_to_crlf(sources, out_dir):
+    merged = merge_engine.merge_files(sources, out_dir)["output_path"]
+    with open(merged, "rb") as f:
+        data = f.read()
+    with open(merged, "wb") as f:
+        f.write(data.replace(b"\n", b"\r\n"))
+
+    # 编辑器把整个合并文件改成 CRLF 后仍能找到每个块，块尾追加的 \r\n 被去掉
+    assert dict(merge_engine.iter_merged_file(merged)) == sources
+    assert merge_engine.compute_diffs(merged, workers=1) == []
+
+    _edit_block(merged, "line 2\r\n", "line 2 changed\r\n")
+    diffs = merge_engine.compute_diffs(merged, workers=1)
+    assert [merge_engine.read_new_content(item) for item in diffs] == ["line 1\nline 2 changed\n"]
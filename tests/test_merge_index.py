@@ -0,0 +1,43 @@
+import os
+
+import merge_engine
+import merge_index
+
+
+def test_index_locates_blocks(tmp_path):
+    paths = []
+    for name, text in [("a.txt", "alpha\n"), ("b.txt", "beta\nbeta\n")]:
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        paths.append(str(path))
+    out = tmp_path / "out"
+    out.mkdir()
+    result = merge_engine.merge_files(paths, str(out))
+    assert result["index_path"] == merge_index.index_path_for(result["output_path"])
+
+    index = merge_index.load_index(result["output_path"])
+    assert index["fresh"]
+    for path in paths:
+        entry = index["files"][path]
+        with open(path, "rb") as f:
+            assert merge_index.read_block(result["output_path"], entry) == f.read()
+        assert not merge_index.source_changed(path, entry)
+
+
+def test_index_detects_changes(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("alpha\n", encoding="utf-8")
+    out = tmp_path / "out"
+    out.mkdir()
+    merged = merge_engine.merge_files([str(path)], str(out))["output_path"]
+
+    with open(merged, "a", encoding="utf-8") as f:
+        f.write("trailing edit\n")
+    path.write_text("alpha changed\n", encoding="utf-8")
+    index = merge_index.load_index(merged)
+    assert not index["fresh"]
+    assert merge_index.source_changed(str(path), index["files"][str(path)])
+
+    os.remove(path)
+    assert merge_index.source_changed(str(path), index["files"][str(path)])
+    assert merge_index.load_index(str(tmp_path / "missing.txt")) is None
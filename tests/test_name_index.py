@@ -0,0 +1,62 @@
+import os
+import random
+
+from name_index import NameIndex
+
+
+def p(*parts):
+    return os.path.join(os.sep, *parts)
+
+
+# 目录树的先序显示顺序：目录在前、文件在后，同类按小写名称
+TREE = [
+    (p(), True),
+    (p("data"), True),
+    (p("data", "Data_a"), True),
+    (p("data", "Data_a", "data.txt"), False),
+    (p("data", "data_b"), True),
+    (p("data", "data.py"), False),
+    (p("data-old"), True),
+    (p("data-old", "x.data"), False),
+    (p("Readme_data.md"), False),
+    (p("zdata.txt"), False),
+]
+
+
+def build(order):
+    index = NameIndex()
+    for node in order:
+        path, is_dir = TREE[node]
+        index.add(node, os.path.basename(path) or f"根目录 ({os.sep})", path, is_dir)
+    return index
+
+
+def test_search_returns_hits_in_tree_order():
+    order = list(range(len(TREE)))
+    random.Random(1).shuffle(order)
+    index = build(order)
+    assert len(index) == len(TREE)
+    expected = [node for node, (path, _) in enumerate(TREE) if "data" in os.path.basename(path).lower()]
+    assert index.search("data") == expected
+    # 上级目录排在下级之前，"data" 的下级排在同级的 "data-old" 之前
+    assert index.search("dat") == expected
+
+
+def test_short_and_missing_queries():
+    index = build(range(len(TREE)))
+    assert index.search("") == []
+    assert index.search("zz") == []
+    assert index.search("qqq") == []
+    assert index.search("_") == [2, 4, 8]
+    assert index.search("md") == [8]
+    assert index.search("根目录") == [0]
+
+
+def test_query_must_match_contiguously():
+    index = NameIndex()
+    index.add("a", "abcxbcd", p("abcxbcd"), False)
+    index.add("b", "abcd", p("abcd"), False)
+    # 两个名称都包含 abc 与 bcd 两个三字母组，只有 b 真正包含 abcd
+    assert index.search("abcd") == ["b"]
+    index.clear()
+    assert len(index) == 0 and index.search("abcd") == []
@@ -0,0 +1,92 @@
+import os
+
+from selection_store import SelectionStore
+
+
+def p(*parts):
+    return os.path.join(os.sep, "root", *parts)
+
+
+def test_recursive_selection_inherits_to_all_descendants():
+    store = SelectionStore()
+    store.set(p("proj"), True, recursive=True)
+    assert store.state(p("proj", "a.py"), is_dir=False) == (True, False)
+    assert store.state(p("proj", "sub"), is_dir=True) == (True, True)
+    assert store.state(p("proj", "sub", "deep", "b.py"), is_dir=False) == (True, False)
+    assert store.state(p("other.py"), is_dir=False) == (False, False)
+
+
+def test_flat_selection_only_covers_direct_files():
+    store = SelectionStore()
+    store.set(p("proj"), True, recursive=False)
+    assert store.state(p("proj", "a.py"), is_dir=False)[0]
+    assert not store.state(p("proj", "sub"), is_dir=True)[0]
+    assert not store.state(p("proj", "sub", "b.py"), is_dir=False)[0]
+
+
+def test_child_rules_override_inherited_state():
+    store = SelectionStore()
+    store.set(p("proj"), True, recursive=True)
+    store.set(p("proj", "vendor"), False)
+    store.set(p("proj", "vendor", "keep.py"), True, is_dir=False)
+
+    assert not store.state(p("proj", "vendor", "x.py"), is_dir=False)[0]
+    assert not store.state(p("proj", "vendor", "lib"), is_dir=True)[0]
+    assert store.state(p("proj", "vendor", "keep.py"), is_dir=False)[0]
+    assert store.state(p("proj", "src", "x.py"), is_dir=False)[0]
+
+
+def test_redundant_rules_are_not_stored():
+    store = SelectionStore()
+    store.set(p("proj"), True, recursive=True)
+    store.set(p("proj", "sub"), True, recursive=True)
+    store.set(p("proj", "a.py"), True, is_dir=False)
+    assert store.to_dict() == {p("proj"): {"selected": True, "recursive": True}}
+
+    store.set(p("proj", "sub"), False)
+    store.set(p("proj", "sub"), True, recursive=True)
+    assert list(store.to_dict()) == [p("proj")]
+
+
+def test_clear_below_and_round_trip():
+    store = SelectionStore()
+    store.set(p("proj"), True, recursive=True)
+    store.set(p("proj", "sub"), False)
+    restored = SelectionStore.from_dict(store.to_dict())
+    assert restored.to_dict() == store.to_dict()
+
+    restored.clear_below(p("proj"))
+    assert restored.state(p("proj", "sub", "x.py"), is_dir=False)[0]
+    assert restored.has_selection()
+
+
+def test_from_states_drops_inherited_entries():
+    states = {
+        p("proj"): {"selected": True, "recursive": True},
+        p("proj", "a.py"): {"selected": True, "recursive": None},
+        p("proj", "sub"): {"selected": True, "recursive": True},
+        p("lone.py"): {"selected": True, "recursive": None},
+        p("skip.py"): {"selected": False, "recursive": None},
+    }
+    rules = SelectionStore.from_states(states).to_dict()
+    assert set(rules) == {p("proj"), p("lone.py")}
+
+
+def test_relative_and_trailing_slash_paths(tmp_path, monkeypatch):
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+
+    store = SelectionStore.from_roots([], [(".", True)])
+    assert store.has_selection()
+    assert store.state(str(work / "a.py"), is_dir=False)[0]
+    assert store.state(os.path.join("sub", "b.py"), is_dir=False)[0]
+    assert not store.state(str(tmp_path / "other.py"), is_dir=False)[0]
+
+    store = SelectionStore.from_roots([], [("..", False)])
+    assert store.state(str(tmp_path / "x.py"), is_dir=False)[0]
+    assert not store.state(str(work / "x.py"), is_dir=False)[0]
+
+    store = SelectionStore.from_roots([], [("sub" + os.sep, True)])
+    assert store.get_rule(str(work / "sub")) == {"selected": True, "recursive": True}
+    assert store.state(os.path.join("sub", "deep", "c.py"), is_dir=False)[0]
@@ -0,0 +1,63 @@
+import json
+import math
+import os
+
+import pytest
+
+import merge_engine
+import shard_merge
+
+
+def make_files(tmp_path, sizes):
+    paths = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f"f{i:02d}.txt"
+        path.write_bytes(b"x" * size)
+        paths.append(str(path))
+    return paths
+
+
+def block_bytes(path):
+    return os.path.getsize(path) + shard_merge._block_overhead(path)
+
+
+def test_plan_respects_byte_budget(tmp_path):
+    paths = make_files(tmp_path, [100] * 10)
+    limit = block_bytes(paths[0]) * 3
+    shards = shard_merge.plan_shards(reversed(paths), max_bytes=limit)
+    assert [len(shard) for shard in shards] == [3, 3, 3, 1]
+    # 按路径顺序装入
+    assert [path for shard in shards for path in shard] == paths
+
+
+def test_plan_token_budget_and_oversized_file(tmp_path):
+    paths = make_files(tmp_path, [40, 4000, 40, 40])
+    limit = math.ceil(block_bytes(paths[0]) / 4) * 2
+    shards = shard_merge.plan_shards(paths, max_tokens=limit, bytes_per_token=4)
+    # 超过上限的文件独占一个分片，不被拆开
+    assert shards == [[paths[0]], [paths[1]], paths[2:]]
+
+
+def test_plan_requires_a_limit(tmp_path):
+    with pytest.raises(ValueError):
+        shard_merge.plan_shards(make_files(tmp_path, [1]))
+
+
+def test_merge_sharded_writes_manifest(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    paths = make_files(src, [300] * 5)
+    out = tmp_path / "out"
+    out.mkdir()
+    result = shard_merge.merge_sharded(paths, str(out), max_bytes=block_bytes(paths[0]) * 2, workers=2)
+
+    assert result["success_count"] == 5 and result["fail_count"] == 0
+    with open(result["manifest_path"], "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert [shard["file"] for shard in manifest["shards"]] == result["shards"]
+    assert [len(shard["files"]) for shard in manifest["shards"]] == [2, 2, 1]
+    merged = {}
+    for shard in manifest["shards"]:
+        assert not shard["oversized"]
+        merged.update(merge_engine.iter_merged_file(str(out / shard["file"])))
+    assert sorted(merged) == paths
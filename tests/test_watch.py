@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+import merge_engine
+import watch
+
+MODES = [pytest.param(True, id="inotify", marks=pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify 只在 Linux 上可用")), pytest.param(False, id="poll")]
+
+
+@pytest.fixture
+def watcher(tmp_path, request):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.py").write_text("a = 1\n", encoding="utf-8")
+    (src / "b.py").write_text("b = 1\n", encoding="utf-8")
+    out = tmp_path / "out"
+    out.mkdir()
+    results = []
+    stop_event = threading.Event()
+
+    def scan(scanned_dirs):
+        return merge_engine.collect_files([], [(str(src), True)], None, scanned_dirs=scanned_dirs)
+
+    thread = threading.Thread(target=watch.watch, kwargs=dict(
+        scan=scan, output_directory=str(out), cache_path=str(tmp_path / "cache.json"),
+        on_refresh=results.append, stop_event=stop_event, debounce=0.05, poll_interval=0.05,
+        use_inotify=request.param), daemon=True)
+    thread.start()
+    yield {"src": src, "output": str(out / watch.WATCH_OUTPUT), "results": results}
+    stop_event.set()
+    thread.join(5)
+
+
+def wait_for(results, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(results) >= count, "监视模式没有更新输出"
+    return results[count - 1]
+
+
+def bundle(output):
+    return {os.path.basename(path): text for path, text in merge_engine.iter_merged_file(output)}
+
+
+@pytest.mark.parametrize("watcher", MODES, indirect=True)
+def test_content_change_refreshes_bundle(watcher):
+    wait_for(watcher["results"], 1)
+    with open(watcher["src"] / "a.py", "a", encoding="utf-8") as f:
+        f.write("a = 2\n")
+    result = wait_for(watcher["results"], 2)
+    assert result["reused_count"] == 1
+    assert bundle(watcher["output"]) == {"a.py": "a = 1\na = 2\n", "b.py": "b = 1\n"}
+
+
+@pytest.mark.parametrize("watcher", MODES, indirect=True)
+def test_atomic_rename_save_refreshes_bundle(watcher):
+    wait_for(watcher["results"], 1)
+    # 编辑器的原子保存与 batch_apply 一样：写临时文件后 os.replace 到原路径
+    tmp = watcher["src"] / ".a.py.tmp"
+    tmp.write_text("a = 'renamed'\n", encoding="utf-8")
+    os.replace(tmp, watcher["src"] / "a.py")
+    result = wait_for(watcher["results"], 2)
+    assert result["reused_count"] == 1
+    assert bundle(watcher["output"]) == {"a.py": "a = 'renamed'\n", "b.py": "b = 1\n"}
+
+
+@pytest.mark.parametrize("watcher", MODES, indirect=True)
+def test_new_file_is_added(watcher):
+    wait_for(watcher["results"], 1)
+    (watcher["src"] / "c.py").write_text("c = 1\n", encoding="utf-8")
+    wait_for(watcher["results"], 2)
+    assert bundle(watcher["output"])["c.py"] == "c = 1\n"
+
+
+class _FakeSource:
+    """按测试的安排产出事件"""
+
+    def __init__(self):
+        self.events = []
+        self.cond = threading.Condition()
+
+    def push(self, changed, structure):
+        with self.cond:
+            self.events.append((set(changed), set(structure)))
+            self.cond.notify_all()
+
+    def update(self, dirs, file_paths):
+        pass
+
+    def wait(self, timeout):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.events, timeout)
+
+    def read(self):
+        with self.cond:
+            return self.events.pop(0) if self.events else (set(), set())
+
+    def close(self):
+        pass
+
+
+def test_queue_overflow_forces_refresh(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.py").write_text("a = 1\n", encoding="utf-8")
+    source = _FakeSource()
+    monkeypatch.setattr(watch, "_open_source", lambda use_inotify, poll_interval: source)
+    results = []
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch.watch, kwargs=dict(
+        scan=lambda dirs: merge_engine.collect_files([], [(str(src), True)], None, scanned_dirs=dirs),
+        output_directory=str(tmp_path), cache_path=str(tmp_path / "cache.json"),
+        on_refresh=results.append, stop_event=stop_event, debounce=0.01), daemon=True)
+    thread.start()
+    try:
+        wait_for(results, 1)
+        # 内容变化的事件随溢出丢失，只剩一个溢出标记
+        (src / "a.py").write_text("a = 22\n", encoding="utf-8")
+        source.push((), {""})
+        wait_for(results, 2)
+        assert bundle(str(tmp_path / watch.WATCH_OUTPUT)) == {"a.py": "a = 22\n"}
+    finally:
+        stop_event.set()
+        thread.join(5)
+
+
+@pytest.mark.parametrize("watcher", MODES[:1], indirect=True)
+def test_replaced_directory_is_reread(watcher):
+    src = watcher["src"]
+    wait_for(watcher["results"], 1)
+    (src / "pkg").mkdir()
+    (src / "pkg" / "m.py").write_text("m = 1\n", encoding="utf-8")
+    wait_for(watcher["results"], 2)
+    assert bundle(watcher["output"])["m.py"] == "m = 1\n"
+
+    # 同名目录整体替换：文件路径不变，内容不同
+    staged = src.parent / "pkg.new"
+    staged.mkdir()
+    (staged / "m.py").write_text("m = 2\n", encoding="utf-8")
+    os.rename(src / "pkg", src.parent / "pkg.old")
+    os.rename(staged, src / "pkg")
+    deadline = time.monotonic() + 5
+    while bundle(watcher["output"])["m.py"] != "m = 2\n" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert bundle(watcher["output"])["m.py"] == "m = 2\n"
@@ -0,0 +1,267 @@
+"""
+监视模式
+
+监视勾选范围内的文件，变化停止一段时间 (防抖) 后借助指纹缓存增量更新一个固定文件名的
+滚动输出 merged_files_watch.txt：只重新读取变化过的文件，其余文件块直接从上一次的输出中
+内核态拷贝。只有文件内容被修改时不重新扫描目录；有新增、删除或重命名时才重新扫描
+(配合目录索引，未变化的目录只需一次 stat)。
+
+监视模式使用单独的指纹缓存 merge_cache.watch.json，与普通合并互不覆盖。
+
+Linux 上通过 ctypes 调用 inotify，其他平台或 inotify 不可用时退回定时轮询文件状态。
+"""
+import os
+import time
+import errno
+import sys
+import select
+import struct
+import logging
+import threading
+
+import merge_engine
+
+WATCH_OUTPUT = "merged_files_watch.txt"
+# 监视模式自己的指纹缓存；与普通合并共用时双方每次都覆盖对方的记录，复用的文件块来自另一份输出
+WATCH_CACHE_FILE = "merge_cache.watch.json"
+
+# inotify 常量 (见 <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_CONTENT_EVENTS = IN_MODIFY | IN_CLOSE_WRITE
+_STRUCTURE_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+# 连续不断的变化最多推迟这么久就强制更新一次
+MAX_DELAY = 5.0
+
+
+class _InotifySource:
+    """基于 inotify 的变化来源，每个扫描过的目录一个监视"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._ctypes = ctypes
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.watches = {}  # {wd: dir}
+        self.watched = set()
+
+    def update(self, dirs, file_paths):
+        for d in dirs - self.watched:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(d),
+                                              _CONTENT_EVENTS | _STRUCTURE_EVENTS | IN_ONLYDIR)
+            if wd < 0:
+                err = self._ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logging.warning("inotify 监视数量达到上限 (fs.inotify.max_user_watches)，部分目录的变化将无法察觉")
+                    return
+                logging.warning(f"无法监视目录 {d}: {os.strerror(err)}")
+                continue
+            self.watches[wd] = d
+            self.watched.add(d)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+    def read(self):
+        """
+        读出所有待处理事件，返回 (内容变化的路径集合, 增删改名的路径集合)
+
+        移入或新建的目录同时计入内容变化，表示其下的文件都需要重新读取。
+        """
+        changed = set()
+        structure = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, pos)
+                pos += _EVENT_HEADER.size
+                name = data[pos:pos + length].rstrip(b"\0")
+                pos += length
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出，丢失的变化只能通过重新扫描发现
+                    structure.add("")
+                    continue
+                directory = self.watches.get(wd)
+                if mask & IN_IGNORED:
+                    # 目录被删除或移走，内核已自动移除监视
+                    self.watches.pop(wd, None)
+                    self.watched.discard(directory)
+                    continue
+                if directory is None:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name)) if name else directory
+                if mask & _STRUCTURE_EVENTS:
+                    structure.add(path)
+                    if mask & IN_ISDIR and mask & (IN_MOVED_TO | IN_CREATE):
+                        changed.add(path)
+                elif mask & _CONTENT_EVENTS:
+                    changed.add(path)
+        return changed, structure
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollSource:
+    """定时轮询：比较文件的大小和 mtime_ns，以及目录的 mtime_ns"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.files = {}
+        self.dirs = {}
+
+    @staticmethod
+    def _snapshot(paths):
+        result = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result[path] = (st.st_size, st.st_mtime_ns)
+        return result
+
+    def update(self, dirs, file_paths):
+        self.files = self._snapshot(file_paths)
+        self.dirs = self._snapshot(dirs)
+
+    def wait(self, timeout):
+        time.sleep(min(self.interval, timeout) if timeout is not None else self.interval)
+        return True
+
+    def read(self):
+        files = self._snapshot(self.files)
+        dirs = self._snapshot(self.dirs)
+        changed = {path for path in self.files if files.get(path) != self.files[path]}
+        structure = {path for path in self.dirs if dirs.get(path) != self.dirs[path]}
+        self.files = files
+        self.dirs = dirs
+        return changed, structure
+
+    def close(self):
+        pass
+
+
+def _open_source(use_inotify, poll_interval):
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return _InotifySource()
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify 不可用，改为轮询: {e}")
+    return _PollSource(poll_interval)
+
+
+def cache_path_for(config_path=merge_engine.CONFIG_FILE):
+    """监视模式的指纹缓存与 config.json 放在同一目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), WATCH_CACHE_FILE)
+
+
+def watch(scan, output_directory, cache_path, on_refresh=None, stop_event=None, debounce=0.5,
+          poll_interval=2.0, use_inotify=True, output_name=WATCH_OUTPUT, **merge_options):
+    """
+    持续监视并增量更新滚动输出，直到 stop_event 被设置
+
+    scan(scanned_dirs) 返回需要合并的文件集合，并把扫描过的目录加入 scanned_dirs
+    (即 merge_engine.collect_files 的 scanned_dirs 参数)。每次更新后调用 on_refresh(result)，
+    result 与 merge_engine.merge_files 的返回值相同。merge_options 原样传给 merge_files。
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    output_path = os.path.abspath(os.path.join(output_directory, output_name))
+
+    def relevant(paths):
+        # 自身输出、临时文件和索引的变化不触发更新；目录溢出事件的路径为空串，保留
+        result = set()
+        for path in paths:
+            path = os.path.abspath(path) if path else path
+            if not path.startswith(output_path):
+                result.add(path)
+        return result
+
+    def refresh(file_paths, changed_paths=None):
+        # changed_paths 为 None 时逐个 stat 比较指纹，否则只重新读取其中的文件
+        result = merge_engine.merge_files(file_paths, output_directory, cache_path=cache_path,
+                                          output_name=output_name, changed_paths=changed_paths, **merge_options)
+        if on_refresh:
+            on_refresh(result)
+
+    dirs = set()
+    file_paths = scan(dirs)
+    watched_files = {os.path.abspath(path) for path in file_paths}
+    refresh(file_paths)
+
+    source = _open_source(use_inotify, poll_interval)
+    try:
+        source.update(dirs, file_paths)
+        while not stop_event.is_set():
+            if not source.wait(0.5):
+                continue
+            changed, structure = source.read()
+            # 防抖：变化停止 debounce 秒后再处理，持续变化时最多推迟 MAX_DELAY 秒
+            first = time.monotonic()
+            while not stop_event.is_set() and time.monotonic() - first < MAX_DELAY:
+                if not source.wait(debounce):
+                    break
+                more, more_structure = source.read()
+                if not more and not more_structure:
+                    break
+                changed |= more
+                structure |= more_structure
+
+            changed = relevant(changed)
+            structure = relevant(structure)
+            # 原子保存 (写临时文件后改名覆盖) 只产生 IN_MOVED_TO，被覆盖的文件内容同样变了
+            changed |= structure & watched_files
+            # 事件队列溢出时丢失的内容变化无从得知，必须更新
+            overflow = "" in structure
+            if structure:
+                # 有增删改名时重新扫描，文件集合与内容都没变就不更新输出
+                new_dirs = set()
+                new_paths = scan(new_dirs)
+                source.update(new_dirs, new_paths)
+                new_watched = {os.path.abspath(path) for path in new_paths}
+                # 新出现的路径可能带有早先留下的指纹，也要重新读取；
+                # 整个目录被移入 (可能替换了同名目录) 时其下的文件都要重新读取
+                moved = tuple(path + os.sep for path in changed - new_watched if path)
+                known = (changed & new_watched) | (new_watched - watched_files)
+                if moved:
+                    known |= {path for path in new_watched if path.startswith(moved)}
+                if new_paths == file_paths and not known and not overflow:
+                    continue
+                file_paths = new_paths
+                watched_files = new_watched
+            elif not (changed & watched_files):
+                continue
+            else:
+                known = changed & watched_files
+
+            logging.debug(f"检测到 {len(changed)} 处变化，更新 {output_path}")
+            refresh(file_paths, None if overflow else known)
+    finally:
+        source.close()